@@ -11,12 +11,17 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-import WebSocket.routing  # Import your WebSocket routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SmartBin.settings')
 
+# Set up Django before importing anything that touches models, otherwise
+# running daphne directly fails with AppRegistryNotReady
+django_asgi_app = get_asgi_application()
+
+import WebSocket.routing  # Import your WebSocket routing
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),  # Handle HTTP requests
+    "http": django_asgi_app,  # Handle HTTP requests
     "websocket": AuthMiddlewareStack(
         URLRouter(WebSocket.routing.websocket_urlpatterns)  # Handle WebSockets
     ),
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,11 +78,99 @@ ASGI_APPLICATION = 'SmartBin.asgi.application'
 
 # Channels
 # https://channels.readthedocs.io/en/stable/
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# The in-memory layer only reaches sockets held by the same process. To run
+# several server processes ("python manage.py serve --workers N"), point
+# REDIS_URL at a Redis server, e.g. redis://localhost:6379/0: broadcasts then
+# go through Redis pub/sub to every process, and the fleet state snapshot is
+# shared through the "fleet" cache.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+            },
+        },
+    }
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+        "fleet": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# Set by "manage.py serve" in each process it starts: how many there are and
+# which one this is. Only worker 0 runs the rollup scheduler.
+SERVER_WORKERS = int(os.environ.get("SMARTBIN_WORKERS", 1))
+SERVER_WORKER = int(os.environ.get("SMARTBIN_WORKER", 0))
+
+# Ingest: uploads are buffered and written by a background thread (history
+# rows appended, each bin's latest state upserted) once INGEST_FLUSH_SIZE
+# rows are waiting or every INGEST_FLUSH_INTERVAL seconds. At most
+# INGEST_MAX_BUFFER rows are held if the database stalls.
+INGEST_FLUSH_SIZE = 500
+INGEST_FLUSH_INTERVAL = 1.0
+INGEST_MAX_BUFFER = 100000
+
+# History rollups and retention, run by "python manage.py rollup_history" or
+# every ROLLUP_INTERVAL seconds inside the server (None: only the command).
+# Raw rows are kept RETENTION_RAW_DAYS once rolled up, minute and hour
+# rollups RETENTION_MINUTE_DAYS / RETENTION_HOUR_DAYS (None: forever).
+# Deletes run RETENTION_DELETE_CHUNK rows per transaction.
+ROLLUP_INTERVAL = None
+ROLLUP_BATCH_SIZE = 10000
+ROLLUP_MAX_GAP = 30
+RETENTION_RAW_DAYS = 7
+RETENTION_MINUTE_DAYS = 90
+RETENTION_HOUR_DAYS = None
+RETENTION_DELETE_CHUNK = 5000
+RETENTION_DELETE_PAUSE = 0.05
+
+# Where ingested history goes: "sqlite" for SensorData rows, or "binary" for
+# the append-only log in HISTORY_LOG_DIR (WebSocket/history_log.py), one
+# file per HISTORY_LOG_SEGMENT_RECORDS readings. Rollups and the history API
+# only read the SQLite history: with "binary" the API answers 501 and
+# rollups don't run. "manage.py convert_history" copies between the two. The
+# log must only be written by one server process.
+HISTORY_BACKEND = "sqlite"
+HISTORY_LOG_DIR = BASE_DIR / 'history'
+HISTORY_LOG_SEGMENT_RECORDS = 1000000
+
+# Bins heard by several gateways are merged into one record each
+# (WebSocket/merge.py). With this off (SMARTBIN_MERGE_GATEWAYS=0) each
+# gateway's bins are stored and shown as it sent them. The merge state is
+# kept per process; set MERGE_CACHE to a CACHES alias to share it between
+# server processes.
+MERGE_GATEWAYS = os.environ.get("SMARTBIN_MERGE_GATEWAYS", "1") != "0"
+MERGE_CACHE = "fleet" if REDIS_URL else None
+
+# The merged fleet state sent to dashboards as they connect (and served at
+# /websocket/state) is kept per process. Set FLEET_STATE_CACHE to a CACHES
+# alias to share it between server processes instead.
+FLEET_STATE_CACHE = "fleet" if REDIS_URL else None
+
+# The last sequence number and state of every gateway's delta uploads
+# (WebSocket/sync.py) are kept per process. Set GATEWAY_STATE_CACHE to a
+# CACHES alias to share them, so a delta can reach any server process.
+GATEWAY_STATE_CACHE = "fleet" if REDIS_URL else None
+
+# Responses of the history API (/websocket/history) are cached in the
+# HISTORY_CACHE alias for up to HISTORY_CACHE_TIMEOUT seconds. Ranges that
+# reach into the last HISTORY_CACHE_SETTLE seconds are invalidated whenever
+# the ingest writer commits, older ones only by retention.
+HISTORY_CACHE = "fleet" if REDIS_URL else "default"
+HISTORY_CACHE_TIMEOUT = 300
+HISTORY_CACHE_SETTLE = 60
 
 
 # Database
@@ -90,7 +179,11 @@ CHANNEL_LAYERS = {
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SMARTBIN_DB', BASE_DIR / 'db.sqlite3'),
+        # WAL lets the ingest writer commit while requests read
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+        },
     }
 }
 
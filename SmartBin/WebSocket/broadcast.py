@@ -0,0 +1,91 @@
+import json
+import re
+import threading
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .metrics import CHANNEL_SEND_SECONDS, CHANNEL_SENDS
+
+DASHBOARD_GROUP = "dashboard"
+
+dashboard_sends = CHANNEL_SENDS.labels("dashboard")
+dashboard_send_seconds = CHANNEL_SEND_SECONDS.labels("dashboard")
+bin_sends = CHANNEL_SENDS.labels("bin")
+bin_send_seconds = CHANNEL_SEND_SECONDS.labels("bin")
+
+# Channels group names are limited to these characters
+GROUP_NAME = re.compile(r"^[A-Za-z0-9_.-]{1,90}$")
+
+def bin_group(bin_id):
+    """Group of the sockets following one bin, None if the id can't name a group"""
+    bin_id = str(bin_id)
+    return f"bin_{bin_id}" if GROUP_NAME.match(bin_id) else None
+
+def encode(data):
+    return json.dumps(data, separators=(",", ":"))
+
+def dashboard_event(data, source="", partial=False):
+    """
+    Channel-layer message for a dashboard update. The frame is encoded here,
+    once, so every consumer in the group sends the same string instead of
+    running json.dumps per socket (and the layer copies a string, not the
+    whole state dict). ``source`` lets clients that fall behind keep only
+    the newest frame from each gateway. A ``partial`` frame only holds the
+    bins that changed, so a client merges queued ones instead of keeping
+    just the newest.
+    """
+    return {
+        "type": "dashboard_update",
+        "source": source,
+        "text": encode(data),
+        "partial": partial,
+    }
+
+def bin_event(bin_id, values):
+    """Update for the sockets following one bin: {bin_id: values}, coalesced per bin"""
+    return dashboard_event({bin_id: values}, f"bin:{bin_id}")
+
+class ChangedBins:
+    """
+    Remembers what was last sent to each bin's group, so a bin whose values
+    are the same as in the previous upload isn't sent again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}
+
+    def changed(self, state):
+        with self.lock:
+            sent = self.sent
+            changed = [(bin_id, values) for bin_id, values in state.items() if sent.get(bin_id) != values]
+            for bin_id, values in changed:
+                sent[bin_id] = values
+        return changed
+
+changed_bins = ChangedBins()
+
+async def broadcast_async(updates, channel_layer=None):
+    """
+    Send {source: changed bins} to every dashboard client, and each bin that
+    changed to the clients following it
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    clock = time.perf_counter
+    for source, data in updates.items():
+        started = clock()
+        await channel_layer.group_send(DASHBOARD_GROUP, dashboard_event(data, source, partial=True))
+        dashboard_send_seconds.observe(clock() - started)
+        dashboard_sends.inc()
+        for bin_id, values in changed_bins.changed(data):
+            group = bin_group(bin_id)
+            if group is not None:
+                started = clock()
+                await channel_layer.group_send(group, bin_event(bin_id, values))
+                bin_send_seconds.observe(clock() - started)
+                bin_sends.inc()
+
+def broadcast(updates):
+    """Broadcast update to WebSocket clients"""
+    if updates:
+        async_to_sync(broadcast_async)(updates)
@@ -1,23 +1,253 @@
+import asyncio
+import time
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
+import zlib
+from urllib.parse import parse_qs
+from .broadcast import DASHBOARD_GROUP, bin_event, bin_group, broadcast_async, encode
+from .fleet_state import fleet_state
+from .ingest import decode_upload, handle_upload
+from .metrics import CLIENTS, FRAMES_COALESCED, FRAMES_DROPPED, FRAMES_RESYNCED, upload_metrics
+
+ws_upload_seconds, ws_upload_counts = upload_metrics("websocket")
 
 class DashboardConsumer(AsyncWebsocketConsumer):
+    """
+    Live updates for the dashboard pages.
+
+    Updates arrive already encoded (see broadcast.dashboard_event) and are
+    queued per client, one frame per source. A separate task sends the
+    queue, so a slow socket never holds up the channel layer's inbox; it
+    simply skips to the latest state. A newer frame from a source replaces
+    the queued one, except partial frames (only the bins that changed),
+    which are merged into it bin by bin, the newest values winning. At most
+    ``max_pending`` sources are queued, the oldest is dropped beyond that.
+    A new client is first sent the whole fleet's current state, and so is a
+    client that lost a frame to overflow or sends {"resync": true}, in place
+    of everything it had queued. Queued bins the fleet state doesn't have
+    are sent after it rather than lost.
+    """
+    max_pending = 64
+    clients = CLIENTS.labels("dashboard")
+
+    def start_queue(self):
+        # source -> encoded frame, or {bin_id: values} merged from several
+        # partial ones; oldest first
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+        self.coalesced = 0
+        self.dropped = 0
+        # Set when a lost frame means the queue no longer adds up to the current state
+        self.stale = False
+
     async def connect(self):
+        self.start_queue()
+        self.clients.inc()
         # Join the dashboard group
         await self.channel_layer.group_add(
-            "dashboard",
+            DASHBOARD_GROUP,
             self.channel_name
         )
         await self.accept()
+        # Updates queue behind connect(), so they all come after the snapshot
+        await self.send_current()
+        self.sender = asyncio.ensure_future(self._send_pending())
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "")
+        except json.JSONDecodeError:
+            return
+        if isinstance(message, dict):
+            await self.handle_request(message)
+
+    async def handle_request(self, message):
+        if message.get("resync") is True:
+            self.stale = True
+            self.wakeup.set()
+
+    async def send_current(self):
+        """Send the whole fleet's current state"""
+        _, snapshot = await database_sync_to_async(fleet_state.snapshot)()
+        if snapshot != "{}":
+            await self.send(text_data=snapshot)
 
     async def disconnect(self, close_code):
+        self.clients.dec()
         # Leave the dashboard group
         await self.channel_layer.group_discard(
-            "dashboard",
+            DASHBOARD_GROUP,
             self.channel_name
         )
+        sender = getattr(self, "sender", None)
+        if sender is not None:
+            sender.cancel()
 
     # Receive message from the dashboard group
     async def dashboard_update(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps(event["data"]))
\ No newline at end of file
+        text = event.get("text")
+        if text is None:
+            text = json.dumps(event["data"])
+        source = event.get("source", "")
+        pending = self.pending
+        queued = pending.pop(source, None)
+        if queued is not None:
+            self.coalesced += 1
+            FRAMES_COALESCED.inc()
+            if event.get("partial"):
+                # Only decoded for clients that fell behind, the rest send the text as is
+                if isinstance(queued, str):
+                    queued = json.loads(queued)
+                queued.update(json.loads(text))
+                text = queued
+        pending[source] = text
+        if len(pending) > self.max_pending:
+            del pending[next(iter(pending))]
+            self.dropped += 1
+            FRAMES_DROPPED.inc()
+            self.stale = True
+        self.wakeup.set()
+
+    async def _send_pending(self):
+        """Send queued frames, oldest source first"""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            pending = self.pending
+            while pending or self.stale:
+                if self.stale:
+                    self.stale = False
+                    await self.resync()
+                    continue
+                frame = pending.pop(next(iter(pending)))
+                if not isinstance(frame, str):
+                    frame = encode(frame)
+                # Send message to WebSocket
+                await self.send(text_data=frame)
+
+    async def resync(self):
+        """Send the current state in place of everything queued"""
+        queued = {}
+        for frame in self.pending.values():
+            queued.update(json.loads(frame) if isinstance(frame, str) else frame)
+        self.pending.clear()
+        FRAMES_RESYNCED.inc()
+        await self.send_current()
+        if queued:
+            # Bins from a source the fleet state doesn't hold
+            known = await database_sync_to_async(fleet_state.bins)(list(queued))
+            missing = {bin_id: values for bin_id, values in queued.items() if bin_id not in known}
+            if missing:
+                await self.send_bins(missing)
+
+    async def send_bins(self, bins):
+        await self.send(text_data=encode(bins))
+
+class BinConsumer(DashboardConsumer):
+    """
+    Live updates for a chosen set of bins, for the bin_detail page. Bins are
+    picked in the URL (ws/bin/<id>/, or ws/bins/?bins=1,2,3) and changed
+    later by sending {"subscribe": [ids]} or {"unsubscribe": [ids]}, and
+    sent again with {"resync": true}. Each frame is {bin_id: values} for one bin, the current values first, then
+    only when they change.
+    """
+    max_bins = 256
+    clients = CLIENTS.labels("bin")
+
+    async def connect(self):
+        self.start_queue()
+        self.clients.inc()
+        self.bins = set()
+        await self.accept()
+        kwargs = self.scope.get("url_route", {}).get("kwargs", {})
+        bin_ids = [kwargs["bin_id"]] if "bin_id" in kwargs else []
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        for value in query.get("bins", []):
+            bin_ids.extend(value.split(","))
+        await self.subscribe(bin_ids)
+        self.sender = asyncio.ensure_future(self._send_pending())
+
+    async def disconnect(self, close_code):
+        self.clients.dec()
+        for bin_id in self.bins:
+            await self.channel_layer.group_discard(bin_group(bin_id), self.channel_name)
+        sender = getattr(self, "sender", None)
+        if sender is not None:
+            sender.cancel()
+
+    async def handle_request(self, message):
+        await super().handle_request(message)
+        if isinstance(message.get("unsubscribe"), list):
+            await self.unsubscribe(message["unsubscribe"])
+        if isinstance(message.get("subscribe"), list):
+            await self.subscribe(message["subscribe"])
+
+    async def subscribe(self, bin_ids):
+        added = []
+        for bin_id in map(str, bin_ids):
+            if bin_id in self.bins or bin_group(bin_id) is None or len(self.bins) >= self.max_bins:
+                continue
+            await self.channel_layer.group_add(bin_group(bin_id), self.channel_name)
+            self.bins.add(bin_id)
+            added.append(bin_id)
+        if added:
+            # Queued like updates, so a newer update to the same bin replaces it
+            current = await database_sync_to_async(fleet_state.bins)(added)
+            for bin_id, values in current.items():
+                await self.dashboard_update(bin_event(bin_id, values))
+
+    async def send_current(self):
+        """Send the current values of every bin followed"""
+        current = await database_sync_to_async(fleet_state.bins)(list(self.bins))
+        for bin_id, values in current.items():
+            await self.send(text_data=bin_event(bin_id, values)["text"])
+
+    async def send_bins(self, bins):
+        for bin_id, values in bins.items():
+            await self.send(text_data=bin_event(bin_id, values)["text"])
+
+    async def unsubscribe(self, bin_ids):
+        for bin_id in map(str, bin_ids):
+            if bin_id in self.bins:
+                self.bins.discard(bin_id)
+                await self.channel_layer.group_discard(bin_group(bin_id), self.channel_name)
+                self.pending.pop(f"bin:{bin_id}", None)
+
+class GatewayConsumer(AsyncWebsocketConsumer):
+    """
+    Persistent ingest channel for gateways. Each frame carries the same
+    upload as a POST to receive_data (text JSON, or gzipped JSON in a binary
+    frame) and is answered, in order, with the same reply plus its "status".
+    """
+    clients = CLIENTS.labels("gateway")
+
+    async def connect(self):
+        self.clients.inc()
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        self.clients.dec()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        started = time.perf_counter()
+        try:
+            if text_data is not None:
+                data = decode_upload(text_data)
+            else:
+                data = decode_upload(bytes_data, gzipped=True)
+            status, reply, updates = await database_sync_to_async(handle_upload)(data)
+        except json.JSONDecodeError:
+            status, reply, updates = 400, {"error": "Invalid JSON format"}, {}
+        except (ValueError, zlib.error) as e:
+            status, reply, updates = 400, {"error": str(e)}, {}
+        except Exception as e:
+            status, reply, updates = 500, {"error": str(e)}, {}
+
+        # Broadcast update to dashboard WebSocket clients
+        await broadcast_async(updates, self.channel_layer)
+        ws_upload_seconds.observe(time.perf_counter() - started)
+        ws_upload_counts[status].inc()
+
+        reply["status"] = status
+        await self.send(text_data=json.dumps(reply))
\ No newline at end of file
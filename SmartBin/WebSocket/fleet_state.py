@@ -0,0 +1,146 @@
+"""
+Latest merged state of the whole fleet, kept in memory so a dashboard that
+connects (or reloads) gets every bin at once instead of zeros until the next
+upload.
+"""
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from .models import DeviceState
+from .shared_cache import increment
+
+VERSION_KEY = "fleet_state:version"
+EPOCH_KEY = "fleet_state:epoch"
+SOURCE_KEY = "fleet_state:source:%s"
+# Sources are numbered as they first appear: SOURCE_COUNT_KEY is the highest
+# number taken, SOURCE_NAME_KEY names the source in each slot and
+# SOURCE_SLOT_KEY says that a source has one
+SOURCE_COUNT_KEY = "fleet_state:source_count"
+SOURCE_NAME_KEY = "fleet_state:source_name:%d"
+SOURCE_SLOT_KEY = "fleet_state:source_slot:%s"
+
+def stored_state():
+    """{bin_id: values} from DeviceState, in the shape gateways upload"""
+    return {
+        state.device_id: {
+            "status": state.status,
+            "last_seen": state.last_seen,
+            "coord": state.coord,
+            "next_nearest": state.next_nearest,
+            "next_nearest_direction": state.next_nearest_direction,
+        }
+        for state in DeviceState.objects.order_by("device_id")
+    }
+
+class FleetState:
+    """
+    The merged records of the bins each gateway owns (merge.py; gateway id,
+    or "" for snapshots that don't name one), put together into one
+    {bin_id: values} snapshot on top of what DeviceState held when the
+    process started. Gateways own disjoint sets of bins, and a bin that
+    changes hands is updated under both.
+
+    ``version`` goes up with every update and the snapshot is encoded once
+    per version. With ``cache_alias`` the per-source states and the version
+    live in that Django cache, so every server process serves the same
+    snapshot; otherwise they are local to this process. Processes only
+    change shared keys with atomic operations (add, incr, or a set of a key
+    no other process writes), so concurrent updates can't lose a source.
+    """
+
+    def __init__(self, cache_alias=None):
+        self.cache_alias = cache_alias
+        self.lock = threading.Lock()
+        self.stored = None  # loaded from DeviceState on first use
+        self.sources = {}
+        self.version = 0
+        # Versions restart with the process, the epoch keeps ETags apart
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.encoded = None  # (tag, merged, text)
+
+    def _load_stored(self):
+        if self.stored is None:
+            self.stored = stored_state()
+
+    def update(self, updates):
+        """Record {gateway: owned bins} after ingest merged an upload"""
+        if not updates:
+            return
+        if self.cache_alias:
+            self._update_shared(updates)
+            return
+        with self.lock:
+            for source, state in updates.items():
+                # Newest source last, so it wins the merge
+                self.sources.pop(source, None)
+                self.sources[source] = state
+            self.version += 1
+
+    def _update_shared(self, updates):
+        cache = caches[self.cache_alias]
+        cache.set_many({SOURCE_KEY % source: state for source, state in updates.items()}, timeout=None)
+        registered = cache.get_many([SOURCE_SLOT_KEY % source for source in updates])
+        for source in updates:
+            if SOURCE_SLOT_KEY % source not in registered:
+                self._register_source(cache, source)
+        cache.add(EPOCH_KEY, self.epoch, timeout=None)
+        increment(cache, VERSION_KEY)
+
+    def _register_source(self, cache, source):
+        # The slot number is this process's alone, so its name can be set
+        # before the source claims it: a crash in between leaves the source
+        # listed. Losing the claim to another process frees the slot, and
+        # readers skip a source listed twice until then.
+        slot = increment(cache, SOURCE_COUNT_KEY)
+        cache.set(SOURCE_NAME_KEY % slot, source, timeout=None)
+        if not cache.add(SOURCE_SLOT_KEY % source, slot, timeout=None):
+            cache.delete(SOURCE_NAME_KEY % slot)
+
+    def snapshot(self):
+        """
+        (tag, text): the encoded merged state and an opaque tag that changes
+        whenever it does. May query the database the first time.
+        """
+        tag, _, text = self._current()
+        return tag, text
+
+    def bins(self, bin_ids):
+        """{bin_id: values} for those of ``bin_ids`` the fleet has"""
+        _, merged, _ = self._current()
+        return {bin_id: merged[bin_id] for bin_id in bin_ids if bin_id in merged}
+
+    def _current(self):
+        with self.lock:
+            self._load_stored()
+            if self.cache_alias:
+                return self._current_shared()
+            tag = f"{self.epoch}-{self.version}"
+            if self.encoded is None or self.encoded[0] != tag:
+                self.encoded = (tag, *self._merge(self.sources.values()))
+            return self.encoded
+
+    def _current_shared(self):
+        cache = caches[self.cache_alias]
+        current = cache.get_many([VERSION_KEY, EPOCH_KEY])
+        tag = f"{current.get(EPOCH_KEY, self.epoch)}-{current.get(VERSION_KEY, 0)}"
+        if self.encoded is None or self.encoded[0] != tag:
+            slots = range(1, (cache.get(SOURCE_COUNT_KEY) or 0) + 1)
+            names = cache.get_many([SOURCE_NAME_KEY % slot for slot in slots])
+            # In slot order, each source once
+            sources = list(dict.fromkeys(names[SOURCE_NAME_KEY % slot] for slot in slots
+                                         if SOURCE_NAME_KEY % slot in names))
+            states = cache.get_many([SOURCE_KEY % source for source in sources])
+            self.encoded = (tag, *self._merge(states[SOURCE_KEY % source] for source in sources
+                                              if SOURCE_KEY % source in states))
+        return self.encoded
+
+    def _merge(self, states):
+        """(merged state, its JSON encoding)"""
+        merged = dict(self.stored)
+        for state in states:
+            merged.update(state)
+        return merged, json.dumps(merged, separators=(",", ":"))
+
+fleet_state = FleetState(getattr(settings, "FLEET_STATE_CACHE", None))
@@ -0,0 +1,279 @@
+"""
+Read side of the SensorData history: keyset-paginated and downsampled
+queries for one bin or the whole fleet, encoded to JSON and cached until the
+history changes.
+
+Pages are newest first. The cursor names the last reading returned
+(timestamp and id), so the next page is one index range scan from there
+however deep the client has paged, and rows arriving meanwhile don't shift
+it. Rows are read with values_list(), never as model instances.
+
+Downsampling with buckets of a minute or more reads the SensorRollup table
+(hour rollups once a bucket spans an hour) for every row rollup_history()
+has processed, and SensorData only for the rows past its mark. A rollup
+counts in the bucket where it starts, so the edges of the range are only as
+exact as the rollup resolution. Narrower buckets read SensorData throughout.
+
+Responses are cached under their parameters plus a generation number. The
+ingest writer bumps the "rows" generation after every commit, retention
+bumps the "retention" one. A range ending more than HISTORY_CACHE_SETTLE
+seconds ago (or a page past a cursor that old) won't get new rows, so only
+retention invalidates it.
+
+With HISTORY_BACKEND = "binary" the readings go to the history log instead
+of SensorData and every request raises HistoryUnavailable (501) rather than
+answering with an empty history.
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import RollupProgress, SensorData, SensorRollup
+
+FIELDS = ["id", "device_id", "timestamp", "status", "x", "y", "last_seen", "next_nearest", "next_nearest_direction"]
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+MAX_POINTS = 2000
+# Span downsampled when only "points" is given
+DEFAULT_SPAN = timedelta(hours=24)
+FULL_STATUS = "FULL"
+# (resolution, bucket length), coarsest first
+ROLLUP_RESOLUTIONS = [(SensorRollup.HOUR, timedelta(hours=1)), (SensorRollup.MINUTE, timedelta(minutes=1))]
+
+class HistoryUnavailable(Exception):
+    """The history isn't in SensorData, so this API can't answer"""
+
+ROWS_KEY = "history:rows"
+RETENTION_KEY = "history:retention"
+
+def parse_time(value):
+    """Aware datetime from an ISO 8601 query parameter, None if absent"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid time: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = text.split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def history_rows(device_id=None, device_ids=None, start=None, end=None):
+    """SensorData rows of one bin, some bins or all of them within [start, end)"""
+    if device_id is not None:
+        return SensorData.objects.for_device(device_id, start, end)
+    rows = SensorData.objects.all()
+    if device_ids is not None:
+        rows = rows.filter(device_id__in=device_ids)
+    if start is not None:
+        rows = rows.filter(timestamp__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lt=end)
+    return rows.order_by("-timestamp", "-id")
+
+def reading(row, with_device):
+    row_id, device_id, timestamp, status, x, y, last_seen, next_nearest, direction = row
+    values = {
+        "timestamp": timestamp.isoformat(),
+        "status": status,
+        "coord": [x, y] if x is not None and y is not None else None,
+        "last_seen": last_seen,
+        "next_nearest": next_nearest,
+        "next_nearest_direction": direction,
+    }
+    if with_device:
+        values = {"device_id": device_id, **values}
+    return values
+
+def page(device_id=None, device_ids=None, start=None, end=None, limit=DEFAULT_LIMIT, cursor=None):
+    """{"readings": up to ``limit`` readings, newest first, "next": cursor of the following page or None}"""
+    rows = history_rows(device_id, device_ids, start, end)
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        # The plain bound lets the database seek to the cursor, the OR alone would scan the index
+        rows = rows.filter(Q(timestamp__lte=timestamp), Q(timestamp__lt=timestamp) | Q(id__lt=row_id))
+    found = list(rows.values_list(*FIELDS)[:limit + 1])
+    more = len(found) > limit
+    found = found[:limit]
+    return {
+        "readings": [reading(row, device_id is None) for row in found],
+        "next": encode_cursor(found[-1][2], found[-1][0]) if more else None,
+    }
+
+def rollup_resolution(width):
+    """(resolution, length) of the coarsest rollup fitting in a bucket ``width`` long, None below a minute"""
+    for resolution, length in ROLLUP_RESOLUTIONS:
+        if width >= length:
+            return resolution, length
+    return None
+
+def rolled_up_id():
+    """Id of the last SensorData row folded into the rollups, 0 before the first run"""
+    progress = RollupProgress.objects.filter(name=RollupProgress.ROLLUP).values_list("last_id", flat=True).first()
+    return progress or 0
+
+def rollup_rows(device_id, device_ids, start, end, resolution, length):
+    """SensorRollup rows of one bin, some bins or all of them overlapping [start, end)"""
+    rollups = SensorRollup.objects.filter(resolution=resolution, bucket__gt=start - length, bucket__lt=end)
+    if device_id is not None:
+        rollups = rollups.filter(device_id=device_id)
+    elif device_ids is not None:
+        rollups = rollups.filter(device_id__in=device_ids)
+    return rollups.order_by()
+
+def downsample(device_id=None, device_ids=None, start=None, end=None, points=100):
+    """
+    [start, end) cut into ``points`` equal buckets, oldest first, empty ones
+    left out. For one bin each bucket has its last reading, the number of
+    readings and whether the bin was FULL in it. For the fleet it counts the
+    bins by the last status each reported in the bucket.
+    """
+    width = (end - start) / points
+    buckets = {}
+
+    def add(timestamp, device_id, samples, full, last):
+        index = max(0, min(int((timestamp - start) / width), points - 1))
+        bucket = buckets.get(index)
+        if bucket is None:
+            bucket = buckets[index] = {"samples": 0, "full": False, "last": {}}
+        bucket["samples"] += samples
+        bucket["full"] = bucket["full"] or full
+        # last is (timestamp, status, x, y, last_seen)
+        previous = bucket["last"].get(device_id)
+        if previous is None or last[0] >= previous[0]:
+            bucket["last"][device_id] = last
+
+    rows = history_rows(device_id, device_ids, start, end)
+    resolution = rollup_resolution(width)
+    if resolution is not None:
+        rolled_up = rolled_up_id()
+        # Only the rows rollup_history() hasn't reached yet, whatever their timestamp
+        rows = rows.filter(id__gt=rolled_up)
+        rollups = rollup_rows(device_id, device_ids, start, end, *resolution).values_list(
+            "device_id", "bucket", "samples", "full_events", "status_seconds_json",
+            "last_status", "last_x", "last_y", "last_seen", "last_timestamp")
+        for (rollup_device, bucket, samples, full_events, status_seconds_json,
+             status, x, y, last_seen, last_timestamp) in rollups.iterator(chunk_size=2000):
+            full = bool(full_events) or status == FULL_STATUS or FULL_STATUS in json.loads(status_seconds_json)
+            add(bucket, rollup_device, samples, full, (last_timestamp, status, x, y, last_seen))
+    for _, row_device, timestamp, status, x, y, last_seen, _, _ in rows.order_by("timestamp", "id").values_list(
+            *FIELDS).iterator(chunk_size=2000):
+        add(timestamp, row_device, 1, status == FULL_STATUS, (timestamp, status, x, y, last_seen))
+
+    results = []
+    for index in sorted(buckets):
+        bucket = buckets[index]
+        point = {"timestamp": (start + width * index).isoformat(), "samples": bucket["samples"]}
+        if device_id is not None:
+            timestamp, status, x, y, last_seen = bucket["last"][device_id]
+            point.update(full=bucket["full"], status=status,
+                         coord=[x, y] if x is not None and y is not None else None,
+                         last_seen=last_seen, reading_timestamp=timestamp.isoformat())
+        else:
+            statuses = {}
+            for _, status, _, _, _ in bucket["last"].values():
+                statuses[status] = statuses.get(status, 0) + 1
+            point.update(devices=len(bucket["last"]), statuses=statuses)
+        results.append(point)
+    return {"points": results, "bucket_seconds": width.total_seconds()}
+
+class HistoryCache:
+    """Encoded history responses in a Django cache, see the module docstring"""
+
+    def __init__(self, alias="default", timeout=300, settle=60):
+        self.alias = alias
+        self.timeout = timeout
+        self.settle = timedelta(seconds=settle)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _bump(self, key):
+        cache = self.cache
+        if cache.add(key, 1, timeout=None):
+            return
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    def rows_changed(self):
+        self._bump(ROWS_KEY)
+
+    def retention_changed(self):
+        self._bump(RETENTION_KEY)
+
+    def get_or_build(self, params, newest, build):
+        """
+        The cached JSON for ``params``, or build() encoded and stored.
+        ``newest`` bounds the timestamps the response can hold (None: any).
+        """
+        cache = self.cache
+        generations = cache.get_many([ROWS_KEY, RETENTION_KEY])
+        settled = newest is not None and newest <= timezone.now() - self.settle
+        key_parts = [params, generations.get(RETENTION_KEY, 0), None if settled else generations.get(ROWS_KEY, 0)]
+        key = "history:" + hashlib.sha1(json.dumps(key_parts, sort_keys=True, default=str).encode()).hexdigest()
+        text = cache.get(key)
+        if text is None:
+            text = json.dumps(build(), separators=(",", ":"))
+            cache.set(key, text, self.timeout)
+        return text
+
+history_cache = HistoryCache(
+    getattr(settings, "HISTORY_CACHE", "default"),
+    timeout=getattr(settings, "HISTORY_CACHE_TIMEOUT", 300),
+    settle=getattr(settings, "HISTORY_CACHE_SETTLE", 60),
+)
+
+def history(device_id=None, device_ids=None, start=None, end=None, limit=None, cursor=None, points=None):
+    """
+    The JSON text answering a history request: a page of readings, or with
+    ``points`` the downsampled range.
+    """
+    if getattr(settings, "HISTORY_BACKEND", "sqlite") != "sqlite":
+        raise HistoryUnavailable(
+            'The history API reads SensorData, which HISTORY_BACKEND = "binary" leaves empty. '
+            'Copy the log over with "manage.py convert_history --to sqlite" or switch the backend back.')
+    if start is not None and end is not None and start >= end:
+        raise ValueError("start must be before end")
+    params = {"bin": device_id, "bins": sorted(device_ids) if device_ids is not None else None,
+              "start": start, "end": end}
+    if points is not None:
+        if not 1 <= points <= MAX_POINTS:
+            raise ValueError(f"points must be between 1 and {MAX_POINTS}")
+        if end is None:
+            # Up to the next whole minute, so requests within it share a cache entry
+            end = timezone.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        start = start or end - DEFAULT_SPAN
+        params.update(start=start, end=end, points=points)
+        build = lambda: dict(params, **downsample(device_id, device_ids, start, end, points))
+    else:
+        limit = DEFAULT_LIMIT if limit is None else limit
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        params.update(limit=limit, cursor=cursor)
+        build = lambda: dict(params, **page(device_id, device_ids, start, end, limit, cursor))
+    newest = end
+    if cursor and points is None:
+        # Later pages only hold rows older than the cursor
+        before = decode_cursor(cursor)[0]
+        newest = min(end, before) if end is not None else before
+    return history_cache.get_or_build(params, newest, lambda: {
+        key: value.isoformat() if isinstance(value, datetime) else value for key, value in build().items()
+    })
@@ -0,0 +1,375 @@
+"""
+Append-only binary history log, an alternative to SensorData rows.
+
+Every reading is one fixed-width 40-byte record:
+
+    timestamp (int64, ms since the epoch), device (uint32), last_seen (int32),
+    status (uint8), flags (uint8), 6 pad bytes, x (float64), y (float64)
+
+Device ids and status strings are numbered in ``meta.json`` next to the
+segments. Records go to ``segment-NNNNNNNN.log`` files of at most
+``segment_records`` records. When a segment is full it is sealed: a
+``.idx`` file is written listing, for every device, the numbers of its
+records in time order, so a range is two binary searches over the mmapped
+segment. The segment being written keeps the same lists in memory. Records
+are stored with the timestamp they were given; one older than what the log
+already holds (history copied in by convert_history, say) is placed in its
+device's list by time, and scan() orders what it finds across segments.
+
+append() checks and converts a whole batch before writing any of it, so a
+bad reading refuses the batch (ValueError) with nothing stored. A write
+that fails after part of the batch went into a segment that was then
+sealed raises AppendError saying how many records were stored.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import math
+import threading
+from array import array
+from collections import namedtuple
+from datetime import datetime, timezone
+from operator import attrgetter
+
+RECORD = struct.Struct("<qIiBB6xdd")
+TIMESTAMP = struct.Struct("<q")
+INDEX_HEADER = struct.Struct("<I")
+INDEX_ENTRY = struct.Struct("<III")  # device, first posting, posting count
+
+NO_LAST_SEEN = -2 ** 31
+MAX_LAST_SEEN = 2 ** 31 - 1
+MAX_STATUSES = 256
+HAS_COORD = 1
+
+# What scan() returns for each record, coord is [x, y] or None
+HistoryRecord = namedtuple("HistoryRecord", ["device_id", "timestamp", "status", "coord", "last_seen"])
+
+class AppendError(OSError):
+    """A write failed part way through append(), ``appended`` records were stored"""
+
+    def __init__(self, appended, error):
+        super().__init__(f"{error} (after storing {appended} records)")
+        self.appended = appended
+
+def to_millis(timestamp):
+    return int(timestamp.timestamp() * 1000)
+
+def from_millis(millis):
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+
+class Segment:
+    """One segment file, mapped read-only, with its per-device record numbers"""
+
+    def __init__(self, path, postings=None):
+        self.path = path
+        # Sealed segments never change size once mapped
+        self.sealed = postings is None
+        self.map = None
+        self.size = 0
+        # device number -> record numbers, array('I') or memoryview
+        self.postings = postings if postings is not None else self._load_index()
+
+    def _load_index(self):
+        with open(self.path[:-4] + ".idx", "rb") as f:
+            data = f.read()
+        count, = INDEX_HEADER.unpack_from(data, 0)
+        base = INDEX_HEADER.size + count * INDEX_ENTRY.size
+        numbers = memoryview(data)[base:].cast("I")
+        postings = {}
+        for i in range(count):
+            device, first, length = INDEX_ENTRY.unpack_from(data, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+            postings[device] = numbers[first:first + length]
+        return postings
+
+    def mapped(self):
+        """The segment's bytes, remapped if the file has grown"""
+        if self.sealed and self.map is not None:
+            return self.map
+        size = os.path.getsize(self.path)
+        if self.map is None or size != self.size:
+            if self.map is not None:
+                self.map.close()
+            self.map = None
+            self.size = size
+            if size:
+                with open(self.path, "rb") as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+def write_index(path, postings):
+    """Write the .idx file of a sealed segment"""
+    devices = sorted(postings)
+    entries = []
+    numbers = array("I")
+    for device in devices:
+        entries.append(INDEX_ENTRY.pack(device, len(numbers), len(postings[device])))
+        numbers.extend(postings[device])
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(INDEX_HEADER.pack(len(devices)))
+        f.write(b"".join(entries))
+        f.write(numbers.tobytes())
+    os.replace(temporary, path)
+
+class HistoryLog:
+    """Segmented binary history in ``directory``, safe to share between threads"""
+
+    def __init__(self, directory, segment_records=1000000):
+        self.directory = str(directory)
+        self.segment_records = segment_records
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.devices = []
+        self.statuses = []
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.devices = meta["devices"]
+            self.statuses = meta["statuses"]
+        self.device_numbers = {device: i for i, device in enumerate(self.devices)}
+        self.status_numbers = {status: i for i, status in enumerate(self.statuses)}
+        self.saved_meta = (len(self.devices), len(self.statuses))
+
+        self.segments = []
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".log"))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path[:-4] + ".idx"):
+                self.segments.append(Segment(path))
+        self.active = None
+        self.file = None
+        self._open_active(names)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:08d}.log")
+
+    def _open_active(self, names):
+        """Reopen an unsealed last segment, or start a new one"""
+        last = os.path.join(self.directory, names[-1]) if names else None
+        if last and not os.path.exists(last[:-4] + ".idx"):
+            size = os.path.getsize(last)
+            if size % RECORD.size:
+                # A crash mid-write left part of a record, drop it
+                with open(last, "r+b") as f:
+                    f.truncate(size - size % RECORD.size)
+            readings = {}
+            with open(last, "rb") as f:
+                data = f.read()
+            for number in range(len(data) // RECORD.size):
+                timestamp, device = struct.unpack_from("<qI", data, number * RECORD.size)
+                readings.setdefault(device, []).append((timestamp, number))
+            path = last
+        else:
+            number = int(names[-1][8:16]) + 1 if names else 0
+            path = self._segment_path(number)
+            readings = {}
+        postings = {}
+        # device number -> timestamps of the active segment's postings
+        self.active_times = {}
+        for device, pairs in readings.items():
+            pairs.sort()
+            self.active_times[device] = array("q", (timestamp for timestamp, _ in pairs))
+            postings[device] = array("I", (number for _, number in pairs))
+        self.file = open(path, "ab")
+        self.active = Segment(path, postings)
+        self.active_records = sum(len(numbers) for numbers in postings.values())
+
+    def _save_meta(self):
+        if (len(self.devices), len(self.statuses)) == self.saved_meta:
+            return
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"devices": self.devices, "statuses": self.statuses}, f)
+        os.replace(path + ".tmp", path)
+        self.saved_meta = (len(self.devices), len(self.statuses))
+
+    def _number(self, value, numbers, added, offset):
+        """Number of a device or status, counting those new in this batch"""
+        number = numbers.get(value)
+        if number is None:
+            number = added.get(value)
+            if number is None:
+                number = added[value] = offset + len(added)
+        return number
+
+    def _pack(self, device_id, timestamp, status, coord, last_seen, added_devices, added_statuses):
+        """One record as (millis, device number, packed bytes), ValueError if it can't be stored"""
+        if not isinstance(timestamp, datetime):
+            raise ValueError(f"History record for {device_id!r}: timestamp must be a datetime, got {timestamp!r}")
+        if status is not None and not isinstance(status, str):
+            raise ValueError(f"History record for {device_id!r}: status must be text, got {status!r}")
+        if last_seen is None:
+            last_seen = NO_LAST_SEEN
+        else:
+            if isinstance(last_seen, bool) or not isinstance(last_seen, (int, float)) or not math.isfinite(last_seen):
+                raise ValueError(f"History record for {device_id!r}: last_seen must be a number, got {last_seen!r}")
+            last_seen = round(last_seen)
+            if abs(last_seen) > MAX_LAST_SEEN:
+                raise ValueError(f"History record for {device_id!r}: last_seen out of range, got {last_seen!r}")
+        if coord:
+            try:
+                x, y = (float(c) for c in coord)
+            except (TypeError, ValueError):
+                raise ValueError(f"History record for {device_id!r}: coord must be [x, y], got {coord!r}") from None
+            flags = HAS_COORD
+        else:
+            flags, x, y = 0, 0.0, 0.0
+        device = self._number(str(device_id), self.device_numbers, added_devices, len(self.devices))
+        status_number = self._number(status, self.status_numbers, added_statuses, len(self.statuses))
+        if status_number >= MAX_STATUSES:
+            raise ValueError(f"History log supports at most {MAX_STATUSES} distinct statuses")
+        millis = to_millis(timestamp)
+        return millis, device, RECORD.pack(millis, device, last_seen, status_number, flags, x, y)
+
+    def append(self, records):
+        """
+        Append readings, each (device_id, timestamp datetime, status, coord,
+        last_seen) with coord [x, y] or None. Raises ValueError, storing
+        nothing, if any reading can't be stored.
+        """
+        with self.lock:
+            added_devices = {}
+            added_statuses = {}
+            packed = [self._pack(*record, added_devices, added_statuses) for record in records]
+            # Every reading is good, now number the new devices and statuses
+            for table, numbers, added in ((self.devices, self.device_numbers, added_devices),
+                                          (self.statuses, self.status_numbers, added_statuses)):
+                table.extend(added)
+                numbers.update(added)
+
+            appended = 0
+            try:
+                while appended < len(packed):
+                    if self.active_records >= self.segment_records:
+                        # Full, and sealing it failed last time
+                        self._seal()
+                    chunk = packed[appended:appended + self.segment_records - self.active_records]
+                    self._write(chunk)
+                    appended += len(chunk)
+                    if self.active_records >= self.segment_records:
+                        self._seal()
+            except OSError as e:
+                if not appended:
+                    raise
+                raise AppendError(appended, e) from e
+
+    def _write(self, packed):
+        """Write packed records, then make them visible to scan()"""
+        # Numbers must be on disk before records that use them
+        self._save_meta()
+        try:
+            self.file.write(b"".join(record for _, _, record in packed))
+            self.file.flush()
+        except OSError:
+            # Don't leave part of the batch behind the records we know of
+            try:
+                self.file.truncate(self.active_records * RECORD.size)
+            except OSError:
+                pass
+            raise
+        postings = self.active.postings
+        times = self.active_times
+        number = self.active_records
+        for millis, device, _ in packed:
+            numbers = postings.get(device)
+            if numbers is None:
+                numbers = postings[device] = array("I")
+                times[device] = array("q")
+            device_times = times[device]
+            if not device_times or millis >= device_times[-1]:
+                numbers.append(number)
+                device_times.append(millis)
+            else:
+                # Older than this device's last reading, keep the list in time order
+                position = bisect.bisect_right(device_times, millis)
+                numbers.insert(position, number)
+                device_times.insert(position, millis)
+            number += 1
+        self.active_records = number
+
+    def _seal(self):
+        # Nothing changes in memory until the index and the next file exist,
+        # so a failure here leaves the full segment active to seal again
+        write_index(self.active.path[:-4] + ".idx", self.active.postings)
+        number = int(os.path.basename(self.active.path)[8:16]) + 1
+        path = self._segment_path(number)
+        new_file = open(path, "ab")
+        self.file.close()
+        self.active.close()
+        self.segments.append(Segment(self.active.path))
+        self.file = new_file
+        self.active = Segment(path, {})
+        self.active_times = {}
+        self.active_records = 0
+
+    def scan(self, device_id, start=None, end=None):
+        """Records of one device within [start, end), oldest first"""
+        device = self.device_numbers.get(str(device_id))
+        if device is None:
+            return []
+        start_ms = to_millis(start) if start is not None else None
+        end_ms = to_millis(end) if end is not None else None
+        results = []
+        with self.lock:
+            for segment in self.segments + [self.active]:
+                numbers = segment.postings.get(device)
+                if numbers is None or not len(numbers):
+                    continue
+                data = segment.mapped()
+                if data is None:
+                    continue
+                key = lambda number: TIMESTAMP.unpack_from(data, number * RECORD.size)[0]
+                low = bisect.bisect_left(numbers, start_ms, key=key) if start_ms is not None else 0
+                high = bisect.bisect_left(numbers, end_ms, key=key) if end_ms is not None else len(numbers)
+                for number in numbers[low:high]:
+                    results.append(self._decode(data, number))
+        # A segment can hold readings older than the next one's (copied in
+        # later), the sort is stable and cheap when they are already in order
+        results.sort(key=attrgetter("timestamp"))
+        return results
+
+    def _decode(self, data, number):
+        millis, device, last_seen, status, flags, x, y = RECORD.unpack_from(data, number * RECORD.size)
+        return HistoryRecord(
+            self.devices[device],
+            from_millis(millis),
+            self.statuses[status],
+            [x, y] if flags & HAS_COORD else None,
+            None if last_seen == NO_LAST_SEEN else last_seen,
+        )
+
+    def iter_all(self):
+        """Every record in append order, as of the call"""
+        # Sealing closes the active segment's map, so read through maps of our
+        # own, and only the records that were there when the walk started
+        with self.lock:
+            segments = [(segment.path, None) for segment in self.segments]
+            segments.append((self.active.path, self.active_records))
+        for path, count in segments:
+            with open(path, "rb") as f:
+                if count is None:
+                    count = os.fstat(f.fileno()).st_size // RECORD.size
+                if not count:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for number in range(count):
+                        yield self._decode(data, number)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(s.mapped() or b"") // RECORD.size for s in self.segments) + self.active_records
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            for segment in self.segments + [self.active]:
+                segment.close()
@@ -0,0 +1,211 @@
+import json
+import math
+import zlib
+from django.utils import timezone
+from .fleet_state import fleet_state
+from .merge import bin_merger
+from .metrics import INGEST_MESSAGES, INGEST_RECORDS, INGEST_RESYNCS
+from .models import SensorData
+from .rollups import rollup_scheduler
+from .sync import gateway_states, is_sync_message, snapshot_bins
+from .writer import ingest_writer
+
+# Upper bound for a gzip upload once inflated
+MAX_DECOMPRESSED_BODY = 50 * 1024 * 1024
+
+def decode_upload(body, gzipped=False):
+    """Parse an upload body as JSON, inflating it first if the gateway gzipped it"""
+    if gzipped:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(body, MAX_DECOMPRESSED_BODY)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Decompressed body too large")
+    return json.loads(body)
+
+# Longest values the history columns hold
+MAX_ID_LENGTH = 20
+MAX_DIRECTION_LENGTH = 2
+# last_seen is stored as a 32-bit integer
+MAX_LAST_SEEN = 2**31 - 1
+
+def _number(device_id, field, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Bin {device_id}: {field} must be a number, got {value!r}")
+    return value
+
+def _text(device_id, field, value, max_length):
+    if value is None:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or len(value) > max_length:
+        raise ValueError(f"Bin {device_id}: {field} must be text of at most {max_length} characters, got {value!r}")
+    return value
+
+def clean_bin(device_id, values):
+    """
+    Check one bin's values from an upload and coerce them to what the
+    history stores: last_seen a whole number of seconds, coord two floats
+    or None, the text fields within their column lengths. Other keys are
+    kept as they are. Raises ValueError naming the bin and the field, so a
+    malformed upload is refused before anything is queued.
+    """
+    _text(device_id, "bin id", device_id, MAX_ID_LENGTH)
+    if not isinstance(values, dict):
+        raise ValueError(f"Bin {device_id}: expected an object, got {values!r}")
+    values = dict(values)
+
+    last_seen = values.get("last_seen")
+    if last_seen is not None:
+        last_seen = round(_number(device_id, "last_seen", last_seen))
+        if abs(last_seen) > MAX_LAST_SEEN:
+            raise ValueError(f"Bin {device_id}: last_seen out of range, got {last_seen!r}")
+        values["last_seen"] = last_seen
+
+    coord = values.get("coord")
+    if coord:
+        if not isinstance(coord, (list, tuple)) or len(coord) != 2:
+            raise ValueError(f"Bin {device_id}: coord must be [x, y], got {coord!r}")
+        values["coord"] = [float(_number(device_id, "coord", c)) for c in coord]
+    elif "coord" in values:
+        values["coord"] = None
+    if values.get("coord_error") is not None:
+        values["coord_error"] = float(_number(device_id, "coord_error", values["coord_error"]))
+
+    for field, max_length in (("status", MAX_ID_LENGTH), ("next_nearest", MAX_ID_LENGTH),
+                              ("next_nearest_direction", MAX_DIRECTION_LENGTH)):
+        if field in values:
+            values[field] = _text(device_id, field, values[field], max_length)
+    return values
+
+def clean_bins(bins):
+    """clean_bin() over a {device_id: values} mapping, with the ids as strings"""
+    if not isinstance(bins, dict):
+        raise ValueError(f"Expected an object of bins, got {bins!r}")
+    return {str(device_id): clean_bin(str(device_id), values) for device_id, values in bins.items()}
+
+def build_records(data, now=None):
+    """
+    Create (unsaved) SensorData rows from a {device_id: values} mapping.
+    Raises ValueError if any bin's values don't pass clean_bin().
+    """
+    if now is None:
+        now = timezone.now()
+    records = []
+    for device_id, values in clean_bins(data).items():
+        # Create new SensorData instance
+        sensor_data = SensorData(
+            device_id=device_id,
+            timestamp=now,
+            last_seen=values.get("last_seen"),
+            status=values.get("status"),
+            next_nearest=values.get("next_nearest"),
+            next_nearest_direction=values.get("next_nearest_direction")
+        )
+        
+        # Set coordinates using the property setter
+        sensor_data.coord = values.get("coord")
+        
+        records.append(sensor_data)
+    return records
+
+def ingest(messages):
+    """
+    Apply uploads in order, merge the bins they change with what the other
+    gateways report (merge.py, unless MERGE_GATEWAYS is off) and hand the merged records that changed to
+    the write-behind buffer, which appends them to the history and upserts
+    each bin's latest state. Stops at the first delta that can't be applied.
+    Raises ValueError, with nothing applied, if any message is malformed.
+    The fleet state snapshot is updated for every gateway whose bins
+    changed. Returns (number applied, acked seqs, resync seq or False,
+    {source: changed bins to broadcast}), where the source is the gateway
+    id, or "" for snapshots that don't name one.
+    """
+    now = timezone.now()
+    records = []
+    acks = []
+    updates = {}
+    owners = set()
+    states = {}  # gateway -> whole state, without merging
+    resync = False
+    applied = 0
+    
+    # Check every message before any of them moves a gateway's seq or the
+    # merged state, so a malformed upload is refused (400) as a whole and
+    # its retry isn't acked as a duplicate
+    checked = []
+    for message in messages:
+        if not isinstance(message, dict):
+            raise ValueError(f"Expected an upload object, got {message!r}")
+        if is_sync_message(message):
+            seq = message["seq"]
+            if not isinstance(seq, int) or isinstance(seq, bool):
+                raise ValueError("seq must be an integer")
+            checked.append((True, dict(message, bins=clean_bins(message["bins"]))))
+        else:
+            gateway, bins = snapshot_bins(message)
+            checked.append((False, (gateway, clean_bins(bins))))
+    
+    for sequenced, message in checked:
+        if sequenced:
+            result = gateway_states.apply(message)
+            if not result.accepted:
+                # The gateway's delta doesn't follow the state we have, ask for a keyframe
+                resync = result.seq
+                break
+            gateway, bins = str(message.get("gateway", "")), result.changed
+            state = result.state
+            acks.append(result.seq)
+        else:
+            gateway, bins = message
+            state = bins
+        applied += 1
+        if not bins:
+            continue
+        
+        if bin_merger is None:
+            # MERGE_GATEWAYS off, every gateway's bins stand as it sent them
+            changed = bins
+            states[gateway] = state
+        else:
+            changed, changed_owners = bin_merger.merge(gateway, bins)
+            owners |= changed_owners
+        if changed:
+            records.extend(build_records(changed, now))
+            updates.setdefault(gateway, {}).update(changed)
+    
+    INGEST_MESSAGES.inc(applied)
+    INGEST_RECORDS.inc(len(records))
+    if resync is not False:
+        INGEST_RESYNCS.inc()
+    ingest_writer.add(records)
+    fleet_state.update(states)
+    if owners:
+        bin_merger.publish(owners, fleet_state.update)
+    rollup_scheduler.start()
+    return applied, acks, resync, updates
+
+def handle_upload(data):
+    """
+    Ingest one decoded upload (snapshot, sequenced message or batch) from
+    any transport. Returns (status code, reply dict, {source: state to
+    broadcast}).
+    """
+    # Several queued uploads sent together by a gateway catching up
+    batch = isinstance(data, dict) and isinstance(data.get("batch"), list)
+    messages = data["batch"] if batch else [data]
+    
+    applied, acks, resync, updates = ingest(messages)
+    
+    if resync is not False:
+        reply = {"applied": applied, "acks": acks} if batch else {}
+        reply.update({"resync": True, "seq": resync})
+        return 409, reply, updates
+    
+    if batch:
+        reply = {"message": "Data received", "applied": applied, "acks": acks}
+    elif acks:
+        reply = {"message": "Data received", "ack": acks[0]}
+    else:
+        reply = {"message": "Data received"}
+    return 201, reply, updates
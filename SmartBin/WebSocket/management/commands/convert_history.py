@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from WebSocket.history_log import HistoryLog
+from WebSocket.models import SensorData
+
+class Command(BaseCommand):
+    help = "Copy sensor history between the SensorData table and the binary history log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["binary", "sqlite"], required=True,
+                            help="binary: SensorData -> log, sqlite: log -> SensorData")
+        parser.add_argument("--directory", default=None,
+                            help="History log directory (default: HISTORY_LOG_DIR)")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        directory = options["directory"] or getattr(settings, "HISTORY_LOG_DIR", None)
+        if directory is None:
+            raise CommandError("No history log directory, pass --directory or set HISTORY_LOG_DIR")
+        log = HistoryLog(directory, getattr(settings, "HISTORY_LOG_SEGMENT_RECORDS", 1000000))
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        copied = 0
+        try:
+            if options["to"] == "binary":
+                rows = SensorData.objects.order_by("timestamp", "id").values_list(
+                    "device_id", "timestamp", "status", "x", "y", "last_seen").iterator(chunk_size=batch_size)
+                batch = []
+                for device_id, timestamp, status, x, y, last_seen in rows:
+                    coord = [x, y] if x is not None and y is not None else None
+                    batch.append((device_id, timestamp, status, coord, last_seen))
+                    if len(batch) == batch_size:
+                        log.append(batch)
+                        copied += len(batch)
+                        batch = []
+                if batch:
+                    log.append(batch)
+                    copied += len(batch)
+            else:
+                batch = []
+                for record in log.iter_all():
+                    row = SensorData(device_id=record.device_id, timestamp=record.timestamp,
+                                     status=record.status, last_seen=record.last_seen)
+                    row.coord = record.coord
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        with transaction.atomic():
+                            SensorData.objects.bulk_create(batch)
+                        copied += len(batch)
+                        batch = []
+                if batch:
+                    with transaction.atomic():
+                        SensorData.objects.bulk_create(batch)
+                    copied += len(batch)
+        finally:
+            log.close()
+        self.stdout.write(f"Copied {copied} readings in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from WebSocket.rollups import apply_retention, compact, rollup_history, rollups_available
+
+class Command(BaseCommand):
+    help = "Roll new SensorData rows up into minute/hour summaries and apply retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Rows per rollup transaction (default: ROLLUP_BATCH_SIZE)")
+        parser.add_argument("--no-retention", action="store_true",
+                            help="Only roll up, don't delete anything")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="VACUUM the SQLite file afterwards (blocks writers while it runs)")
+        parser.add_argument("--loop", type=float, metavar="SECONDS",
+                            help="Keep running, one pass every SECONDS")
+
+    def handle(self, *args, **options):
+        if not rollups_available():
+            raise CommandError('Rollups read SensorData, which HISTORY_BACKEND = "binary" leaves empty')
+        while True:
+            started = time.perf_counter()
+            rolled_up = rollup_history(batch_size=options["batch_size"])
+            self.stdout.write(f"Rolled up {rolled_up} rows")
+            if not options["no_retention"]:
+                for kind, count in apply_retention().items():
+                    self.stdout.write(f"Deleted {count} {kind} rows")
+            compact(vacuum=options["vacuum"])
+            self.stdout.write(f"Done in {time.perf_counter() - started:.2f}s")
+
+            if options["loop"] is None:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,58 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = "Run the ASGI server as one or more Daphne processes sharing a listening socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Server processes to start (several need REDIS_URL)")
+        parser.add_argument("--bind", default="0.0.0.0", help="Address to listen on")
+        parser.add_argument("--port", type=int, default=8000)
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if workers > 1:
+            # Each of these only works within one process
+            backend = settings.CHANNEL_LAYERS["default"]["BACKEND"]
+            if backend == "channels.layers.InMemoryChannelLayer":
+                raise CommandError("Several workers need a shared channel layer, set REDIS_URL")
+            if getattr(settings, "HISTORY_BACKEND", "sqlite") == "binary":
+                raise CommandError('The binary history log has a single writer, use HISTORY_BACKEND = "sqlite"')
+            if getattr(settings, "MERGE_GATEWAYS", True) and not getattr(settings, "MERGE_CACHE", None):
+                raise CommandError("Merging gateways in several workers needs a shared cache, set MERGE_CACHE")
+
+        # Bound once here and inherited, the kernel spreads connections over the workers
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((options["bind"], options["port"]))
+        listener.listen(1024)
+
+        processes = []
+        for worker in range(workers):
+            env = dict(os.environ, SMARTBIN_WORKERS=str(workers), SMARTBIN_WORKER=str(worker))
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "daphne", "--fd", str(listener.fileno()), "SmartBin.asgi:application"],
+                pass_fds=(listener.fileno(),), env=env, cwd=settings.BASE_DIR,
+            ))
+        listener.close()
+        self.stdout.write(f"Serving on {options['bind']}:{options['port']} with {workers} worker(s)")
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            stop(None, None)
+            for process in processes:
+                process.wait()
@@ -0,0 +1,241 @@
+"""
+One authoritative record per bin when several gateways hear it.
+
+Gateways report every bin their receivers can hear and coverage overlaps,
+so the same bin arrives from several gateways with different last_seen,
+status and position. BinMerger keeps each gateway's latest report of every
+bin and builds the bin's record from two of them:
+
+- status and everything else from the bin's owner, the gateway that heard
+  the bin most recently (time received minus last_seen);
+- coord and coord_error from the report with the smallest coord_error,
+  among those heard within POSITION_MAX_AGE of the owner's.
+
+The current owner keeps the bin until another gateway is fresher by more
+than FRESHNESS_SLACK seconds (by any margin once the owner reports it
+OFFLINE), and a position is only replaced by one whose error is under
+POSITION_MARGIN times its own, so two gateways with nearly the same view
+don't take turns on the dashboard.
+
+The records live in the process, or with MERGE_CACHE set in that Django
+cache, so that under "manage.py serve --workers N" every worker merges
+against the same state: each bin's record and each gateway's owned bins are
+then changed with compare-and-set (shared_cache.update). With
+MERGE_GATEWAYS off, bin_merger is None and each gateway's bins are kept as
+it sent them.
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
+from . import shared_cache
+from .metrics import MERGE_CHANGES, MERGE_HANDOVERS, MERGE_REPORTS
+
+# last_seen is exact when the gateway's routing-table dump is printed, which
+# is up to an upload interval (5 s) before the server receives it
+FRESHNESS_SLACK = 10
+POSITION_MAX_AGE = 120
+POSITION_MARGIN = 0.8
+
+# seen_at: when the gateway last heard the bin (server clock), None without last_seen
+Report = namedtuple("Report", ["seen_at", "values"])
+
+# A bin's record: each gateway's latest Report, the owner and position
+# source picked from them and the merged values
+EMPTY_RECORD = {"reports": {}, "owner": None, "position_source": None, "merged": None}
+
+RECORD_KEY = "merge:bin:%s"
+OWNED_KEY = "merge:owned:%s"
+
+class LocalStore:
+    """Records kept in this process, with the same interface as CacheStore"""
+
+    def __init__(self):
+        self.values = {}  # key -> (version, value)
+        # Reentrant, owned-bin changes read bin records
+        self.lock = threading.RLock()
+
+    def get_versioned(self, keys):
+        with self.lock:
+            return {key: self.values[key] for key in keys if key in self.values}
+
+    def get_many(self, keys):
+        return {key: value for key, (_, value) in self.get_versioned(keys).items()}
+
+    def update(self, key, change):
+        with self.lock:
+            version, current = self.values.get(key, (0, None))
+            value = change(current)
+            if value is None:
+                return current
+            self.values[key] = (version + 1, value)
+            return value
+
+class CacheStore:
+    """Records in a Django cache shared by every server process, see shared_cache"""
+
+    def __init__(self, cache_alias):
+        self.cache_alias = cache_alias
+
+    def get_versioned(self, keys):
+        return shared_cache.get_versioned(caches[self.cache_alias], keys)
+
+    def get_many(self, keys):
+        return shared_cache.get_many(caches[self.cache_alias], keys)
+
+    def update(self, key, change):
+        return shared_cache.update(caches[self.cache_alias], key, change)
+
+def fresher(a, b):
+    """Seconds by which Report a was heard after Report b, None if either is unknown"""
+    if a.seen_at is None or b.seen_at is None:
+        return None
+    return a.seen_at - b.seen_at
+
+def position_error(report):
+    error = report.values.get("coord_error")
+    return float("inf") if error is None else error
+
+class BinMerger:
+    def __init__(self, clock=time.time, cache_alias=None):
+        self.clock = clock
+        # bin records under RECORD_KEY, {bin id: merged values} each gateway
+        # owns under OWNED_KEY
+        self.store = CacheStore(cache_alias) if cache_alias else LocalStore()
+
+    def merge(self, gateway, bins, now=None):
+        """
+        Take ``bins`` ({bin_id: values}) as reported by ``gateway``. Returns
+        ({bin_id: merged values} for records that changed, set of gateways
+        whose owned bins changed).
+        """
+        if now is None:
+            now = self.clock()
+        gateway = str(gateway)
+        changed = {}
+        touched = {}  # gateway -> bins it gained or lost
+        handovers = 0
+        for bin_id, values in bins.items():
+            bin_id = str(bin_id)
+            merged, previous_owner, owner = self._merge_bin(bin_id, gateway, values, now)
+            if merged is None:
+                continue
+            changed[bin_id] = merged
+            touched.setdefault(owner, set()).add(bin_id)
+            if previous_owner is not None and previous_owner != owner:
+                handovers += 1
+                touched.setdefault(previous_owner, set()).add(bin_id)
+        for owner, bin_ids in touched.items():
+            self.store.update(OWNED_KEY % owner, partial(self._owned, owner, bin_ids))
+        MERGE_REPORTS.inc(len(bins))
+        MERGE_CHANGES.inc(len(changed))
+        MERGE_HANDOVERS.inc(handovers)
+        return changed, set(touched)
+
+    def _merge_bin(self, bin_id, gateway, values, now):
+        """
+        Store ``gateway``'s report of one bin. Returns (merged values, owner
+        before, owner after) if the merged record changed, else Nones.
+        """
+        outcome = [None, None, None]
+
+        def report(record):
+            # Called again if another process changed the record first
+            outcome[:] = [None, None, None]
+            record = record or EMPTY_RECORD
+            previous = record["reports"].get(gateway)
+            if previous is not None and previous.values == values:
+                # Nothing new, and last_seen still counts from the first time
+                return None
+            last_seen = values.get("last_seen")
+            seen_at = now - last_seen if isinstance(last_seen, (int, float)) else None
+            reports = dict(record["reports"])
+            reports[gateway] = Report(seen_at, values)
+
+            owner = self._owner(reports, record["owner"])
+            position_source = self._position_source(reports, owner, record["position_source"])
+            merged = dict(reports[owner].values)
+            if position_source is not None and position_source != owner:
+                position = reports[position_source].values
+                merged["coord"] = position.get("coord")
+                merged["coord_error"] = position.get("coord_error")
+            merged["gateway"] = owner
+
+            if merged == record["merged"]:
+                return dict(record, reports=reports, position_source=position_source)
+            outcome[:] = [merged, record["owner"], owner]
+            return {"reports": reports, "owner": owner, "position_source": position_source, "merged": merged}
+
+        self.store.update(RECORD_KEY % bin_id, report)
+        return outcome
+
+    def _owned(self, gateway, bin_ids, owned):
+        """``gateway``'s owned bins with ``bin_ids`` brought in line with their records"""
+        # The records are read after the owned bins, so a process that
+        # changes a record later also changes the owned bins later, and
+        # whichever of us writes them second has read its record
+        records = self.store.get_many([RECORD_KEY % bin_id for bin_id in bin_ids])
+        owned = dict(owned or {})
+        for bin_id in bin_ids:
+            record = records.get(RECORD_KEY % bin_id)
+            if record is not None and record["owner"] == gateway:
+                owned[bin_id] = record["merged"]
+            else:
+                owned.pop(bin_id, None)
+        return owned
+
+    def _owner(self, reports, current):
+        if current is None:
+            # First report of the bin
+            return next(iter(reports))
+        best = current
+        slack = 0 if reports[current].values.get("status") == "OFFLINE" else FRESHNESS_SLACK
+        for gateway, report in reports.items():
+            if gateway == current:
+                continue
+            if reports[best].seen_at is None and report.seen_at is not None:
+                best = gateway
+                continue
+            ahead = fresher(report, reports[best])
+            if ahead is not None and ahead > (slack if best == current else 0):
+                best = gateway
+        return best
+
+    def _position_source(self, reports, owner, current):
+        newest = reports[owner]
+        candidates = [
+            gateway for gateway, report in reports.items()
+            if report.values.get("coord") and not ((fresher(newest, report) or 0) > POSITION_MAX_AGE)
+        ]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda gateway: position_error(reports[gateway]))
+        if current in candidates and current != best:
+            if not position_error(reports[best]) < position_error(reports[current]) * POSITION_MARGIN:
+                return current
+        return best
+
+    def owned_state(self, gateway):
+        """{bin_id: merged values} of the bins ``gateway`` owns"""
+        return self.store.get_many([OWNED_KEY % gateway]).get(OWNED_KEY % gateway, {})
+
+    def publish(self, gateways, update):
+        """
+        Call update({gateway: owned bins}) for ``gateways``, and again for
+        those whose bins another upload changed in the meantime, so the
+        last state handed on for a gateway is never an older one
+        """
+        keys = {gateway: OWNED_KEY % gateway for gateway in gateways}
+        while keys:
+            entries = self.store.get_versioned(keys.values())
+            update({gateway: entries[key][1] if key in entries else {} for gateway, key in keys.items()})
+            current = self.store.get_versioned(keys.values())
+            keys = {gateway: key for gateway, key in keys.items()
+                    if current.get(key, (None,))[0] != entries.get(key, (None,))[0]}
+
+# Shared by every request handled by this process, and between processes
+# with MERGE_CACHE set
+bin_merger = (BinMerger(cache_alias=getattr(settings, "MERGE_CACHE", None))
+              if getattr(settings, "MERGE_GATEWAYS", True) else None)
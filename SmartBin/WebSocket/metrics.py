@@ -0,0 +1,47 @@
+"""
+Prometheus metrics for the ingest and broadcast path, served in the text
+exposition format at /websocket/metrics.
+
+The classes are in prometheus.py. Label children are looked up once, here,
+so recording is an integer add, or a bisect and two adds, with no lock.
+Values belong to the process. Under "manage.py serve --workers N" a scrape
+is answered by whichever worker accepts the connection; every series has a
+"worker" label so workers never mix, but one scrape only sees one of them.
+"""
+from django.conf import settings
+from .prometheus import BUCKETS, CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+
+# Every series carries the worker it came from
+REGISTRY.const_labels["worker"] = getattr(settings, "SERVER_WORKER", 0)
+
+# Ingest
+UPLOADS = Counter("smartbin_ingest_uploads_total", "Uploads received", ["transport", "status"])
+UPLOAD_SECONDS = Histogram("smartbin_ingest_upload_seconds", "Time to ingest and broadcast one upload", ["transport"],
+                           buckets=BUCKETS)
+INGEST_MESSAGES = Counter("smartbin_ingest_messages_total", "Snapshots and sequenced messages applied")
+INGEST_RESYNCS = Counter("smartbin_ingest_resyncs_total", "Uploads answered with a resync request")
+INGEST_RECORDS = Counter("smartbin_ingest_records_total", "History rows handed to the ingest writer")
+WRITER_FLUSH_SECONDS = Histogram("smartbin_ingest_flush_seconds", "Time to commit one ingest writer flush", buckets=BUCKETS)
+MERGE_REPORTS = Counter("smartbin_ingest_merge_reports_total", "Bin reports from gateways passed to the merge")
+MERGE_CHANGES = Counter("smartbin_ingest_merge_changes_total", "Merged bin records that changed")
+MERGE_HANDOVERS = Counter("smartbin_ingest_merge_handovers_total", "Bins whose owning gateway changed")
+
+# Channel layer and sockets
+CHANNEL_SENDS = Counter("smartbin_channel_layer_sends_total", "group_send calls by kind of group", ["group"])
+CHANNEL_SEND_SECONDS = Histogram("smartbin_channel_layer_send_seconds", "Time spent in one group_send", ["group"],
+                                 buckets=BUCKETS)
+CLIENTS = Gauge("smartbin_websocket_clients", "Open WebSocket connections", ["consumer"])
+FRAMES_COALESCED = Counter("smartbin_websocket_frames_coalesced_total",
+                           "Queued frames replaced by a newer one from the same source")
+FRAMES_DROPPED = Counter("smartbin_websocket_frames_dropped_total",
+                         "Queued frames dropped because a client had too many sources pending")
+FRAMES_RESYNCED = Counter("smartbin_websocket_frames_resynced_total",
+                          "Clients sent the current state again after losing frames or asking for it")
+
+def upload_metrics(transport):
+    """(latency histogram, {status code: counter}) for one ingest transport"""
+    return (UPLOAD_SECONDS.labels(transport),
+            {status: UPLOADS.labels(transport, status) for status in (201, 400, 409, 500)})
+
+def render():
+    return REGISTRY.render()
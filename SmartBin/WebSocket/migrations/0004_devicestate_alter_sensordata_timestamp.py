@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WebSocket', '0003_alter_sensordata_options_remove_sensordata_coord_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.IntegerField(null=True)),
+                ('status', models.CharField(max_length=20, null=True)),
+                ('coord_json', models.TextField(blank=True, null=True)),
+                ('next_nearest', models.CharField(blank=True, max_length=20, null=True)),
+                ('next_nearest_direction', models.CharField(blank=True, max_length=2, null=True)),
+                ('device_id', models.CharField(max_length=20, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='sensordata',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
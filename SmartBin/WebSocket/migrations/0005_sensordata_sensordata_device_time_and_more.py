@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:46
+
+from django.db import migrations, models
+
+
+def backfill_device_state(apps, schema_editor):
+    """Give devices recorded before DeviceState existed a latest-state row"""
+    SensorData = apps.get_model('WebSocket', 'SensorData')
+    DeviceState = apps.get_model('WebSocket', 'DeviceState')
+    known = set(DeviceState.objects.values_list('device_id', flat=True))
+    devices = SensorData.objects.order_by().values_list('device_id', flat=True).distinct()
+    fields = ['timestamp', 'last_seen', 'status', 'coord_json', 'next_nearest', 'next_nearest_direction']
+    states = []
+    for device_id in devices:
+        if device_id in known:
+            continue
+        row = SensorData.objects.filter(device_id=device_id).order_by('-timestamp', '-id').values(*fields).first()
+        states.append(DeviceState(device_id=device_id, **row))
+    DeviceState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WebSocket', '0004_devicestate_alter_sensordata_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sensordata',
+            index=models.Index(fields=['device_id', 'timestamp'], name='sensordata_device_time'),
+        ),
+        migrations.AddIndex(
+            model_name='sensordata',
+            index=models.Index(fields=['timestamp'], name='sensordata_time'),
+        ),
+        migrations.RunPython(backfill_device_state, migrations.RunPython.noop),
+    ]
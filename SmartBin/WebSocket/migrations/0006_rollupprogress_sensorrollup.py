@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WebSocket', '0005_sensordata_sensordata_device_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=20)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('full_events', models.IntegerField(default=0)),
+                ('status_seconds_json', models.TextField(default='{}')),
+                ('last_status', models.CharField(max_length=20, null=True)),
+                ('last_coord_json', models.TextField(blank=True, null=True)),
+                ('last_timestamp', models.DateTimeField(null=True)),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='sensorrollup_resolution_time')],
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'device_id', 'bucket'), name='sensorrollup_unique_bucket')],
+            },
+        ),
+    ]
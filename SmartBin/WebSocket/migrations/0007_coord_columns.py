@@ -0,0 +1,125 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:57
+
+import json
+
+from django.db import migrations, models
+
+# (model, JSON column, x column, y column)
+COORD_COLUMNS = [
+    ('SensorData', 'coord_json', 'x', 'y'),
+    ('DeviceState', 'coord_json', 'x', 'y'),
+    ('SensorRollup', 'last_coord_json', 'last_x', 'last_y'),
+]
+
+
+def parse_coord(text):
+    """(x, y) from a stored coord string, (None, None) if it isn't one"""
+    try:
+        value = json.loads(text)
+        x, y = value[0], value[1]
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None, None
+    if not isinstance(value, list) or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in (x, y)):
+        return None, None
+    return float(x), float(y)
+
+
+def copy_coords(apps, schema_editor):
+    """Fill the new float columns from the JSON text they replace"""
+    connection = schema_editor.connection
+    for model_name, source, x_name, y_name in COORD_COLUMNS:
+        model = apps.get_model('WebSocket', model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        if connection.vendor == 'sqlite':
+            # One statement instead of a round trip per row, this table can hold millions.
+            # CAST turns anything non-numeric into 0.0, so only arrays of two numbers are copied
+            schema_editor.execute(
+                f"UPDATE {table} SET {x_name} = CAST(json_extract({source}, '$[0]') AS REAL), "
+                f"{y_name} = CAST(json_extract({source}, '$[1]') AS REAL) "
+                f"WHERE {source} IS NOT NULL AND json_valid({source}) "
+                f"AND json_type({source}) = 'array' "
+                f"AND json_type({source}, '$[0]') IN ('integer', 'real') "
+                f"AND json_type({source}, '$[1]') IN ('integer', 'real')"
+            )
+            continue
+        rows = model.objects.exclude(**{source: None}).only('id', source)
+        batch = []
+        for row in rows.iterator(chunk_size=5000):
+            x, y = parse_coord(getattr(row, source))
+            setattr(row, x_name, x)
+            setattr(row, y_name, y)
+            batch.append(row)
+            if len(batch) == 5000:
+                model.objects.bulk_update(batch, [x_name, y_name])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [x_name, y_name])
+
+
+def copy_coords_back(apps, schema_editor):
+    for model_name, source, x_name, y_name in COORD_COLUMNS:
+        model = apps.get_model('WebSocket', model_name)
+        batch = []
+        rows = model.objects.exclude(**{x_name: None}).exclude(**{y_name: None}).only('id', x_name, y_name)
+        for row in rows.iterator(chunk_size=5000):
+            setattr(row, source, json.dumps([getattr(row, x_name), getattr(row, y_name)]))
+            batch.append(row)
+            if len(batch) == 5000:
+                model.objects.bulk_update(batch, [source])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [source])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WebSocket', '0006_rollupprogress_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicestate',
+            name='x',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='devicestate',
+            name='y',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordata',
+            name='x',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordata',
+            name='y',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='last_x',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='last_y',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_coords, copy_coords_back),
+        migrations.RemoveField(
+            model_name='devicestate',
+            name='coord_json',
+        ),
+        migrations.RemoveField(
+            model_name='sensordata',
+            name='coord_json',
+        ),
+        migrations.RemoveField(
+            model_name='sensorrollup',
+            name='last_coord_json',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WebSocket', '0007_coord_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='last_seen',
+            field=models.IntegerField(null=True),
+        ),
+    ]
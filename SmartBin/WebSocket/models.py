@@ -1,30 +1,163 @@
 from django.db import models
+from django.utils import timezone
 import json
 
-class SensorData(models.Model):
+class BinReading(models.Model):
+    """Fields shared by the history table and the latest-state table"""
     device_id = models.CharField(max_length=20)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the upload is received, history rows are written later
+    timestamp = models.DateTimeField(default=timezone.now)
     last_seen = models.IntegerField(null=True)
     status = models.CharField(max_length=20, null=True)
     
-    # Store coordinates as a JSON string
-    coord_json = models.TextField(null=True, blank=True)
+    # Position in metres, both None until the bin has been located
+    x = models.FloatField(null=True, blank=True)
+    y = models.FloatField(null=True, blank=True)
     next_nearest = models.CharField(max_length=20, null=True, blank=True)
     next_nearest_direction = models.CharField(max_length=2, null=True, blank=True)
 
     class Meta:
-        ordering = ['-timestamp']
+        abstract = True
     
-    # Property methods to handle the JSON serialization/deserialization
+    # [x, y] as the gateway sends it
     @property
     def coord(self):
-        if self.coord_json:
-            return json.loads(self.coord_json)
-        return None
+        if self.x is None or self.y is None:
+            return None
+        return [self.x, self.y]
     
     @coord.setter
     def coord(self, value):
-        if value is not None:
-            self.coord_json = json.dumps(value)
+        if value:
+            self.x, self.y = float(value[0]), float(value[1])
         else:
-            self.coord_json = None
\ No newline at end of file
+            self.x = self.y = None
+
+class CoordQuerySet(models.QuerySet):
+    """Spatial filters on the x/y columns, evaluated by the database"""
+
+    def within(self, min_x, min_y, max_x, max_y):
+        """Rows positioned inside the bounding box (edges included)"""
+        return self.filter(x__gte=min_x, x__lte=max_x, y__gte=min_y, y__lte=max_y)
+
+    def nearest(self, x, y, k=None, max_distance=None):
+        """
+        Positioned rows ordered by distance from (x, y), annotated with
+        ``distance_sq`` (squared metres). ``max_distance`` first narrows the
+        rows to a bounding box and then to the circle.
+        """
+        rows = self.filter(x__isnull=False, y__isnull=False)
+        if max_distance is not None:
+            rows = rows.within(x - max_distance, y - max_distance, x + max_distance, y + max_distance)
+        dx = models.F('x') - x
+        dy = models.F('y') - y
+        rows = rows.annotate(distance_sq=dx * dx + dy * dy)
+        if max_distance is not None:
+            rows = rows.filter(distance_sq__lte=max_distance * max_distance)
+        rows = rows.order_by('distance_sq')
+        return rows[:k] if k is not None else rows
+
+class SensorDataQuerySet(CoordQuerySet):
+    """History queries shaped to use the (device_id, timestamp) index"""
+
+    def for_device(self, device_id, start=None, end=None):
+        """Rows for one device, newest first, optionally within [start, end)"""
+        rows = self.filter(device_id=device_id)
+        if start is not None:
+            rows = rows.filter(timestamp__gte=start)
+        if end is not None:
+            rows = rows.filter(timestamp__lt=end)
+        return rows.order_by('-timestamp', '-id')
+
+    def latest_for(self, device_id):
+        """Newest row for one device, or None"""
+        return self.for_device(device_id).first()
+
+    def latest_per_device(self, device_ids=None):
+        """
+        Newest row of every device (or of ``device_ids``).
+
+        The device list comes from the small DeviceState table, which the
+        ingest writer keeps in step with the history, and each device's
+        newest row is then one index seek instead of a scan of the history.
+        """
+        newest = self.model.objects.filter(
+            device_id=models.OuterRef('device_id')
+        ).order_by('-timestamp', '-id').values('id')[:1]
+        devices = DeviceState.objects.all()
+        if device_ids is not None:
+            devices = devices.filter(device_id__in=[str(d) for d in device_ids])
+        return self.filter(id__in=devices.values(newest_id=models.Subquery(newest)))
+
+class SensorData(BinReading):
+    """Every reading received, appended by the ingest writer"""
+
+    objects = SensorDataQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            # Per-device history and latest-reading lookups
+            models.Index(fields=['device_id', 'timestamp'], name='sensordata_device_time'),
+            # Fleet-wide time range queries
+            models.Index(fields=['timestamp'], name='sensordata_time'),
+        ]
+
+class DeviceState(BinReading):
+    """Latest reading for each bin, upserted by the ingest writer"""
+    device_id = models.CharField(max_length=20, unique=True)
+
+    objects = CoordQuerySet.as_manager()
+
+class SensorRollup(models.Model):
+    """Per-device summary of the history over one minute or one hour"""
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTIONS = [(MINUTE, 'Minute'), (HOUR, 'Hour')]
+
+    device_id = models.CharField(max_length=20)
+    resolution = models.CharField(max_length=6, choices=RESOLUTIONS)
+    # Start of the minute or hour
+    bucket = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    # Times the bin went FULL during the bucket
+    full_events = models.IntegerField(default=0)
+    # Seconds spent in each status, as a JSON object
+    status_seconds_json = models.TextField(default='{}')
+    last_status = models.CharField(max_length=20, null=True)
+    last_x = models.FloatField(null=True, blank=True)
+    last_y = models.FloatField(null=True, blank=True)
+    last_seen = models.IntegerField(null=True)
+    last_timestamp = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'device_id', 'bucket'], name='sensorrollup_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket'], name='sensorrollup_resolution_time'),
+        ]
+
+    @property
+    def status_seconds(self):
+        return json.loads(self.status_seconds_json)
+
+    @status_seconds.setter
+    def status_seconds(self, value):
+        self.status_seconds_json = json.dumps(value)
+
+    @property
+    def last_coord(self):
+        if self.last_x is None or self.last_y is None:
+            return None
+        return [self.last_x, self.last_y]
+
+class RollupProgress(models.Model):
+    """High-water mark of a background job over SensorData ids"""
+    # Name of rollup_history()'s mark
+    ROLLUP = 'rollup'
+
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
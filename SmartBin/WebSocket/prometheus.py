@@ -0,0 +1,193 @@
+"""
+Prometheus metric classes for the server, rendered in the text exposition
+format. The gateway ships its own copy in its metrics.py (the two are
+deployed apart, the gateway without Django and the server without the
+gateway scripts); keep the format the same in both.
+
+Recording is an integer add, or a bisect and two adds, with no lock: label
+children are created once and kept by the caller. A rare lost increment
+between threads is an acceptable price for monitoring. Metrics built with
+``function`` are only read when rendered.
+"""
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, for requests, database flushes and channel-layer sends
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+class Registry:
+    """Every metric of one process, rendered together, ``const_labels`` on every series"""
+
+    def __init__(self, const_labels=None):
+        self.metrics = []
+        self.lock = threading.Lock()
+        self.const_labels = dict(const_labels or {})
+
+    def register(self, metric):
+        with self.lock:
+            if any(existing.name == metric.name for existing in self.metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics.append(metric)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class Metric:
+    """A metric family; without label names it records through its single child"""
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.child = self.labels()
+        registry.register(self)
+
+    def labels(self, *values):
+        """The child for these label values, created on first use. Keep it, don't look it up per event."""
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def label_text(self, values, const_labels=None, extra=""):
+        pairs = [f'{name}="{escape(value)}"' for name, value in (const_labels or {}).items()]
+        pairs += [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self, const_labels=None):
+        for values, child in list(self.children.items()):
+            yield f"{self.name}{self.label_text(values, const_labels)} {format_value(child.get())}"
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+class FunctionChild:
+    __slots__ = ("function",)
+
+    def __init__(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function()
+
+class Counter(Metric):
+    """Only goes up. With ``function``, its value is read from function() at scrape time."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        self.function = function
+        super().__init__(name, help, labelnames, registry)
+
+    def new_child(self):
+        return FunctionChild(self.function) if self.function else CounterChild()
+
+    def inc(self, amount=1):
+        self.child.value += amount
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        return self.value
+
+class Gauge(Counter):
+    """Goes up and down. With ``function``, its value is read from function() at scrape time."""
+    kind = "gauge"
+
+    def new_child(self):
+        return FunctionChild(self.function) if self.function else GaugeChild()
+
+    def set(self, value):
+        self.child.value = value
+
+    def dec(self, amount=1):
+        self.child.value -= amount
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf, cumulated when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.child.observe(value)
+
+    def samples(self, const_labels=None):
+        for values, child in list(self.children.items()):
+            total = 0
+            counts = list(child.counts)
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = 'le="%s"' % format_value(bound)
+                yield f"{self.name}_bucket{self.label_text(values, const_labels, le)} {total}"
+            yield f"{self.name}_sum{self.label_text(values, const_labels)} {format_value(child.sum)}"
+            yield f"{self.name}_count{self.label_text(values, const_labels)} {total}"
@@ -0,0 +1,298 @@
+"""
+Minute and hour rollups of the SensorData history, and retention.
+
+rollup_history() folds every SensorData row past a stored high-water mark
+(the last row id processed) into per-device SensorRollup rows: samples,
+seconds spent in each status, how often the bin went FULL and its last
+status, coord and last_seen. Rows can arrive late or be rolled up in several runs, the
+counters are merged into whatever the bucket already holds.
+
+apply_retention() then deletes raw rows that have been rolled up and old
+rollups in small chunks, one short transaction each, so the ingest writer
+is never locked out for long.
+
+Both run from ``python manage.py rollup_history`` or from RollupScheduler
+inside the server process when ROLLUP_INTERVAL is set. Neither runs with
+HISTORY_BACKEND = "binary", there are no SensorData rows to roll up.
+"""
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from .history_api import history_cache
+from .models import RollupProgress, SensorData, SensorRollup
+
+PROGRESS_NAME = RollupProgress.ROLLUP
+FULL_STATUS = "FULL"
+
+# Only one rollup may run at a time in a process
+rollup_lock = threading.Lock()
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def bucket_start(timestamp, resolution):
+    """Start of the minute or hour containing ``timestamp``"""
+    if resolution == SensorRollup.MINUTE:
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class Bucket:
+    """Counters for one (resolution, device, bucket) collected in memory"""
+
+    __slots__ = ("samples", "full_events", "status_seconds", "last_status", "last_x", "last_y", "last_seen",
+                 "last_timestamp")
+
+    def __init__(self):
+        self.samples = 0
+        self.full_events = 0
+        self.status_seconds = {}
+        self.last_status = None
+        self.last_x = None
+        self.last_y = None
+        self.last_seen = None
+        self.last_timestamp = None
+
+    def add_sample(self, timestamp, status, x, y, last_seen, entered_full):
+        self.samples += 1
+        if entered_full:
+            self.full_events += 1
+        if self.last_timestamp is None or timestamp >= self.last_timestamp:
+            self.last_timestamp = timestamp
+            self.last_status = status
+            self.last_x = x
+            self.last_y = y
+            self.last_seen = last_seen
+
+    def add_seconds(self, status, seconds):
+        key = status or "UNKNOWN"
+        self.status_seconds[key] = self.status_seconds.get(key, 0.0) + seconds
+
+    def merge_into(self, rollup):
+        """Add these counters to an existing SensorRollup"""
+        rollup.samples += self.samples
+        rollup.full_events += self.full_events
+        status_seconds = rollup.status_seconds
+        for status, seconds in self.status_seconds.items():
+            status_seconds[status] = status_seconds.get(status, 0.0) + seconds
+        rollup.status_seconds = status_seconds
+        if self.last_timestamp is not None and (
+                rollup.last_timestamp is None or self.last_timestamp >= rollup.last_timestamp):
+            rollup.last_timestamp = self.last_timestamp
+            rollup.last_status = self.last_status
+            rollup.last_x = self.last_x
+            rollup.last_y = self.last_y
+            rollup.last_seen = self.last_seen
+
+def _bucket(buckets, resolution, device_id, timestamp):
+    key = (resolution, device_id, bucket_start(timestamp, resolution))
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = Bucket()
+    return bucket
+
+def _previous_samples(device_ids, last_id):
+    """Newest (timestamp, status) of each device among rows already rolled up, or None"""
+    return {
+        device_id: SensorData.objects.for_device(device_id).filter(id__lte=last_id).values_list(
+            "timestamp", "status").first()
+        for device_id in device_ids
+    }
+
+def _save_buckets(buckets):
+    """Merge in-memory buckets into the SensorRollup table"""
+    by_resolution = {}
+    for (resolution, device_id, start) in buckets:
+        by_resolution.setdefault(resolution, []).append((device_id, start))
+
+    rollups = []
+    for resolution, keys in by_resolution.items():
+        existing = {
+            (rollup.device_id, rollup.bucket): rollup
+            for rollup in SensorRollup.objects.filter(
+                resolution=resolution,
+                device_id__in={device_id for device_id, _ in keys},
+                bucket__gte=min(start for _, start in keys),
+                bucket__lte=max(start for _, start in keys),
+            )
+        }
+        for device_id, start in keys:
+            rollup = existing.get((device_id, start))
+            if rollup is None:
+                rollup = SensorRollup(device_id=device_id, resolution=resolution, bucket=start)
+            buckets[(resolution, device_id, start)].merge_into(rollup)
+            rollups.append(rollup)
+
+    SensorRollup.objects.bulk_create(
+        rollups,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["resolution", "device_id", "bucket"],
+        update_fields=["samples", "full_events", "status_seconds_json",
+                       "last_status", "last_x", "last_y", "last_seen", "last_timestamp"],
+    )
+
+def rollup_history(batch_size=None, max_gap=None):
+    """
+    Fold new SensorData rows into minute and hour rollups, ``batch_size``
+    rows per transaction. Returns the number of rows processed.
+
+    The status a bin reported is credited with the time until its next
+    report, capped at ``max_gap`` seconds so a bin that went quiet doesn't
+    accumulate hours in its last status.
+    """
+    batch_size = batch_size or _setting("ROLLUP_BATCH_SIZE", 10000)
+    max_gap = max_gap if max_gap is not None else _setting("ROLLUP_MAX_GAP", 30)
+    resolutions = (SensorRollup.MINUTE, SensorRollup.HOUR)
+
+    with rollup_lock:
+        progress, _ = RollupProgress.objects.get_or_create(name=PROGRESS_NAME)
+        last_id = progress.last_id
+        previous = {}  # device_id -> (timestamp, status) of its newest row seen
+        processed = 0
+
+        while True:
+            rows = list(
+                SensorData.objects.filter(id__gt=last_id).order_by("id").values_list(
+                    "id", "device_id", "timestamp", "status", "x", "y", "last_seen")[:batch_size]
+            )
+            if not rows:
+                break
+            unseen = {row[1] for row in rows if row[1] not in previous}
+            previous.update(_previous_samples(unseen, last_id))
+
+            buckets = {}
+            for _, device_id, timestamp, status, x, y, last_seen in rows:
+                prior = previous.get(device_id)
+                entered_full = status == FULL_STATUS
+                if prior is not None:
+                    prior_timestamp, prior_status = prior
+                    entered_full = entered_full and prior_status != FULL_STATUS
+                    if timestamp < prior_timestamp:
+                        # Arrived out of order, count it but leave the timeline alone
+                        for resolution in resolutions:
+                            _bucket(buckets, resolution, device_id, timestamp).add_sample(
+                                timestamp, status, x, y, last_seen, False)
+                        continue
+                    held = min((timestamp - prior_timestamp).total_seconds(), max_gap)
+                    if held > 0:
+                        for resolution in resolutions:
+                            _bucket(buckets, resolution, device_id, prior_timestamp).add_seconds(prior_status, held)
+
+                for resolution in resolutions:
+                    _bucket(buckets, resolution, device_id, timestamp).add_sample(
+                        timestamp, status, x, y, last_seen, entered_full)
+                previous[device_id] = (timestamp, status)
+
+            last_id = rows[-1][0]
+            with transaction.atomic():
+                _save_buckets(buckets)
+                RollupProgress.objects.filter(name=PROGRESS_NAME).update(last_id=last_id)
+            processed += len(rows)
+            if len(rows) < batch_size:
+                break
+        return processed
+
+def _delete_in_chunks(queryset, chunk_size, pause):
+    """Delete matching rows ``chunk_size`` at a time, returns how many went"""
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by().values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            # Give the ingest writer a turn at the database
+            time.sleep(pause)
+
+def apply_retention(now=None, chunk_size=None, pause=None):
+    """
+    Delete raw rows older than RETENTION_RAW_DAYS that have been rolled up,
+    and rollups older than RETENTION_MINUTE_DAYS / RETENTION_HOUR_DAYS
+    (None keeps them forever). Returns {kind: rows deleted}.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or _setting("RETENTION_DELETE_CHUNK", 5000)
+    pause = pause if pause is not None else _setting("RETENTION_DELETE_PAUSE", 0.05)
+    deleted = {}
+
+    raw_days = _setting("RETENTION_RAW_DAYS", 7)
+    if raw_days is not None:
+        progress = RollupProgress.objects.filter(name=PROGRESS_NAME).first()
+        rolled_up = progress.last_id if progress else 0
+        deleted["raw"] = _delete_in_chunks(
+            SensorData.objects.filter(timestamp__lt=now - timedelta(days=raw_days), id__lte=rolled_up),
+            chunk_size, pause,
+        )
+
+    for resolution, setting in ((SensorRollup.MINUTE, "RETENTION_MINUTE_DAYS"),
+                                (SensorRollup.HOUR, "RETENTION_HOUR_DAYS")):
+        days = _setting(setting, None)
+        if days is not None:
+            deleted[resolution] = _delete_in_chunks(
+                SensorRollup.objects.filter(resolution=resolution, bucket__lt=now - timedelta(days=days)),
+                chunk_size, pause,
+            )
+    if deleted.get("raw"):
+        history_cache.retention_changed()
+    return deleted
+
+def compact(vacuum=False):
+    """Give the space freed by retention back to the file system (SQLite only)"""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        if vacuum:
+            # Rewrites the whole file and blocks writers while it runs
+            cursor.execute("VACUUM")
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def run_maintenance():
+    """One rollup pass followed by retention, returns a summary dict"""
+    started = time.perf_counter()
+    summary = {"rolled_up": rollup_history()}
+    summary["deleted"] = apply_retention()
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+class RollupScheduler:
+    """Runs run_maintenance() every ``interval`` seconds in a background thread"""
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.last_summary = None
+
+    def start(self):
+        """Start the thread if the scheduler is enabled and not running yet"""
+        if self.interval is None or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="rollup-scheduler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                close_old_connections()
+                self.last_summary = run_maintenance()
+            except Exception as e:
+                print(f"Rollup scheduler: {e}")
+        connection.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+def rollups_available():
+    """Rollups read SensorData, which the binary history backend doesn't write"""
+    return _setting("HISTORY_BACKEND", "sqlite") == "sqlite"
+
+# Started by the ingest path on first use when ROLLUP_INTERVAL is set, in
+# the first server process only
+rollup_scheduler = RollupScheduler(
+    _setting("ROLLUP_INTERVAL", None) if _setting("SERVER_WORKER", 0) == 0 and rollups_available() else None)
@@ -1,6 +1,9 @@
 from django.urls import re_path
-from .consumers import DashboardConsumer
+from .consumers import BinConsumer, DashboardConsumer, GatewayConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/dashboard/$", DashboardConsumer.as_asgi()),
+    re_path(r"ws/bin/(?P<bin_id>[A-Za-z0-9_.-]+)/$", BinConsumer.as_asgi()),
+    re_path(r"ws/bins/$", BinConsumer.as_asgi()),
+    re_path(r"ws/gateway/$", GatewayConsumer.as_asgi()),
 ]
\ No newline at end of file
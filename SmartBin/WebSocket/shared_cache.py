@@ -0,0 +1,67 @@
+"""
+Values shared between server processes through a Django cache.
+
+The cache API has no compare-and-set, so update() builds one from add(),
+which only one process can win for a given key. A value is stored as
+(record id, version, value); a process that wants to replace version N
+first adds the claim key of (key, record id, N), and only the process that
+added it writes version N + 1. The others read the value again and retry.
+The record id is new whenever a key is created, so claims left behind by
+an evicted key can't block its successor.
+"""
+import time
+import uuid
+
+CLAIM_KEY = "shared_cache:claim:%s:%s:%d"
+# A claim only has to outlive the write that follows it. If its process
+# dies in between, the key can't change again until the claim expires.
+CLAIM_TIMEOUT = 30
+UPDATE_ATTEMPTS = 50
+
+class Contention(RuntimeError):
+    """update() kept losing the claim to other processes"""
+
+def increment(cache, key):
+    """Atomically add one to a counter in ``cache``, returns the new value"""
+    if cache.add(key, 1, timeout=None):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+def get_versioned(cache, keys):
+    """{key: (version, value)} for those of ``keys`` that are stored, versions only compare for equality"""
+    stored = cache.get_many(list(keys))
+    return {key: ((record_id, version), value) for key, (record_id, version, value) in stored.items()}
+
+def get_many(cache, keys):
+    """{key: value} for those of ``keys`` that are stored"""
+    return {key: value for key, (_, value) in get_versioned(cache, keys).items()}
+
+def update(cache, key, change):
+    """
+    Replace the value of ``key`` with change(current value, None if unset),
+    unless that returns None. ``change`` may be called several times, once
+    per attempt, and must not modify the value it is given. Returns the
+    value now stored.
+    """
+    for attempt in range(UPDATE_ATTEMPTS):
+        stored = cache.get(key)
+        if stored is None:
+            value = change(None)
+            if value is None or cache.add(key, (uuid.uuid4().hex, 0, value), timeout=None):
+                return value
+        else:
+            record_id, version, current = stored
+            value = change(current)
+            if value is None:
+                return current
+            if cache.add(CLAIM_KEY % (key, record_id, version), 1, timeout=CLAIM_TIMEOUT):
+                cache.set(key, (record_id, version + 1, value), timeout=None)
+                return value
+        # Another process changed it first, or is about to
+        time.sleep(min(0.001 * 2 ** attempt, 0.05))
+    raise Contention(f"Gave up changing {key} after {UPDATE_ATTEMPTS} attempts")
@@ -0,0 +1,131 @@
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import caches
+
+# Message types sent by central.py in delta upload mode
+FULL = "full"
+DELTA = "delta"
+
+# accepted: the message was applied (or was a harmless repeat).
+# changed: {bin_id: bin dict} for bins that are new or different.
+# state: the gateway's whole merged state after the message, not to be changed.
+# seq: the last sequence number applied for the gateway.
+# duplicate: the message had already been applied, nothing was done.
+SyncResult = namedtuple("SyncResult", ["accepted", "changed", "state", "seq", "duplicate"])
+
+# With a cache alias: a gateway's record, and which seq was applied on top
+# of (gateway, epoch, seq). The worker that adds the claim is the one that
+# moves the gateway on from that seq, so workers compare-and-set the seq.
+STATE_KEY = "gateway_state:%s"
+CLAIM_KEY = "gateway_state:claim:%s:%s:%d"
+# Claims only have to outlive the record write that follows them
+CLAIM_TIMEOUT = 600
+# Keyframes are applied again on top of what another worker just stored
+FULL_ATTEMPTS = 5
+
+def is_sync_message(data):
+    """Tell a sequenced upload apart from a plain {bin_id: {...}} snapshot"""
+    return isinstance(data, dict) and "seq" in data and isinstance(data.get("bins"), dict)
+
+def snapshot_bins(data):
+    """
+    (gateway id, bins) of a plain snapshot, either {"gateway": id, "bins":
+    {bin_id: {...}}} or, from gateways that don't name themselves, just
+    {bin_id: {...}} with gateway id ""
+    """
+    if isinstance(data.get("gateway"), str) and isinstance(data.get("bins"), dict):
+        return data["gateway"], data["bins"]
+    return "", data
+
+class GatewayStates:
+    """
+    Last applied sequence number and merged bin state for each gateway.
+
+    Deltas only apply on top of the exact state they were computed from
+    (``base_seq``); anything else is refused so the gateway resends a keyframe.
+    Sequence numbers are scoped to the gateway's ``epoch`` (one per gateway
+    run), so replays of messages already applied can be recognised.
+
+    With ``cache_alias`` the records live in that Django cache, so a delta
+    can follow on from its base on whichever server process it reaches.
+    Records are never changed in place: a message stores a new one, and
+    only after winning the claim on the seq it was applied on top of.
+    Otherwise they are local to this process.
+    """
+
+    def __init__(self, cache_alias=None):
+        self.cache_alias = cache_alias
+        # gateway id -> {"epoch": ..., "seq": int, "bins": {bin_id: dict}}
+        self.gateways = {}
+        self.lock = threading.Lock()
+
+    def apply(self, message):
+        gateway_id = str(message.get("gateway", ""))
+        seq = message["seq"]
+        if not isinstance(seq, int) or isinstance(seq, bool):
+            raise ValueError("seq must be an integer")
+
+        if self.cache_alias:
+            return self._apply_shared(gateway_id, message)
+        with self.lock:
+            result, record = self._step(self.gateways.get(gateway_id), message)
+            if record is not None:
+                self.gateways[gateway_id] = record
+            return result
+
+    def _step(self, gateway, message):
+        """(SyncResult, the gateway's new record or None) for ``message`` on top of ``gateway``"""
+        epoch = message.get("epoch")
+        seq = message["seq"]
+        bins = message["bins"]
+        same_run = gateway is not None and gateway["epoch"] == epoch
+
+        if same_run and seq <= gateway["seq"]:
+            # A retry of a message we already applied, the ack was lost
+            return SyncResult(True, {}, gateway["bins"], gateway["seq"], True), None
+
+        if message.get("type") == FULL:
+            previous = gateway["bins"] if gateway else {}
+            changed = {b: data for b, data in bins.items() if previous.get(b) != data}
+            record = {"epoch": epoch, "seq": seq, "bins": dict(bins)}
+            return SyncResult(True, changed, record["bins"], seq, False), record
+
+        if not same_run or message.get("base_seq") != gateway["seq"]:
+            return SyncResult(False, {}, None, gateway["seq"] if same_run else None, False), None
+
+        current = dict(gateway["bins"])
+        changed = {b: data for b, data in bins.items() if current.get(b) != data}
+        current.update(bins)
+        record = {"epoch": epoch, "seq": seq, "bins": current}
+        return SyncResult(True, changed, current, seq, False), record
+
+    def _apply_shared(self, gateway_id, message):
+        cache = caches[self.cache_alias]
+        key = STATE_KEY % gateway_id
+        for _ in range(FULL_ATTEMPTS):
+            gateway = cache.get(key)
+            result, record = self._step(gateway, message)
+            if record is None:
+                return result
+            if gateway is None or gateway["epoch"] != record["epoch"]:
+                # A new run starts from a keyframe, there is no seq to claim
+                cache.set(key, record, timeout=None)
+                return result
+            claim = CLAIM_KEY % (gateway_id, gateway["epoch"], gateway["seq"])
+            if cache.add(claim, record["seq"], timeout=CLAIM_TIMEOUT):
+                cache.set(key, record, timeout=None)
+                return result
+            # Another worker moved the gateway on from the seq we read
+            if cache.get(claim) == record["seq"]:
+                # With this very message, a retry that reached two workers
+                return SyncResult(True, {}, record["bins"], record["seq"], True)
+            if message.get("type") != FULL:
+                current = cache.get(key)
+                same_run = current is not None and current["epoch"] == record["epoch"]
+                return SyncResult(False, {}, None, current["seq"] if same_run else None, False)
+        raise RuntimeError(f"Gateway {gateway_id}: keyframe {message['seq']} lost the claim {FULL_ATTEMPTS} times")
+
+# Shared by every request handled by this process, and between processes
+# with GATEWAY_STATE_CACHE set
+gateway_states = GatewayStates(getattr(settings, "GATEWAY_STATE_CACHE", None))
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest import mock
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from ..broadcast import DASHBOARD_GROUP, dashboard_event
+from ..consumers import DashboardConsumer
+from ..fleet_state import FleetState
+from ..metrics import FRAMES_RESYNCED
+
+class SlowDashboard(DashboardConsumer):
+    """A dashboard on a slow link, so frames queue up behind the one being sent"""
+
+    async def send(self, *args, **kwargs):
+        await asyncio.sleep(0.05)
+        await super().send(*args, **kwargs)
+
+class CrowdedDashboard(SlowDashboard):
+    """A slow dashboard with room for a single queued source"""
+    max_pending = 1
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class DashboardQueueTests(TransactionTestCase):
+    """What a client that falls behind is sent"""
+
+    @asynccontextmanager
+    async def connect(self, consumer_class):
+        communicator = WebsocketCommunicator(consumer_class.as_asgi(), "/ws/dashboard/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        try:
+            yield communicator
+        finally:
+            await communicator.disconnect()
+
+    async def broadcast(self, source, bins):
+        # Without going through ingest, so the fleet state has none of these
+        await get_channel_layer().group_send(DASHBOARD_GROUP, dashboard_event(bins, source, partial=True))
+
+    async def receive_until(self, communicator, expected):
+        """Frames received until the bins in ``expected`` have those values"""
+        frames = []
+        seen = {}
+        while any(seen.get(bin_id) != values for bin_id, values in expected.items()):
+            frames.append(json.loads(await communicator.receive_from(timeout=5)))
+            seen.update(frames[-1])
+        return frames
+
+    async def test_partial_frames_merge_per_bin(self):
+        async with self.connect(SlowDashboard) as communicator:
+            resyncs = FRAMES_RESYNCED.child.value
+            await self.broadcast("merge-gw", {"merge-1": {"last_seen": 0}})
+            # Queued behind the first one, which is still being sent
+            await self.broadcast("merge-gw", {"merge-1": {"last_seen": 1}, "merge-2": {"status": "OK"}})
+            await self.broadcast("merge-gw", {"merge-1": {"last_seen": 2}})
+            merged = {"merge-1": {"last_seen": 2}, "merge-2": {"status": "OK"}}
+            frames = await self.receive_until(communicator, merged)
+            self.assertEqual(frames[-1], merged)
+            self.assertLessEqual(len(frames), 2)
+            self.assertEqual(FRAMES_RESYNCED.child.value, resyncs)
+
+    async def test_overflow_resyncs_without_losing_queued_bins(self):
+        async with self.connect(CrowdedDashboard) as communicator:
+            resyncs = FRAMES_RESYNCED.child.value
+            await self.broadcast("overflow-a", {"overflow-1": {"last_seen": 0}})
+            await self.broadcast("overflow-b", {"overflow-2": {"last_seen": 0}})
+            await self.broadcast("overflow-c", {"overflow-3": {"last_seen": 0}})
+            # The fleet state doesn't have the bin still queued when the others were dropped
+            await self.receive_until(communicator, {"overflow-3": {"last_seen": 0}})
+            self.assertEqual(FRAMES_RESYNCED.child.value, resyncs + 1)
+
+    async def test_client_asks_for_resync(self):
+        state = FleetState()
+        await asyncio.to_thread(state.update, {"asked-gw": {"asked-1": {"status": "FULL"}}})
+        with mock.patch("WebSocket.consumers.fleet_state", state):
+            async with self.connect(DashboardConsumer) as communicator:
+                snapshot = json.loads(await communicator.receive_from(timeout=5))
+                self.assertEqual(snapshot["asked-1"], {"status": "FULL"})
+                await communicator.send_to(text_data=json.dumps({"resync": True}))
+                self.assertEqual(json.loads(await communicator.receive_from(timeout=5)), snapshot)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from django.test import TestCase
+from ..history_api import decode_cursor, downsample, page
+from ..models import SensorData
+from ..rollups import rollup_history
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+END = START + timedelta(hours=2)
+
+def add_readings(first, count, devices=("1", "2", "3")):
+    """A reading from every device each 5 s, every seventh one FULL"""
+    SensorData.objects.bulk_create(
+        SensorData(device_id=device_id, timestamp=START + timedelta(seconds=5 * i), last_seen=i % 60,
+                   status="FULL" if i % 7 == 0 else "OK", x=float(i), y=float(-i))
+        for i in range(first, first + count) for device_id in devices)
+
+class DownsampleTests(TestCase):
+    def setUp(self):
+        add_readings(0, 1200)
+
+    def test_rollups_answer_as_the_raw_rows_did(self):
+        queries = [dict(device_id="2", points=24), dict(device_id="2", points=2), dict(points=24),
+                   dict(device_ids=["1", "3"], points=8)]
+        raw = [downsample(start=START, end=END, **query) for query in queries]
+        rollup_history()
+        # Retention may delete the raw rows once they are rolled up
+        SensorData.objects.all().delete()
+        for query, expected in zip(queries, raw):
+            self.assertEqual(downsample(start=START, end=END, **query), expected, query)
+
+    def test_rows_past_the_rollups_are_read_raw(self):
+        rollup_history()
+        add_readings(1200, 60)
+        add_readings(1300, 1, devices=("2",))
+        # A late reading from before the rolled up rows ended
+        SensorData.objects.create(device_id="2", timestamp=START + timedelta(seconds=1), status="FULL")
+        points = downsample("2", start=START, end=END + timedelta(hours=1), points=3)["points"]
+        self.assertEqual([point["samples"] for point in points], [720 + 1, 480 + 61])
+        self.assertEqual(points[1]["reading_timestamp"], (START + timedelta(seconds=5 * 1300)).isoformat())
+        self.assertEqual(points[1]["last_seen"], 1300 % 60)
+
+    def test_sub_minute_buckets_read_raw_rows(self):
+        rollup_history()
+        points = downsample("1", start=START, end=START + timedelta(minutes=1), points=4)
+        self.assertEqual(points["bucket_seconds"], 15)
+        self.assertEqual([point["samples"] for point in points["points"]], [3, 3, 3, 3])
+        self.assertEqual(points["points"][0]["coord"], [2.0, -2.0])
+
+class PageTests(TestCase):
+    def setUp(self):
+        # Several readings share each timestamp
+        SensorData.objects.bulk_create(
+            SensorData(device_id=str(i % 3), timestamp=START + timedelta(seconds=i // 6), last_seen=i)
+            for i in range(60))
+
+    def all_pages(self, limit, **query):
+        readings, cursor = [], None
+        while True:
+            found = page(limit=limit, cursor=cursor, **query)
+            readings += found["readings"]
+            cursor = found["next"]
+            if cursor is None:
+                return readings
+
+    def test_pages_cover_the_history_once_newest_first(self):
+        everything = [(row.device_id, row.last_seen) for row in SensorData.objects.order_by("-timestamp", "-id")]
+        for limit in (1, 7, 60, 100):
+            readings = self.all_pages(limit)
+            self.assertEqual([(r["device_id"], r["last_seen"]) for r in readings], everything, limit)
+        one_bin = self.all_pages(4, device_id="1", start=START + timedelta(seconds=2), end=START + timedelta(seconds=8))
+        self.assertEqual([r["last_seen"] for r in one_bin], list(range(46, 12, -3)))
+        self.assertNotIn("device_id", one_bin[0])
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first = page(limit=10)
+        SensorData.objects.bulk_create(
+            SensorData(device_id="0", timestamp=START + timedelta(seconds=20), last_seen=100 + i) for i in range(5))
+        second = page(limit=10, cursor=first["next"])
+        self.assertEqual([r["last_seen"] for r in second["readings"]], list(range(49, 39, -1)))
+
+    def test_bad_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from django.test import SimpleTestCase
+from ..history_log import HistoryLog
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def readings(device_id, count, first=0, status="OK"):
+    return [(device_id, START + timedelta(seconds=first + i), status, [i, -i], i) for i in range(count)]
+
+class HistoryLogTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def open_log(self, segment_records=4):
+        log = HistoryLog(self.directory.name, segment_records)
+        self.addCleanup(log.close)
+        return log
+
+    def test_full_segments_are_sealed_and_reopened(self):
+        log = self.open_log()
+        log.append(readings("bin-1", 6) + readings("bin-2", 3))
+        log.close()
+        self.assertEqual(sorted(n for n in os.listdir(self.directory.name) if n.endswith(".idx")),
+                         ["segment-00000000.idx", "segment-00000001.idx"])
+
+        log = self.open_log()
+        self.assertEqual(len(log), 9)
+        records = log.scan("bin-1", START + timedelta(seconds=1), START + timedelta(seconds=5))
+        self.assertEqual([r.last_seen for r in records], [1, 2, 3, 4])
+        self.assertEqual(records[0].coord, [1.0, -1.0])
+        # The reopened active segment takes appends where it left off
+        log.append(readings("bin-2", 1, first=3))
+        self.assertEqual([r.last_seen for r in log.scan("bin-2")], [0, 1, 2, 0])
+        self.assertEqual(len(list(log.iter_all())), 10)
+
+    def test_sealing_while_iterating(self):
+        log = self.open_log()
+        log.append(readings("bin-1", 6))
+        records = log.iter_all()
+        self.assertEqual(next(records).last_seen, 0)
+        self.assertEqual([next(records).last_seen for _ in range(4)], [1, 2, 3, 4])
+        # Fills and seals the segment being walked, which closes the log's map of it
+        log.append(readings("bin-1", 3, first=6))
+        self.assertEqual([r.last_seen for r in records], [5])
+        self.assertEqual(len(list(log.iter_all())), 9)
+
+    def test_bad_reading_stores_nothing(self):
+        log = self.open_log()
+        batch = readings("bin-1", 2) + [("bin-2", START, "OK", None, "soon")]
+        with self.assertRaises(ValueError):
+            log.append(batch)
+        self.assertEqual(len(log), 0)
+        self.assertEqual(log.scan("bin-2"), [])
+
+    def test_older_readings_scan_in_time_order(self):
+        log = self.open_log()
+        log.append(readings("bin-1", 5, first=10))
+        log.append(readings("bin-1", 2, first=0, status="FULL"))
+        records = log.scan("bin-1")
+        self.assertEqual([r.timestamp for r in records], sorted(r.timestamp for r in records))
+        self.assertEqual([r.status for r in records[:2]], ["FULL", "FULL"])
@@ -0,0 +1,95 @@
+import threading
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from ..merge import RECORD_KEY, BinMerger
+
+MERGE_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    # Every update leaves a claim behind, more than the default 300 entries
+    "fleet": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "merge-tests",
+              "OPTIONS": {"MAX_ENTRIES": 100_000}},
+}
+
+NOW = 1_000_000.0
+
+class BinMergerTests(SimpleTestCase):
+    """One process's merger"""
+
+    def make_workers(self):
+        return [BinMerger(clock=lambda: NOW)]
+
+    def setUp(self):
+        self.workers = self.make_workers()
+
+    def worker(self, number):
+        return self.workers[number % len(self.workers)]
+
+    def test_fresher_gateway_takes_the_bin(self):
+        changed, owners = self.worker(0).merge("gw-a", {"1": {"status": "OK", "last_seen": 30}})
+        self.assertEqual(changed, {"1": {"status": "OK", "last_seen": 30, "gateway": "gw-a"}})
+        self.assertEqual(owners, {"gw-a"})
+        # 27 s fresher than gw-a's report, more than FRESHNESS_SLACK
+        changed, owners = self.worker(1).merge("gw-b", {"1": {"status": "FULL", "last_seen": 3}})
+        self.assertEqual(changed["1"]["gateway"], "gw-b")
+        self.assertEqual(owners, {"gw-a", "gw-b"})
+        for worker in self.workers:
+            self.assertEqual(worker.owned_state("gw-a"), {})
+            self.assertEqual(worker.owned_state("gw-b"), {"1": {"status": "FULL", "last_seen": 3, "gateway": "gw-b"}})
+        # The same report again changes nothing, on either worker
+        self.assertEqual(self.worker(0).merge("gw-b", {"1": {"status": "FULL", "last_seen": 3}}), ({}, set()))
+
+    def test_owner_keeps_the_bin_within_the_slack(self):
+        self.worker(0).merge("gw-a", {"1": {"status": "OK", "last_seen": 5}})
+        changed, _ = self.worker(1).merge("gw-b", {"1": {"status": "FULL", "last_seen": 0}})
+        self.assertEqual(changed, {})
+        self.assertEqual(set(self.worker(1).owned_state("gw-a")), {"1"})
+
+    def test_best_position_from_another_gateway(self):
+        self.worker(0).merge("gw-a", {"1": {"status": "OK", "last_seen": 0, "coord": [1, 1], "coord_error": 5.0}})
+        changed, owners = self.worker(1).merge(
+            "gw-b", {"1": {"status": "OK", "last_seen": 4, "coord": [2, 2], "coord_error": 1.0}})
+        self.assertEqual(changed["1"]["gateway"], "gw-a")
+        self.assertEqual((changed["1"]["coord"], changed["1"]["coord_error"]), ([2, 2], 1.0))
+        self.assertEqual(owners, {"gw-a"})
+
+    def test_publish_hands_on_owned_bins(self):
+        self.worker(0).merge("gw-a", {"1": {"status": "OK", "last_seen": 0}, "2": {"status": "OK", "last_seen": 0}})
+        self.worker(1).merge("gw-b", {"2": {"status": "FULL", "last_seen": 0}})
+        published = {}
+        self.worker(1).publish({"gw-a", "gw-b", "gw-c"}, published.update)
+        self.assertEqual({gateway: set(bins) for gateway, bins in published.items()},
+                         {"gw-a": {"1", "2"}, "gw-b": set(), "gw-c": set()})
+
+@override_settings(CACHES=MERGE_CACHES)
+class SharedBinMergerTests(BinMergerTests):
+    """Two workers whose mergers share the "fleet" cache"""
+
+    def make_workers(self):
+        caches["fleet"].clear()
+        return [BinMerger(clock=lambda: NOW, cache_alias="fleet"), BinMerger(clock=lambda: NOW, cache_alias="fleet")]
+
+    def test_concurrent_handovers_leave_one_owner_per_bin(self):
+        bins = [str(number) for number in range(20)]
+        rounds = 10
+
+        def report(worker, gateway, offset):
+            for turn in range(rounds):
+                # Each gateway in turn hears every bin most recently
+                last_seen = 0 if (turn + offset) % 2 else 60
+                worker.merge(gateway, {bin_id: {"status": "OK", "last_seen": last_seen + turn} for bin_id in bins},
+                             now=NOW + turn * 100)
+
+        threads = [threading.Thread(target=report, args=(self.workers[0], "gw-a", 0)),
+                   threading.Thread(target=report, args=(self.workers[1], "gw-b", 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        records = caches["fleet"].get_many([RECORD_KEY % bin_id for bin_id in bins])
+        owned = {gateway: self.workers[0].owned_state(gateway) for gateway in ("gw-a", "gw-b")}
+        for bin_id in bins:
+            _, _, record = records[RECORD_KEY % bin_id]
+            owners = [gateway for gateway, state in owned.items() if bin_id in state]
+            self.assertEqual(owners, [record["owner"]])
+            self.assertEqual(owned[record["owner"]][bin_id], record["merged"])
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta, timezone
+from django.test import TestCase
+from ..models import DeviceState, SensorData
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+class LatestPerDeviceTests(TestCase):
+    def setUp(self):
+        rows = []
+        for device_id, count in (("1", 3), ("2", 5), ("3", 1)):
+            rows += [SensorData(device_id=device_id, timestamp=START + timedelta(seconds=i), last_seen=i)
+                     for i in range(count)]
+        # Two readings of bin 2 in the same instant, the later row wins
+        rows.append(SensorData(device_id="2", timestamp=START + timedelta(seconds=4), last_seen=40))
+        SensorData.objects.bulk_create(rows)
+        # The ingest writer's latest-state rows, bin 4 has no history left
+        DeviceState.objects.bulk_create(DeviceState(device_id=device_id) for device_id in ("1", "2", "3", "4"))
+
+    def latest(self, rows):
+        return {row.device_id: row.last_seen for row in rows}
+
+    def test_newest_row_of_every_device(self):
+        self.assertEqual(self.latest(SensorData.objects.latest_per_device()), {"1": 2, "2": 40, "3": 0})
+
+    def test_some_devices(self):
+        # Ids may come in as numbers
+        self.assertEqual(self.latest(SensorData.objects.latest_per_device([2, "3", "9"])), {"2": 40, "3": 0})
+        self.assertEqual(self.latest(SensorData.objects.latest_per_device([])), {})
+
+    def test_matches_the_per_device_lookup(self):
+        for row in SensorData.objects.latest_per_device():
+            self.assertEqual(row, SensorData.objects.latest_for(row.device_id))
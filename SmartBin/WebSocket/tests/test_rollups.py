@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+from django.test import TestCase, override_settings
+from ..models import RollupProgress, SensorData, SensorRollup
+from ..rollups import apply_retention, rollup_history
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def add_readings(statuses, device_id="1", first=0, step=10):
+    SensorData.objects.bulk_create(
+        SensorData(device_id=device_id, timestamp=START + timedelta(seconds=first + step * i), status=status,
+                   last_seen=i, x=float(i), y=0.0)
+        for i, status in enumerate(statuses))
+
+def rollups(resolution=SensorRollup.MINUTE):
+    return {(rollup.device_id, rollup.bucket): (rollup.samples, rollup.full_events, rollup.status_seconds,
+                                                rollup.last_status, rollup.last_seen)
+            for rollup in SensorRollup.objects.filter(resolution=resolution)}
+
+class RollupHistoryTests(TestCase):
+    def test_running_again_changes_nothing(self):
+        add_readings(["OK", "OK", "FULL", "FULL", "OK", "FULL", "OK", "OK"])
+        self.assertEqual(rollup_history(), 8)
+        minutes = rollups()
+        self.assertEqual(minutes, {
+            ("1", START): (6, 2, {"OK": 30.0, "FULL": 30.0}, "FULL", 5),
+            # The last FULL reading's 10 s count in the minute it was sent
+            ("1", START + timedelta(minutes=1)): (2, 0, {"OK": 10.0}, "OK", 7),
+        })
+        self.assertEqual(rollup_history(), 0)
+        self.assertEqual(rollups(), minutes)
+        self.assertEqual(rollups(SensorRollup.HOUR), {("1", START): (8, 2, {"OK": 40.0, "FULL": 30.0}, "OK", 7)})
+
+    def test_batches_and_runs_add_up_to_one_run(self):
+        statuses = ["OK", "FULL", "FULL", "OK"] * 10
+        # A few rows at a time, in a run before the rest of the rows arrive and one after
+        add_readings(statuses[:25], device_id="1")
+        add_readings(statuses[:15], device_id="2", first=5)
+        self.assertEqual(rollup_history(batch_size=7), 40)
+        add_readings(statuses[25:], device_id="1", first=250)
+        add_readings(statuses[15:], device_id="2", first=155)
+        self.assertEqual(rollup_history(batch_size=7), 40)
+        incremental = rollups(), rollups(SensorRollup.HOUR)
+
+        SensorRollup.objects.all().delete()
+        RollupProgress.objects.all().delete()
+        self.assertEqual(rollup_history(), 80)
+        self.assertEqual((rollups(), rollups(SensorRollup.HOUR)), incremental)
+
+    def test_late_rows_merge_into_their_bucket(self):
+        add_readings(["OK", "OK"])
+        rollup_history()
+        # Arrives after the rollup, from before the newest rolled up reading
+        SensorData.objects.create(device_id="1", timestamp=START + timedelta(seconds=5), status="FULL", last_seen=9)
+        rollup_history()
+        self.assertEqual(rollups()[("1", START)], (3, 0, {"OK": 10.0}, "OK", 1))
+
+    @override_settings(RETENTION_RAW_DAYS=1)
+    def test_retention_only_deletes_rolled_up_rows(self):
+        add_readings(["OK"] * 5)
+        rollup_history()
+        add_readings(["FULL"] * 3, first=100)
+        deleted = apply_retention(now=START + timedelta(days=2), pause=0)
+        self.assertEqual(deleted["raw"], 5)
+        self.assertEqual(SensorData.objects.count(), 3)
@@ -0,0 +1,101 @@
+import json
+from unittest import mock
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from ..sync import DELTA, FULL, GatewayStates
+from ..writer import ingest_writer
+
+GATEWAY_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "fleet": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "gateway-state-tests"},
+}
+
+def keyframe(seq, bins, epoch="run-1", gateway="gw-1"):
+    return {"gateway": gateway, "epoch": epoch, "type": FULL, "seq": seq, "bins": bins}
+
+def delta(seq, bins, base_seq=None, epoch="run-1", gateway="gw-1"):
+    return {"gateway": gateway, "epoch": epoch, "type": DELTA, "seq": seq,
+            "base_seq": seq - 1 if base_seq is None else base_seq, "bins": bins}
+
+@override_settings(CACHES=GATEWAY_CACHES)
+class SharedGatewayStatesTests(SimpleTestCase):
+    """One gateway's deltas spread over two workers sharing a cache"""
+
+    def setUp(self):
+        caches["fleet"].clear()
+        self.workers = [GatewayStates("fleet"), GatewayStates("fleet")]
+
+    def test_deltas_follow_on_across_workers(self):
+        messages = [keyframe(1, {"1": {"status": "OK"}, "2": {"status": "OK"}})]
+        messages += [delta(seq, {str(seq % 2 + 1): {"status": "FULL", "last_seen": seq}}) for seq in range(2, 12)]
+        for number, message in enumerate(messages):
+            result = self.workers[number % 2].apply(message)
+            self.assertTrue(result.accepted, message)
+            self.assertFalse(result.duplicate)
+            self.assertEqual(result.seq, message["seq"])
+        self.assertEqual(result.state, {"1": {"status": "FULL", "last_seen": 10},
+                                        "2": {"status": "FULL", "last_seen": 11}})
+
+        # The retry of a delta the other worker applied is acked, not applied again
+        retry = self.workers[1].apply(messages[-1])
+        self.assertEqual((retry.accepted, retry.duplicate, retry.changed), (True, True, {}))
+        # A delta that skips one is refused by either worker
+        for worker in self.workers:
+            result = worker.apply(delta(13, {"1": {"status": "OK"}}, base_seq=12))
+            self.assertEqual((result.accepted, result.seq), (False, 11))
+
+    def test_a_retry_racing_its_original_is_a_duplicate(self):
+        self.workers[0].apply(keyframe(1, {"1": {"status": "OK"}}))
+        message = delta(2, {"1": {"status": "FULL"}})
+        cache = caches["fleet"]
+        stale = cache.get("gateway_state:gw-1")
+        self.assertTrue(self.workers[0].apply(message).accepted)
+        # The second worker read the record before the first stored seq 2
+        get = cache.get
+        with mock.patch.object(cache, "get", side_effect=lambda key, *args: stale if key == "gateway_state:gw-1"
+                               else get(key, *args)):
+            result = self.workers[1].apply(message)
+        self.assertEqual((result.accepted, result.duplicate, result.seq), (True, True, 2))
+        self.assertEqual(cache.get("gateway_state:gw-1")["bins"], {"1": {"status": "FULL"}})
+
+    def test_keyframe_from_a_new_run(self):
+        self.workers[0].apply(keyframe(5, {"1": {"status": "OK"}}))
+        result = self.workers[1].apply(keyframe(1, {"1": {"status": "FULL"}}, epoch="run-2"))
+        self.assertEqual((result.accepted, result.changed), (True, {"1": {"status": "FULL"}}))
+        self.assertTrue(self.workers[0].apply(delta(2, {"2": {"status": "OK"}}, epoch="run-2")).accepted)
+
+class UploadTests(SimpleTestCase):
+    """Sequenced uploads POSTed to receive_data, one gateway per test"""
+
+    def setUp(self):
+        # The history isn't under test, keep the writer thread off the database
+        patcher = mock.patch.object(ingest_writer, "add")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data):
+        response = self.client.post("/websocket/dashboard", json.dumps(data), content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_delta_gap_asks_for_a_keyframe(self):
+        gateway = "gap-gw"
+        self.assertEqual(self.post(keyframe(1, {"gap-1": {"status": "OK"}}, gateway=gateway))[0], 201)
+        # seq 2 never arrived
+        status, reply = self.post(delta(3, {"gap-1": {"status": "FULL"}}, gateway=gateway))
+        self.assertEqual((status, reply), (409, {"resync": True, "seq": 1}))
+        # The keyframe that follows is taken whatever its seq
+        status, reply = self.post(keyframe(4, {"gap-1": {"status": "FULL"}}, gateway=gateway))
+        self.assertEqual((status, reply["ack"]), (201, 4))
+
+    def test_resync_in_the_middle_of_a_batch(self):
+        gateway = "batch-gw"
+        batch = [keyframe(1, {"batch-1": {"status": "OK"}}, gateway=gateway),
+                 delta(2, {"batch-1": {"status": "FULL"}}, gateway=gateway),
+                 delta(4, {"batch-2": {"status": "OK"}}, gateway=gateway),
+                 delta(5, {"batch-1": {"status": "OK"}}, gateway=gateway)]
+        status, reply = self.post({"batch": batch})
+        # What came before the gap is applied and acked, nothing after it
+        self.assertEqual((status, reply), (409, {"applied": 2, "acks": [1, 2], "resync": True, "seq": 2}))
+        # Sent again, the applied ones are acked as duplicates and the gap still stops it
+        status, reply = self.post({"batch": batch[1:]})
+        self.assertEqual((status, reply), (409, {"applied": 1, "acks": [2], "resync": True, "seq": 2}))
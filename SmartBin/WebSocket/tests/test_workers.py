@@ -0,0 +1,118 @@
+import json
+import os
+import unittest
+from unittest import mock
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from ..consumers import DashboardConsumer
+from ..fleet_state import FleetState
+from ..writer import ingest_writer
+
+class SharedLayer(InMemoryChannelLayer):
+    """
+    In-memory channel layer whose instances all share one set of channels
+    and groups, standing in for the Redis pub/sub layer that connects the
+    processes started by "manage.py serve --workers N": each alias below is
+    one worker's layer.
+    """
+    channels_shared = {}
+    groups_shared = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = self.channels_shared
+        self.groups = self.groups_shared
+
+SHARED_LAYERS = {
+    "default": {"BACKEND": "WebSocket.tests.test_workers.SharedLayer"},
+    "worker_b": {"BACKEND": "WebSocket.tests.test_workers.SharedLayer"},
+}
+
+class WorkerBDashboard(DashboardConsumer):
+    """A dashboard socket served by the second worker"""
+    channel_layer_alias = "worker_b"
+
+class CrossWorkerBroadcastTests(TransactionTestCase):
+    """An upload POSTed to one worker reaches dashboards connected to another"""
+
+    def setUp(self):
+        SharedLayer.channels_shared.clear()
+        SharedLayer.groups_shared.clear()
+        # The history isn't under test, keep the writer thread off the database
+        patcher = mock.patch.object(ingest_writer, "add")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def receive_bin(self, communicator, bin_id):
+        """Values of ``bin_id`` from the first frame that has it"""
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=5))
+            if bin_id in frame:
+                return frame[bin_id]
+
+    async def check_upload_reaches_other_worker(self, gateway, bin_id):
+        local = WebsocketCommunicator(DashboardConsumer.as_asgi(), "/ws/dashboard/")
+        remote = WebsocketCommunicator(WorkerBDashboard.as_asgi(), "/ws/dashboard/")
+        for communicator in (local, remote):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+        try:
+            # receive_data broadcasts on the "default" layer, worker A's
+            upload = {"gateway": gateway, "bins": {bin_id: {"status": "FULL", "last_seen": 3}}}
+            response = await AsyncClient().post("/websocket/dashboard", json.dumps(upload),
+                                                 content_type="application/json")
+            self.assertEqual(response.status_code, 201)
+
+            for communicator in (remote, local):
+                values = await self.receive_bin(communicator, bin_id)
+                self.assertEqual(values["status"], "FULL")
+                self.assertEqual(values["gateway"], gateway)
+        finally:
+            for communicator in (local, remote):
+                await communicator.disconnect()
+
+    @override_settings(CHANNEL_LAYERS=SHARED_LAYERS)
+    async def test_upload_reaches_dashboard_on_other_worker(self):
+        await self.check_upload_reaches_other_worker("test-cross-worker", "cross-1")
+
+    @unittest.skipUnless(os.environ.get("SMARTBIN_TEST_REDIS_URL"), "set SMARTBIN_TEST_REDIS_URL to run against Redis")
+    async def test_upload_reaches_dashboard_on_other_worker_over_redis(self):
+        layer = {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": [os.environ.get("SMARTBIN_TEST_REDIS_URL")]},
+        }
+        with override_settings(CHANNEL_LAYERS={"default": layer, "worker_b": dict(layer)}):
+            await self.check_upload_reaches_other_worker("test-cross-worker-redis", "cross-redis-1")
+
+FLEET_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "fleet": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "fleet-tests"},
+}
+
+@override_settings(CACHES=FLEET_CACHES)
+class SharedFleetStateTests(TransactionTestCase):
+    """Fleet states sharing a cache, one per worker, see every worker's sources"""
+
+    def test_every_worker_sees_every_source(self):
+        workers = [FleetState("fleet"), FleetState("fleet")]
+        workers[0].update({"gw-a": {"1": {"status": "OK"}}})
+        workers[1].update({"gw-b": {"2": {"status": "FULL"}}})
+        workers[0].update({"gw-a": {"1": {"status": "FULL"}}, "gw-c": {"3": {"status": "OK"}}})
+        for worker in workers:
+            _, text = worker.snapshot()
+            self.assertEqual(json.loads(text), {"1": {"status": "FULL"}, "2": {"status": "FULL"},
+                                                "3": {"status": "OK"}})
+
+class ServeTests(SimpleTestCase):
+    @override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+    def test_several_workers_refused_without_a_shared_layer(self):
+        with self.assertRaisesMessage(CommandError, "REDIS_URL"):
+            call_command("serve", "--workers", "2")
+
+    @override_settings(MERGE_GATEWAYS=True, MERGE_CACHE=None, CHANNEL_LAYERS={
+        "default": {"BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer"}})
+    def test_several_workers_refused_merging_without_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, "MERGE_CACHE"):
+            call_command("serve", "--workers", "2")
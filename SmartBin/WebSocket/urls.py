@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path("dashboard", views.receive_data, name="recieve_data"), 
+    path("state", views.fleet_snapshot, name="fleet_state"),
+    path("history", views.fleet_history, name="fleet_history"),
+    path("history/<str:bin_id>", views.bin_history, name="bin_history"),
+    path("metrics", views.metrics, name="metrics"),
 ]
\ No newline at end of file
@@ -1,45 +1,104 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 import json
-from .models import SensorData
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+import time
+import zlib
+from .broadcast import broadcast
+from .fleet_state import fleet_state
+from .history_api import HistoryUnavailable, history, parse_time
+from .ingest import decode_upload, handle_upload
+from .metrics import CONTENT_TYPE, render, upload_metrics
+
+upload_seconds, upload_counts = upload_metrics("http")
 
 @csrf_exempt
 def receive_data(request):
     if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            
-            records = []
-            for device_id, values in data.items():
-                # Create new SensorData instance
-                sensor_data = SensorData(
-                    device_id=device_id,
-                    last_seen=values.get("last_seen"),
-                    status=values.get("status"),
-                    next_nearest=values.get("next_nearest"),
-                    next_nearest_direction=values.get("next_nearest_direction")
-                )
-                
-                # Set coordinates using the property setter
-                sensor_data.coord = values.get("coord")
-                
-                records.append(sensor_data)
-
-            SensorData.objects.bulk_create(records)
-
-            # Broadcast update to WebSocket clients
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "dashboard",
-                {"type": "dashboard_update", "data": data}
-            )
-
-            return JsonResponse({"message": "Data received"}, status=201)
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "Invalid JSON format"}, status=400)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Only POST requests allowed"}, status=405)
\ No newline at end of file
+        started = time.perf_counter()
+        response = _receive_upload(request)
+        upload_seconds.observe(time.perf_counter() - started)
+        upload_counts[response.status_code].inc()
+        return response
+
+    return JsonResponse({"error": "Only POST requests allowed"}, status=405)
+
+def _receive_upload(request):
+    try:
+        gzipped = request.headers.get("Content-Encoding", "").lower() == "gzip"
+        data = decode_upload(request.body, gzipped)
+        
+        status, reply, updates = handle_upload(data)
+        broadcast(updates)
+        
+        return JsonResponse(reply, status=status)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON format"}, status=400)
+    except (ValueError, zlib.error) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+def metrics(request):
+    """This process's ingest and broadcast metrics in the Prometheus text format"""
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+def fleet_snapshot(request):
+    """
+    The merged state of every bin, the same frame a dashboard socket gets on
+    connect. Versioned with an ETag: a reload sending it back in
+    If-None-Match gets a bodiless 304 until something changes.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+
+    tag, snapshot = fleet_state.snapshot()
+    etag = f'"{tag}"'
+    known = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in known or "*" in known:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(snapshot, content_type="application/json")
+    response["ETag"] = etag
+    # Cacheable, but always revalidated
+    response["Cache-Control"] = "no-cache"
+    return response
+
+def _history_response(request, device_id=None):
+    """
+    GET parameters: start and end (ISO 8601, end exclusive), limit and
+    cursor (from the previous page's "next") for pages of readings, or
+    points for the range downsampled to that many buckets.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    params = request.GET
+    try:
+        device_ids = None
+        if device_id is None and params.get("bins"):
+            device_ids = [bin_id for bin_id in params["bins"].split(",") if bin_id]
+        text = history(
+            device_id=device_id,
+            device_ids=device_ids,
+            start=parse_time(params.get("start")),
+            end=parse_time(params.get("end")),
+            limit=int(params["limit"]) if params.get("limit") else None,
+            cursor=params.get("cursor") or None,
+            points=int(params["points"]) if params.get("points") else None,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except HistoryUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=501)
+    return HttpResponse(text, content_type="application/json")
+
+def bin_history(request, bin_id):
+    """History of one bin"""
+    return _history_response(request, device_id=bin_id)
+
+def fleet_history(request):
+    """History of every bin, or of those listed in "bins" (comma separated)"""
+    return _history_response(request)
\ No newline at end of file
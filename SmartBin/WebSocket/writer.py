@@ -0,0 +1,222 @@
+import atexit
+import threading
+import time
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from .history_api import history_cache
+from .history_log import HistoryLog
+from .metrics import WRITER_FLUSH_SECONDS, Counter, Gauge
+from .models import DeviceState, SensorData
+
+# Columns refreshed when a bin's latest state is upserted
+STATE_FIELDS = ["timestamp", "last_seen", "status", "x", "y", "next_nearest", "next_nearest_direction"]
+
+# A row failing with one of these is bad data, retrying it won't help
+REJECTED_ERRORS = (ValueError, TypeError, DataError, IntegrityError)
+
+class IngestWriter:
+    """
+    Write-behind buffer between the ingest path and the database.
+
+    The ingest path hands its SensorData rows to add() and returns straight
+    away. A background thread writes them in one transaction once
+    ``flush_size`` rows are waiting or ``flush_interval`` seconds have
+    passed, so many uploads share a single commit. The same transaction
+    upserts the DeviceState row of every bin seen since the previous flush,
+    once per bin however many uploads mentioned it. If a batch fails it is
+    retried row by row and rows the database refuses are dropped; after any
+    other error the batch goes back in the buffer. Rows still buffered at
+    shutdown are written by close(), which runs at interpreter exit.
+
+    With a ``history_log`` the history goes to that binary log instead of
+    SensorData, appended once the database transaction has committed.
+    """
+
+    def __init__(self, flush_size=500, flush_interval=1.0, max_buffer=100000, history_log=None):
+        self.history_log = history_log
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # Oldest rows are dropped past this if the database falls behind
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.states = {}  # device_id -> newest buffered row
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+
+        self.rows_written = 0
+        self.states_written = 0
+        self.rows_dropped = 0
+        self.rows_rejected = 0
+        self.flushes = 0
+        self.last_flush_duration = None
+
+    def add(self, records):
+        """Queue unsaved SensorData rows for the next flush"""
+        if not records:
+            return
+        with self.condition:
+            if self.thread is None and not self.stopping:
+                self._start()
+            self.buffer.extend(records)
+            states = self.states
+            for record in records:
+                states[record.device_id] = record
+            excess = len(self.buffer) - self.max_buffer
+            if excess > 0:
+                del self.buffer[:excess]
+                self.rows_dropped += excess
+            if len(self.buffer) >= self.flush_size:
+                self.condition.notify()
+
+    def _start(self):
+        # Started on first use so management commands don't spawn a thread
+        self.thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        try:
+            while True:
+                with self.condition:
+                    deadline = time.monotonic() + self.flush_interval
+                    while len(self.buffer) < self.flush_size and not self.stopping:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    records, self.buffer = self.buffer, []
+                    states, self.states = self.states, {}
+                    stopping = self.stopping
+
+                if records or states:
+                    self._write(records, states)
+                if stopping:
+                    with self.condition:
+                        if not self.buffer:
+                            break
+        finally:
+            connection.close()
+
+    def _write(self, records, states):
+        started = time.perf_counter()
+        state_count = len(states)
+        try:
+            self._commit(records, states)
+            written = len(records)
+        except Exception as e:
+            print(f"Ingest writer: failed to write {len(records)} rows: {e}")
+            # Rows the history log took before it failed aren't written twice
+            appended = getattr(e, "appended", 0)
+            written = appended + self._write_each(records[appended:], states)
+        if self.history_log is None and written:
+            history_cache.rows_changed()
+        self.rows_written += written
+        self.states_written += state_count
+        self.flushes += 1
+        self.last_flush_duration = time.perf_counter() - started
+        WRITER_FLUSH_SECONDS.observe(self.last_flush_duration)
+
+    def _commit(self, records, states):
+        with transaction.atomic():
+            if self.history_log is None:
+                SensorData.objects.bulk_create(records, batch_size=self.flush_size)
+            DeviceState.objects.bulk_create(
+                [
+                    DeviceState(device_id=device_id, **{field: getattr(record, field) for field in STATE_FIELDS})
+                    for device_id, record in states.items()
+                ],
+                batch_size=self.flush_size,
+                update_conflicts=True,
+                unique_fields=["device_id"],
+                update_fields=STATE_FIELDS,
+            )
+        if self.history_log is not None:
+            self.history_log.append(
+                (r.device_id, r.timestamp, r.status, r.coord, r.last_seen) for r in records
+            )
+
+    def _write_each(self, records, states):
+        """
+        Retry a batch that failed, one row at a time, so a row the database
+        or the history log refuses can't hold back the others. Refused rows
+        are dropped and counted in rows_rejected. On any other error (the
+        database is down) the rest goes back in the buffer for the next
+        flush. Returns the number of rows written.
+        """
+        written = 0
+        for number, record in enumerate(records):
+            try:
+                self._commit([record], {})
+            except REJECTED_ERRORS as e:
+                self._reject(record, e)
+                if states.get(record.device_id) is record:
+                    del states[record.device_id]
+            except Exception:
+                self._requeue(records[number:], states)
+                return written
+            else:
+                written += 1
+        for device_id, record in list(states.items()):
+            try:
+                self._commit([], {device_id: record})
+            except REJECTED_ERRORS as e:
+                self._reject(record, e)
+            except Exception:
+                self._requeue([], states)
+                return written
+            del states[device_id]
+        return written
+
+    def _reject(self, record, error):
+        print(f"Ingest writer: dropping row for bin {record.device_id!r}: {error}")
+        self.rows_rejected += 1
+
+    def _requeue(self, records, states):
+        with self.condition:
+            # Put them back in front of anything that arrived meanwhile
+            self.buffer[:0] = records
+            for device_id, record in states.items():
+                self.states.setdefault(device_id, record)
+            if self.stopping:
+                # Don't spin on a broken database at shutdown
+                self.rows_dropped += len(self.buffer)
+                self.buffer = []
+                self.states = {}
+                return
+        time.sleep(self.flush_interval)
+
+    def close(self, timeout=30):
+        """Write everything still buffered and stop the thread"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def pending(self):
+        with self.condition:
+            return len(self.buffer)
+
+def open_history_log():
+    """The binary history log when HISTORY_BACKEND is "binary", otherwise None"""
+    if getattr(settings, "HISTORY_BACKEND", "sqlite") != "binary":
+        return None
+    return HistoryLog(settings.HISTORY_LOG_DIR, getattr(settings, "HISTORY_LOG_SEGMENT_RECORDS", 1000000))
+
+# Shared by every request handled by this process
+ingest_writer = IngestWriter(
+    flush_size=getattr(settings, "INGEST_FLUSH_SIZE", 500),
+    flush_interval=getattr(settings, "INGEST_FLUSH_INTERVAL", 1.0),
+    max_buffer=getattr(settings, "INGEST_MAX_BUFFER", 100000),
+    history_log=open_history_log(),
+)
+
+Counter("smartbin_ingest_rows_written_total", "History rows committed by the ingest writer",
+        function=lambda: ingest_writer.rows_written)
+Counter("smartbin_ingest_rows_dropped_total", "History rows dropped because the database fell behind",
+        function=lambda: ingest_writer.rows_dropped)
+Counter("smartbin_ingest_rows_rejected_total", "History rows dropped because the database or history log refused them",
+        function=lambda: ingest_writer.rows_rejected)
+Gauge("smartbin_ingest_rows_buffered", "History rows waiting for the next flush", function=lambda: len(ingest_writer.buffer))
@@ -0,0 +1,128 @@
+"""
+bin_detail clients on the shared dashboard route (every bin, every update)
+against the per-bin route (only the bin they show).
+
+    python benchmarks/bench_bin_subscriptions.py [--clients 200] [--updates 50] [--bins 500]
+
+Each update is a whole gateway state of --bins bins in which --changed of
+the bins have new values. Each client follows one bin, spread over the
+fleet. Reports bytes and frames per client, CPU (server plus the in-process
+clients decoding their frames, as the phones would) and the time until
+every client has the last update, plus what broadcasting costs with no
+detail clients at all.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+settings.DATABASES["default"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+django.setup()
+
+from django.core.management import call_command
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from WebSocket.broadcast import broadcast_async, changed_bins, dashboard_event, DASHBOARD_GROUP
+from WebSocket.routing import websocket_urlpatterns
+
+APPLICATION = URLRouter(websocket_urlpatterns)
+
+def fleet(update, bins, changed):
+    """Gateway state for one update, the first ``changed`` bins move on"""
+    return {str(b): {"status": "FULL" if b % 7 == 0 else "OK", "last_seen": update if b < changed else 0,
+                     "coord": [b * 1.5, b * 0.5], "next_nearest": str(b + 1), "next_nearest_direction": "NE"}
+            for b in range(bins)}
+
+async def dashboard_only(updates, channel_layer=None):
+    """Broadcasting as it was, one frame to the dashboard group"""
+    from channels.layers import get_channel_layer
+    for source, data in updates.items():
+        await get_channel_layer().group_send(DASHBOARD_GROUP, dashboard_event(data, source))
+
+async def drain(communicator, bin_id, last_update, stats, key):
+    frames = size = 0
+    while True:
+        frame = await communicator.receive_from(timeout=600)
+        frames += 1
+        size += len(frame)
+        values = json.loads(frame).get(bin_id)
+        if values is not None and values["last_seen"] == last_update:
+            stats[key] = (frames, size, time.perf_counter())
+            return
+
+async def run(path, broadcast, args):
+    changed_bins.sent.clear()
+    clients = []
+    for i in range(args.clients):
+        # Followed bins are all among the changing ones
+        bin_id = str(i * args.changed // args.clients)
+        communicator = WebsocketCommunicator(APPLICATION, path.format(bin_id=bin_id))
+        connected, _ = await communicator.connect()
+        assert connected
+        clients.append((communicator, bin_id))
+    # Skip the connect snapshot, if any
+    for communicator, _ in clients:
+        await communicator.receive_nothing(0.01)
+
+    stats = {}
+    readers = [asyncio.ensure_future(drain(c, bin_id, args.updates, stats, i))
+               for i, (c, bin_id) in enumerate(clients)]
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for update in range(1, args.updates + 1):
+        await broadcast({"gw-1": fleet(update, args.bins, args.changed)})
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*readers)
+    cpu = time.process_time() - cpu_started
+    done = max(t for _, _, t in stats.values())
+    for communicator, _ in clients:
+        await communicator.disconnect()
+    return {
+        "all_clients_current_s": done - started,
+        "cpu_s": cpu,
+        "frames_per_client": sum(f for f, _, _ in stats.values()) / len(stats),
+        "bytes_per_client": sum(b for _, b, _ in stats.values()) / len(stats),
+    }
+
+async def broadcast_cost(broadcast, args):
+    """Mean seconds per update with nobody listening"""
+    changed_bins.sent.clear()
+    started = time.perf_counter()
+    for update in range(1, args.updates + 1):
+        await broadcast({"gw-1": fleet(update, args.bins, args.changed)})
+    return (time.perf_counter() - started) / args.updates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--bins", type=int, default=500)
+    parser.add_argument("--changed", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+    args.changed = min(args.changed, args.bins)
+
+    call_command("migrate", verbosity=0)
+    results = {"clients": args.clients, "updates": args.updates, "bins": args.bins, "changed": args.changed}
+    loop = asyncio.new_event_loop()
+    results["dashboard_route"] = loop.run_until_complete(run("/ws/dashboard/", dashboard_only, args))
+    results["bin_route"] = loop.run_until_complete(run("/ws/bin/{bin_id}/", broadcast_async, args))
+    results["broadcast_ms_no_detail_clients"] = {
+        "dashboard_only": loop.run_until_complete(broadcast_cost(dashboard_only, args)) * 1000,
+        "with_bin_groups": loop.run_until_complete(broadcast_cost(broadcast_async, args)) * 1000,
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Spatial filtering over SensorData with coordinates stored as JSON text
+(parsed in Python) against the native x/y columns (filtered in SQL).
+
+    python benchmarks/bench_coord_columns.py [--rows 1000000]
+
+"before" reads a copy of the table in the old coord_json layout and does
+what the code had to do then: load every row, json.loads the coord and test
+it in Python. "after" runs within() and nearest() on the migrated table.
+Both answer a bounding-box query covering ~1% of the site and a 10-nearest
+query.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+SITE = 1000.0  # metres
+BOX = (450.0, 450.0, 550.0, 550.0)
+POINT = (500.0, 500.0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from WebSocket.models import SensorData
+    call_command("migrate", verbosity=0)
+
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1)
+    with connection.cursor() as cursor, transaction.atomic():
+        cursor.execute('CREATE TABLE legacy (id INTEGER PRIMARY KEY, device_id TEXT, timestamp TEXT, '
+                       'status TEXT, coord_json TEXT)')
+        rows = []
+        for i in range(args.rows):
+            x, y = rng.uniform(0, SITE), rng.uniform(0, SITE)
+            when = (start + timedelta(seconds=i // 200 * 5)).isoformat(sep=" ")
+            rows.append((str(i % 200), when, "OK", x, y, json.dumps([x, y])))
+            if len(rows) == 10000 or i == args.rows - 1:
+                cursor.executemany('INSERT INTO legacy (device_id, timestamp, status, coord_json) '
+                                   'VALUES (?, ?, ?, ?)', [(r[0], r[1], r[2], r[5]) for r in rows])
+                cursor.executemany('INSERT INTO "WebSocket_sensordata" (device_id, timestamp, status, x, y) '
+                                   'VALUES (?, ?, ?, ?, ?)', [r[:5] for r in rows])
+                rows = []
+
+    min_x, min_y, max_x, max_y = BOX
+    results = {"rows": args.rows}
+
+    # Old layout: every row comes back to Python to have its coord parsed
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, device_id, coord_json FROM legacy")
+        loaded = [(row_id, device_id, json.loads(coord)) for row_id, device_id, coord in cursor.fetchall()]
+    load_before = time.perf_counter() - started
+    started = time.perf_counter()
+    in_box_before = [row for row in loaded if min_x <= row[2][0] <= max_x and min_y <= row[2][1] <= max_y]
+    box_before = time.perf_counter() - started + load_before
+    started = time.perf_counter()
+    nearest_before = heapq.nsmallest(
+        10, loaded, key=lambda row: (row[2][0] - POINT[0]) ** 2 + (row[2][1] - POINT[1]) ** 2)
+    nearest_before_s = time.perf_counter() - started + load_before
+
+    # New layout: the database filters, only matching rows come back
+    started = time.perf_counter()
+    in_box_after = list(SensorData.objects.within(*BOX).values_list("id", "device_id", "x", "y"))
+    box_after = time.perf_counter() - started
+    started = time.perf_counter()
+    nearest_after = list(SensorData.objects.nearest(*POINT, k=10).values_list("id", flat=True))
+    nearest_after_s = time.perf_counter() - started
+    started = time.perf_counter()
+    list(SensorData.objects.nearest(*POINT, k=10, max_distance=10.0).values_list("id", flat=True))
+    nearest_radius_s = time.perf_counter() - started
+
+    assert len(in_box_before) == len(in_box_after)
+    assert [row[0] for row in nearest_before] == nearest_after
+
+    results["load_all_s"] = load_before
+    results["bbox"] = {"before_s": box_before, "after_s": box_after, "rows": len(in_box_after),
+                       "speedup": box_before / box_after}
+    results["nearest_10"] = {"before_s": nearest_before_s, "after_s": nearest_after_s,
+                             "after_within_10m_s": nearest_radius_s,
+                             "speedup": nearest_before_s / nearest_after_s}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Dashboard fan-out: the old per-socket json.dumps broadcast against the
+encode-once, coalescing DashboardConsumer, with hundreds of in-process
+WebSocket clients.
+
+    python benchmarks/bench_dashboard_fanout.py [--clients 500] [--slow 50] [--updates 50] [--bins 500]
+
+Each update is a whole gateway state of --bins bins sent to every client.
+As in the ingest path, the new consumer's updates go into the fleet state
+before they are broadcast; slow clients merge the frames they queue and
+only resync from it when their queue overflows. --slow of the clients take
+--slow-delay seconds per frame they send. Reports the time until every fast
+client has the last update, the frames the slow clients had to be sent (and
+how many were resyncs), and how far behind the slow clients ended up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+
+django.setup()
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from WebSocket.broadcast import broadcast_async
+from WebSocket.consumers import DashboardConsumer
+from WebSocket.fleet_state import fleet_state
+from WebSocket.metrics import FRAMES_RESYNCED
+
+class LegacyDashboardConsumer(AsyncWebsocketConsumer):
+    """The consumer as it was: the state dict goes through the layer, dumped per socket"""
+
+    async def connect(self):
+        await self.channel_layer.group_add("dashboard", self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard("dashboard", self.channel_name)
+
+    async def dashboard_update(self, event):
+        await self.send(text_data=json.dumps(event["data"]))
+
+async def legacy_broadcast(updates):
+    for data in updates.values():
+        await get_channel_layer().group_send("dashboard", {"type": "dashboard_update", "data": data})
+
+async def fleet_broadcast(updates):
+    """broadcast_async() after recording the state, as ingest() does"""
+    fleet_state.update(updates)
+    await broadcast_async(updates)
+
+def slow(consumer_class, delay):
+    class Slow(consumer_class):
+        async def send(self, *args, **kwargs):
+            await asyncio.sleep(delay)
+            await super().send(*args, **kwargs)
+    return Slow
+
+# Bin "0" comes first in every frame, its last_seen is the update number
+UPDATE_NUMBER = re.compile(r'"last_seen": ?(\d+)')
+
+async def drain(communicator, last_update, results, key):
+    """Read frames until the last update shows up"""
+    frames = 0
+    while True:
+        frame = await communicator.receive_from(timeout=600)
+        frames += 1
+        # Parsing whole frames here would cost more than the server side
+        if int(UPDATE_NUMBER.search(frame, 0, 100).group(1)) == last_update:
+            results[key] = (frames, time.perf_counter())
+            return
+
+async def run(consumer_class, broadcast, args):
+    fast = [WebsocketCommunicator(consumer_class.as_asgi(), "/ws/dashboard/")
+            for _ in range(args.clients - args.slow)]
+    slow_clients = [WebsocketCommunicator(slow(consumer_class, args.slow_delay).as_asgi(), "/ws/dashboard/")
+                    for _ in range(args.slow)]
+    for communicator in fast + slow_clients:
+        connected, _ = await communicator.connect()
+        assert connected
+
+    results = {}
+    readers = [asyncio.ensure_future(drain(c, args.updates - 1, results, ("fast", i))) for i, c in enumerate(fast)]
+    readers += [asyncio.ensure_future(drain(c, args.updates - 1, results, ("slow", i)))
+                for i, c in enumerate(slow_clients)]
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    resyncs_before = FRAMES_RESYNCED.child.value
+    for update in range(args.updates):
+        state = {str(b): {"status": "OK", "last_seen": update, "coord": [b * 1.5, b * 0.5],
+                          "next_nearest": str(b + 1), "next_nearest_direction": "NE"}
+                 for b in range(args.bins)}
+        await broadcast({"gw-1": state})
+        # Gateways post every few hundred ms, let the loop breathe between them
+        await asyncio.sleep(args.interval)
+    broadcast_done = time.perf_counter()
+
+    await asyncio.gather(*readers)
+    fast_done = max(t for (kind, _), (_, t) in results.items() if kind == "fast")
+    slow_done = max((t for (kind, _), (_, t) in results.items() if kind == "slow"), default=broadcast_done)
+    cpu = time.process_time() - cpu_started
+    slow_frames = [frames for (kind, _), (frames, _) in results.items() if kind == "slow"]
+
+    for communicator in fast + slow_clients:
+        await communicator.disconnect()
+    return {
+        "all_fast_clients_current_s": fast_done - started,
+        "cpu_s": cpu,
+        "frames_per_slow_client": sum(slow_frames) / len(slow_frames) if slow_frames else None,
+        "resyncs_per_slow_client": (FRAMES_RESYNCED.child.value - resyncs_before) / args.slow if args.slow else None,
+        "slow_clients_behind_s": slow_done - broadcast_done,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=50)
+    parser.add_argument("--slow-delay", type=float, default=0.2)
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--bins", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = {"clients": args.clients, "slow_clients": args.slow, "updates": args.updates, "bins": args.bins}
+    # Only what the benchmark broadcasts, not this checkout's DeviceState rows
+    fleet_state.stored = {}
+    loop = asyncio.new_event_loop()
+    results["legacy"] = loop.run_until_complete(run(LegacyDashboardConsumer, legacy_broadcast, args))
+    results["encode_once"] = loop.run_until_complete(run(DashboardConsumer, fleet_broadcast, args))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
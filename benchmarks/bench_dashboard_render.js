@@ -0,0 +1,208 @@
+/*
+ * Dashboard table rendering at fleet scale: the old updateTable() (clear
+ * tbody.innerHTML, rebuild every row, parseInt the counters per bin, log
+ * every device) against the keyed, requestAnimationFrame-batched script now
+ * in Dashboard/templates/dashboard.html.
+ *
+ *     node benchmarks/bench_dashboard_render.js [--bins 5000] [--updates 50] [--burst 1]
+ *
+ * Both run against a small counting DOM, so the numbers are the script's own
+ * time plus what it asks the browser to do (elements created, HTML parsed,
+ * text and class writes); layout and paint come on top of that in a real tab.
+ * Every update is a whole gateway state: every bin's last_seen moves on and
+ * 2% of the bins change status. --burst frames arrive between two animation
+ * frames.
+ */
+"use strict";
+const fs = require("fs");
+const path = require("path");
+
+const TEMPLATE = path.join(__dirname, "..", "SmartBin", "Dashboard", "templates", "dashboard.html");
+
+function option(name, fallback) {
+    const index = process.argv.indexOf(`--${name}`);
+    return index >= 0 ? Number(process.argv[index + 1]) : fallback;
+}
+
+// The template's script as it was before the keyed rewrite
+const LEGACY_SCRIPT = `
+    const socket = new WebSocket("ws://172.20.10.5:8000/ws/dashboard/");
+    socket.onmessage = function(event) {
+        const data = JSON.parse(event.data);
+        updateTable(data);
+    };
+    function updateTable(data) {
+        document.getElementById("fullBins").innerText = 0;
+        document.getElementById("emptyBins").innerText = 0;
+        document.getElementById("offlineBins").innerText = 0;
+        const table = document.querySelector(".bin-table tbody");
+        table.innerHTML = "";
+        console.log("Updating table with data:", data);
+        for (const [deviceId, values] of Object.entries(data)) {
+            console.log(\`Processing device \${deviceId}:\`, values);
+            const status = (values.status || "").toUpperCase();
+            if (status === "FULL") {
+                document.getElementById("fullBins").innerText = parseInt(document.getElementById("fullBins").innerText) + 1;
+            } else if (status === "EMPTY" || status === "OK") {
+                document.getElementById("emptyBins").innerText = parseInt(document.getElementById("emptyBins").innerText) + 1;
+            } else if (status === "OFFLINE") {
+                document.getElementById("offlineBins").innerText = parseInt(document.getElementById("offlineBins").innerText) + 1;
+            }
+            let row = document.createElement("tr");
+            if (status === "FULL") {
+                row.className = "table-danger";
+            } else if (status === "OFFLINE") {
+                row.className = "table-secondary";
+            }
+            let coordDisplay = "N/A";
+            if (values.coord) {
+                if (Array.isArray(values.coord)) {
+                    coordDisplay = values.coord.map(c => c.toFixed(2)).join(", ");
+                } else if (typeof values.coord === 'string') {
+                    coordDisplay = values.coord;
+                } else if (values.coord.length === 2) {
+                    coordDisplay = \`\${values.coord[0].toFixed(2)}, \${values.coord[1].toFixed(2)}\`;
+                }
+            }
+            let lastSeenDisplay = values.last_seen || "0";
+            row.innerHTML = \`
+                <td>\${deviceId}</td>
+                <td>\${coordDisplay}</td>
+                <td>\${status || "Unknown"}</td>
+                <td>\${lastSeenDisplay}</td>
+                <td>\${values.next_nearest || "N/A"}</td>
+                <td>\${values.next_nearest_direction || "N/A"}</td>
+            \`;
+            table.appendChild(row);
+        }
+    }
+`;
+
+function currentScript() {
+    const html = fs.readFileSync(TEMPLATE, "utf8");
+    const scripts = [...html.matchAll(/<script>([\s\S]*?)<\/script>/g)];
+    return scripts[scripts.length - 1][1];
+}
+
+function makeEnvironment() {
+    const stats = {elements: 0, html_parses: 0, text_writes: 0, class_writes: 0, inserts: 0, console_logs: 0};
+
+    class Element {
+        constructor(tag) {
+            this.tagName = tag;
+            this.children = [];
+            this.text = "";
+            this.classes = "";
+        }
+        get firstChild() { return this.children[0] || null; }
+        appendChild(child) {
+            if (child.fragment) {
+                for (const node of child.children) this.appendChild(node);
+                child.children = [];
+                return child;
+            }
+            stats.inserts++;
+            this.children.push(child);
+            return child;
+        }
+        get textContent() { return this.text; }
+        set textContent(value) { stats.text_writes++; this.children = []; this.text = String(value); }
+        get innerText() { return this.text; }
+        set innerText(value) { this.textContent = value; }
+        set innerHTML(value) {
+            stats.html_parses++;
+            this.children = [];
+            for (const match of value.matchAll(/<td>([\s\S]*?)<\/td>/g)) {
+                const cell = new Element("td");
+                stats.elements++;
+                cell.text = match[1];
+                this.children.push(cell);
+            }
+        }
+        get className() { return this.classes; }
+        set className(value) { stats.class_writes++; this.classes = value; }
+    }
+
+    const tbody = new Element("tbody");
+    const counters = {fullBins: new Element("h5"), emptyBins: new Element("h5"), offlineBins: new Element("h5")};
+    const frames = [];
+    let socket = null;
+    const document = {
+        createElement(tag) { stats.elements++; return new Element(tag); },
+        createDocumentFragment() { const fragment = new Element("#fragment"); fragment.fragment = true; return fragment; },
+        querySelector() { return tbody; },
+        getElementById(id) { return counters[id]; },
+    };
+    class WebSocket {
+        constructor() { socket = this; }
+    }
+    const console = {log() { stats.console_logs++; }};
+    const requestAnimationFrame = callback => frames.push(callback);
+    return {
+        stats, tbody, counters,
+        run(script) {
+            new Function("document", "WebSocket", "console", "requestAnimationFrame", script)(
+                document, WebSocket, console, requestAnimationFrame);
+        },
+        receive(text) { socket.onmessage({data: text}); },
+        paint() { while (frames.length) frames.shift()(); },
+    };
+}
+
+function fleet(bins, update) {
+    const state = {};
+    for (let b = 0; b < bins; b++) {
+        const full = (b * 7919 + update * 50) % bins < bins * 0.02 ? true : b % 10 === 0;
+        state[String(b)] = {
+            status: full ? "FULL" : "OK",
+            coord: [b * 1.5, b * 0.5],
+            last_seen: update,
+            next_nearest: String(b + 1),
+            next_nearest_direction: "NE",
+        };
+    }
+    return JSON.stringify(state);
+}
+
+function measure(script, frames, burst) {
+    const environment = makeEnvironment();
+    environment.run(script);
+    // First frame builds the table, not timed
+    environment.receive(frames[0]);
+    environment.paint();
+    for (const key of Object.keys(environment.stats)) environment.stats[key] = 0;
+
+    const updates = frames.length - 1;
+    const started = process.hrtime.bigint();
+    for (let i = 1; i < frames.length; i += burst) {
+        for (const frame of frames.slice(i, i + burst)) environment.receive(frame);
+        environment.paint();
+    }
+    const elapsed = Number(process.hrtime.bigint() - started) / 1e6;
+
+    const perUpdate = {};
+    for (const [key, value] of Object.entries(environment.stats)) perUpdate[key] = value / updates;
+    return {
+        ms_per_update: elapsed / updates,
+        per_update: perUpdate,
+        rows: environment.tbody.children.length,
+        counters: Object.fromEntries(Object.entries(environment.counters).map(([id, e]) => [id, e.textContent])),
+    };
+}
+
+function main() {
+    const bins = option("bins", 5000);
+    const updates = option("updates", 50);
+    const burst = option("burst", 1);
+    const frames = [];
+    for (let update = 0; update <= updates; update++) frames.push(fleet(bins, update));
+
+    const legacy = measure(LEGACY_SCRIPT, frames, burst);
+    const keyed = measure(currentScript(), frames, burst);
+    if (JSON.stringify(legacy.counters) !== JSON.stringify(keyed.counters) || legacy.rows !== keyed.rows) {
+        throw new Error("Legacy and keyed renders disagree");
+    }
+    console.log(JSON.stringify({bins, updates, burst, legacy, keyed}, null, 2));
+}
+
+main();
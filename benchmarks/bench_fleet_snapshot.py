@@ -0,0 +1,87 @@
+"""
+What a dashboard that opens (or reloads) costs and how long it waits for a
+full view of the fleet.
+
+    python benchmarks/bench_fleet_snapshot.py [--bins 5000] [--repeat 200]
+
+The fleet state holds --bins bins. Reports the time from WebSocket connect
+to the first frame, and the /websocket/state endpoint's full response
+against a revalidated 304.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+from latency import percentiles
+
+async def connect_times(consumer_class, repeat):
+    from channels.testing import WebsocketCommunicator
+    times = []
+    for _ in range(repeat):
+        communicator = WebsocketCommunicator(consumer_class.as_asgi(), "/ws/dashboard/")
+        started = time.perf_counter()
+        await communicator.connect()
+        await communicator.receive_from(timeout=10)
+        times.append(time.perf_counter() - started)
+        await communicator.disconnect()
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bins", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.test import Client
+    from WebSocket.consumers import DashboardConsumer
+    from WebSocket.ingest import handle_upload
+    from WebSocket.writer import ingest_writer
+    call_command("migrate", verbosity=0)
+
+    state = {str(b): {"status": "FULL" if b % 7 == 0 else "OK", "last_seen": b % 60,
+                      "coord": [b * 1.5, b * 0.5], "next_nearest": str(b + 1), "next_nearest_direction": "NE"}
+             for b in range(args.bins)}
+    handle_upload({"gateway": "gw-1", "seq": 1, "type": "full", "bins": state})
+    ingest_writer.close()
+
+    results = {"bins": args.bins}
+    loop = asyncio.new_event_loop()
+    results["ws_connect_to_snapshot"] = percentiles(
+        loop.run_until_complete(connect_times(DashboardConsumer, args.repeat)))
+
+    client = Client()
+    full, revalidated = [], []
+    etag = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        response = client.get("/websocket/state")
+        full.append(time.perf_counter() - started)
+        etag = response["ETag"]
+        size = len(response.content)
+        started = time.perf_counter()
+        not_modified = client.get("/websocket/state", HTTP_IF_NONE_MATCH=etag)
+        revalidated.append(time.perf_counter() - started)
+        assert not_modified.status_code == 304
+    results["http_200"] = dict(percentiles(full), bytes=size)
+    results["http_304"] = dict(percentiles(revalidated), bytes=len(not_modified.content))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Server-side merge of overlapping gateways: what gets stored, what gets
+broadcast, and how steady the dashboard's view of each bin is.
+
+    python benchmarks/bench_gateway_merge.py [--gateways 20] [--bins 2000] [--duration 600]
+                                             [--radius 180] [--seed 1]
+
+The gateways sit on a grid 200 m apart and hear every bin within --radius
+(at least the nearest gateway hears each one), about 2.5 gateways per bin
+at the default. Simulated time, one-second steps: bins broadcast every 30 s
+and flip between OK and FULL 5% of the time, each gateway that hears a
+broadcast gets it 80% of the time, prints its routing-table dump every 15 s,
+re-solves positions every 60 s with an error growing with distance, and
+uploads delta messages every 5 s through ingest.handle_upload.
+
+The dashboard is modelled as a client applying every broadcast frame in
+order. Reports rows handed to the history, bins and bytes broadcast, status
+changes the dashboard showed against the changes that really happened, and
+the final position error of what it shows.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+from latency import percentiles
+from uploader import DeltaEncoder
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+class Fleet:
+    def __init__(self, args, rng):
+        columns = math.ceil(math.sqrt(args.gateways * 1.25))
+        self.gateways = {
+            f"gw-{number}": ((number % columns) * 200.0, (number // columns) * 200.0)
+            for number in range(args.gateways)
+        }
+        width = columns * 200.0
+        height = math.ceil(args.gateways / columns) * 200.0
+        self.bins = {str(number): (rng.uniform(-50, width - 150), rng.uniform(-50, height - 150))
+                     for number in range(1, args.bins + 1)}
+        self.hears = {gateway: [] for gateway in self.gateways}
+        for bin_id, (x, y) in self.bins.items():
+            distances = {gateway: math.dist((x, y), position) for gateway, position in self.gateways.items()}
+            heard_by = [gateway for gateway, distance in distances.items() if distance <= args.radius]
+            for gateway in heard_by or [min(distances, key=distances.get)]:
+                self.hears[gateway].append(bin_id)
+        self.status = {bin_id: "OK" for bin_id in self.bins}
+        self.phase = {bin_id: rng.randrange(30) for bin_id in self.bins}
+
+def run(args):
+    from WebSocket.ingest import handle_upload
+    from WebSocket.merge import bin_merger
+    from WebSocket.metrics import INGEST_RECORDS
+
+    rng = random.Random(args.seed)
+    clock = Clock()
+    bin_merger.clock = clock
+    fleet = Fleet(args, rng)
+    gateways = {}
+    for gateway in fleet.gateways:
+        gateways[gateway] = {
+            "encoder": DeltaEncoder(gateway, keyframe_interval=60, clock=clock),
+            "heard": {},  # bin -> (time heard, status heard)
+            "table": {},  # bin -> bin dict, as central.py uploads it
+            "positions": {},
+            "dump_phase": rng.randrange(15),
+            "solve_phase": rng.randrange(60),
+            "upload_phase": rng.randrange(5),
+        }
+
+    displayed = {}
+    shown_changes = 0
+    true_changes = 0
+    frames = bins_broadcast = bytes_broadcast = 0
+    ingest_times = []
+    rows_before = INGEST_RECORDS.child.value
+
+    for second in range(args.duration):
+        clock.now += 1
+        for bin_id in fleet.bins:
+            if (second - fleet.phase[bin_id]) % 30:
+                continue
+            if rng.random() < 0.05:
+                fleet.status[bin_id] = "FULL" if fleet.status[bin_id] == "OK" else "OK"
+                true_changes += 1
+        for gateway, state in gateways.items():
+            heard = state["heard"]
+            for bin_id in fleet.hears[gateway]:
+                if (second - fleet.phase[bin_id]) % 30 == 0 and rng.random() < 0.8:
+                    heard[bin_id] = (second, fleet.status[bin_id])
+
+            if (second - state["solve_phase"]) % 60 == 0:
+                for bin_id in fleet.hears[gateway]:
+                    x, y = fleet.bins[bin_id]
+                    error = 0.5 + math.dist((x, y), fleet.gateways[gateway]) / 100
+                    state["positions"][bin_id] = ([x + rng.gauss(0, error), y + rng.gauss(0, error)], error)
+
+            if (second - state["dump_phase"]) % 15 == 0:
+                table = {}
+                for bin_id, (when, status) in heard.items():
+                    last_seen = second - when
+                    entry = {"last_seen": last_seen, "status": "OFFLINE" if last_seen > 120 else status}
+                    if bin_id in state["positions"]:
+                        entry["coord"], entry["coord_error"] = state["positions"][bin_id]
+                    table[bin_id] = entry
+                state["table"] = table
+
+            if (second - state["upload_phase"]) % 5 or not state["table"]:
+                continue
+            message = state["encoder"].encode(dict(state["table"]))
+            if message is None:
+                continue
+            started = time.perf_counter()
+            status, reply, updates = handle_upload(json.loads(json.dumps(message)))
+            ingest_times.append(time.perf_counter() - started)
+            if status == 409:
+                state["encoder"].resync()
+            for data in updates.values():
+                frames += 1
+                bins_broadcast += len(data)
+                bytes_broadcast += len(json.dumps(data, separators=(",", ":")))
+                for bin_id, values in data.items():
+                    shown = displayed.get(bin_id)
+                    if shown is not None and shown.get("status") != values.get("status"):
+                        shown_changes += 1
+                    displayed[bin_id] = values
+
+    errors = [math.dist(values["coord"], fleet.bins[bin_id]) for bin_id, values in displayed.items()
+              if values.get("coord")]
+    minutes = args.duration / 60
+    return {
+        "gateways_per_bin": sum(len(bins) for bins in fleet.hears.values()) / len(fleet.bins),
+        "uploads": len(ingest_times),
+        "ingest": percentiles(ingest_times),
+        "history_rows_per_min": (INGEST_RECORDS.child.value - rows_before) / minutes,
+        "frames_per_min": frames / minutes,
+        "bins_broadcast_per_min": bins_broadcast / minutes,
+        "kb_broadcast_per_min": bytes_broadcast / 1024 / minutes,
+        "true_status_changes": true_changes,
+        "dashboard_status_changes": shown_changes,
+        "dashboard_position_error_m": sum(errors) / len(errors) if errors else None,
+        "bins_shown": len(displayed),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--gateways", type=int, default=20)
+    parser.add_argument("--bins", type=int, default=2000)
+    parser.add_argument("--duration", type=int, default=600, help="simulated seconds")
+    parser.add_argument("--radius", type=float, default=180)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+    results = {"gateways": args.gateways, "bins": args.bins, "duration_s": args.duration}
+    results.update(run(args))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Gateway throughput and serial-to-upload delay, by replaying a capture
+through replay.py at several speeds.
+
+    python benchmarks/bench_gateway_replay.py [--capture capture.bin] [--speeds 1,10,0]
+                                              [--bins 200] [--seconds 120] [--receivers 1] [--compare-dedup]
+
+Without --capture one is synthesised in the formats mesh_receiver.ino and
+beacon_receiver.ino print: a routing-table dump every 15 s, each bin's
+status broadcast every 30 s, and every beacon hearing every bin about once a
+minute. With --receivers N there are N mesh and N beacon receivers whose
+coverage overlaps: each mesh receiver hears 70% of the status broadcasts and
+prints its own dump, each beacon reading is relayed by every beacon receiver
+90% of the time, up to 200 ms apart. --compare-dedup also runs every speed
+with duplicate suppression off. Each run is a replay.py process of its own
+so gateway state starts fresh.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from central import BEACON_LOCATIONS
+from serial_capture import CaptureWriter
+
+def synthesise(path, bins, seconds, receivers=1, seed=1):
+    rng = random.Random(seed)
+    if receivers == 1:
+        mesh_ports, beacon_ports = ["mesh"], ["beacon"]
+    else:
+        mesh_ports = [f"mesh:R{number}" for number in range(1, receivers + 1)]
+        beacon_ports = [f"beacon:R{number}" for number in range(1, receivers + 1)]
+    # Chance that one receiver gets a given broadcast
+    hear_mesh, hear_beacon = (1, 1) if receivers == 1 else (0.7, 0.9)
+    status = {node: "OK" for node in range(1, bins + 1)}
+    heard = {port: {node: 0.0 for node in status} for port in mesh_ports}
+    position = {node: (rng.uniform(-6, 6), rng.uniform(-4, 4)) for node in status}
+    events = []
+    for node in status:
+        for when in range(rng.randint(0, 29), seconds, 30):
+            events.append((when + rng.random(), "mesh", node))
+        for beacon in BEACON_LOCATIONS:
+            for when in range(rng.randint(0, 59), seconds, 60):
+                events.append((when + rng.random(), "beacon", (beacon, node)))
+    # The receivers' clocks have nothing to do with the gateway's upload timer
+    for port in mesh_ports:
+        for when in range(rng.randint(0, 14), seconds, 15):
+            events.append((when + rng.random(), "dump", port))
+    events.sort(key=lambda event: event[0])
+
+    writes = []
+    for when, kind, subject in events:
+        if kind == "mesh":
+            if rng.random() < 0.05:
+                status[subject] = "FULL" if status[subject] == "OK" else "OK"
+            line = b"Received from %d: %s\r\n" % (subject, status[subject].encode())
+            for port in mesh_ports:
+                if rng.random() < hear_mesh:
+                    heard[port][subject] = when
+                    writes.append((when, port, line))
+        elif kind == "dump":
+            lines = [b"Routing Table:\r\n"]
+            lines += [b"Node %d - Last Seen %ds ago - Status %s\r\n" % (node, when - heard[subject][node], status[node].encode())
+                      for node in status]
+            lines.append(b"====================\n\r\n")
+            writes.append((when, subject, b"".join(lines)))
+        else:
+            beacon, node = subject
+            (bx, by), (x, y) = BEACON_LOCATIONS[beacon], position[node]
+            distance = max(0.5, ((x - bx) ** 2 + (y - by) ** 2) ** 0.5 + rng.gauss(0, 0.3))
+            # rssi_to_distance() inverted
+            rssi = round(-120 - 25 * math.log10(distance / 4))
+            line = json.dumps({"id": beacon, "b": node, "r": rssi}, separators=(",", ":")).encode() + b"\r\n"
+            for port in beacon_ports:
+                if rng.random() < hear_beacon:
+                    delay = rng.uniform(0, 0.2) if receivers > 1 else 0
+                    writes.append((when + delay, port, line))
+    writes.sort(key=lambda write: write[0])
+
+    with CaptureWriter(path, mesh_ports + beacon_ports) as capture:
+        for when, port, data in writes:
+            capture.write(port, data, when)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capture")
+    parser.add_argument("--speeds", default="10,0")
+    parser.add_argument("--bins", type=int, default=200)
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--upload-interval", type=float, default=5)
+    parser.add_argument("--receivers", type=int, default=1, help="mesh and beacon receivers each, when synthesising")
+    parser.add_argument("--compare-dedup", action="store_true", help="also run with duplicate suppression off")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    capture = args.capture
+    if capture is None:
+        capture = os.path.join(workdir, "capture.bin")
+        synthesise(capture, args.bins, args.seconds, args.receivers)
+
+    results = {"capture": args.capture or {"bins": args.bins, "seconds": args.seconds, "receivers": args.receivers},
+               "runs": {}}
+    for speed in args.speeds.split(","):
+        for dedup in (True, False) if args.compare_dedup else (True,):
+            output = subprocess.run(
+                [sys.executable, os.path.join(ROOT, "replay.py"), os.path.abspath(capture),
+                 "--speed", speed, "--upload-interval", str(args.upload_interval)] + ([] if dedup else ["--no-dedup"]),
+                cwd=workdir, check=True, capture_output=True, text=True,
+            ).stdout
+            run = json.loads(output)
+            name = f"{speed}x" if float(speed) else "max"
+            results["runs"][name if dedup else name + " no-dedup"] = {
+                key: run[key] for key in ("elapsed_s", "run_s", "lines", "lines_per_s", "fixes", "fixes_per_s",
+                                          "uploads", "serial_to_handled", "serial_to_upload", "duplicates_merged",
+                                          "mean_last_seen_s")
+            }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+History API: keyset pages against OFFSET pages of model instances, deep into
+one bin's history and the fleet's, plus downsampling (from the raw rows and
+again once they are rolled up) and cached responses.
+
+    python benchmarks/bench_history_api.py [--rows 1000000] [--devices 200] [--limit 500]
+
+"offset" is what a history view built the obvious way would do:
+SensorData instances sliced with [offset:offset + limit]. "keyset" is
+history_api.page() with the cursor of the previous page. Both fetch the
+same page at several depths.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+def timed(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=500)
+    args = parser.parse_args()
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from django.test import Client
+    from WebSocket.history_api import encode_cursor, history_cache, page
+    from WebSocket.models import SensorData
+    from WebSocket.rollups import rollup_history
+    call_command("migrate", verbosity=0)
+
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1)
+    with connection.cursor() as cursor, transaction.atomic():
+        rows = []
+        for i in range(args.rows):
+            when = (start + timedelta(seconds=i // args.devices * 5)).isoformat(sep=" ")
+            rows.append((str(i % args.devices), when, "FULL" if rng.random() < 0.1 else "OK",
+                         rng.uniform(0, 1000), rng.uniform(0, 1000), rng.randint(0, 120)))
+            if len(rows) == 10000 or i == args.rows - 1:
+                cursor.executemany('INSERT INTO "WebSocket_sensordata" (device_id, timestamp, status, x, y, last_seen) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                rows = []
+
+    results = {"rows": args.rows, "devices": args.devices, "limit": args.limit}
+    device = str(args.devices // 2)
+    for scope, device_id, queryset in (("bin", device, SensorData.objects.for_device(device)),
+                                       ("fleet", None, SensorData.objects.order_by("-timestamp", "-id"))):
+        depths = {}
+        total = queryset.count()
+        for fraction in (0, 0.5, 0.95):
+            offset = int(total * fraction) // args.limit * args.limit
+            offset_ms, instances = timed(lambda: list(queryset[offset:offset + args.limit]))
+            # The cursor a client paging this far would hold
+            cursor = None
+            if offset:
+                previous = queryset[offset - 1]
+                cursor = encode_cursor(previous.timestamp, previous.id)
+            keyset_ms, found = timed(lambda: page(device_id=device_id, limit=args.limit, cursor=cursor))
+            assert [r.timestamp.isoformat() for r in instances] == [r["timestamp"] for r in found["readings"]]
+            depths[f"{int(fraction * 100)}%"] = {"offset": offset, "offset_ms": offset_ms, "keyset_ms": keyset_ms}
+        results[scope] = depths
+
+    client = Client()
+    end = start + timedelta(seconds=args.rows // args.devices * 5)
+    query = {"start": start.isoformat(), "end": end.isoformat(), "points": 200}
+    history_cache.cache.clear()
+    cold_ms, response = timed(lambda: client.get(f"/websocket/history/{device}", query), repeat=1)
+    warm_ms, _ = timed(lambda: client.get(f"/websocket/history/{device}", query), repeat=20)
+    results["bin_downsample_200_points"] = {"cold_ms": cold_ms, "cached_ms": warm_ms,
+                                            "points": len(json.loads(response.content)["points"])}
+    history_cache.cache.clear()
+    cold_ms, _ = timed(lambda: client.get("/websocket/history", query), repeat=1)
+    warm_ms, _ = timed(lambda: client.get("/websocket/history", query), repeat=20)
+    results["fleet_downsample_200_points"] = {"cold_ms": cold_ms, "cached_ms": warm_ms}
+
+    # Buckets of a minute or more come from the rollups once they exist
+    rollup_history()
+    for scope, path in (("bin", f"/websocket/history/{device}"), ("fleet", "/websocket/history")):
+        history_cache.cache.clear()
+        rollup_ms, _ = timed(lambda: client.get(path, query), repeat=1)
+        results[f"{scope}_downsample_200_points"]["rollup_cold_ms"] = rollup_ms
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Binary history log against the indexed SensorData table: bytes per reading,
+append rate and one-device range scans.
+
+    python benchmarks/bench_history_log.py [--rows 1000000] [--devices 200]
+
+Both stores get the same synthetic 5-second snapshots. Scans ask for one
+device over a one-hour window (720 readings) and over 5 minutes (60).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+def readings(rows, devices, start):
+    rng = random.Random(1)
+    for i in range(rows):
+        device = i % devices
+        yield (str(device), start + timedelta(seconds=5 * (i // devices)),
+               "FULL" if rng.random() < 0.1 else "OK", [device * 1.5, device * 0.5], rng.randint(0, 120))
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1e6, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--segment-records", type=int, default=250000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from WebSocket.history_log import HistoryLog
+    from WebSocket.models import SensorData
+    call_command("migrate", verbosity=0)
+
+    start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    results = {"rows": args.rows, "devices": args.devices}
+
+    log = HistoryLog(os.path.join(workdir, "history"), args.segment_records)
+    started = time.perf_counter()
+    batch = []
+    for reading in readings(args.rows, args.devices, start):
+        batch.append(reading)
+        if len(batch) == 5000:
+            log.append(batch)
+            batch = []
+    log.append(batch)
+    log_seconds = time.perf_counter() - started
+
+    sqlite_size_before = os.path.getsize(settings.DATABASES["default"]["NAME"])
+    started = time.perf_counter()
+    batch = []
+    with transaction.atomic():
+        for device_id, timestamp, status, coord, last_seen in readings(args.rows, args.devices, start):
+            row = SensorData(device_id=device_id, timestamp=timestamp, status=status, last_seen=last_seen)
+            row.coord = coord
+            batch.append(row)
+            if len(batch) == 5000:
+                SensorData.objects.bulk_create(batch)
+                batch = []
+        SensorData.objects.bulk_create(batch)
+    sqlite_seconds = time.perf_counter() - started
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    results["bytes_per_reading"] = {
+        "binary": directory_size(log.directory) / args.rows,
+        "sqlite": (os.path.getsize(settings.DATABASES["default"]["NAME"]) - sqlite_size_before) / args.rows,
+    }
+    results["appends_per_s"] = {"binary": args.rows / log_seconds, "sqlite": args.rows / sqlite_seconds}
+
+    device = str(args.devices // 2)
+    end = start + timedelta(seconds=5 * (args.rows // args.devices))
+    for label, window in (("1h", timedelta(hours=1)), ("5min", timedelta(minutes=5))):
+        binary_us, binary_rows = timed(lambda: log.scan(device, end - window, end), args.repeat)
+        sqlite_us, sqlite_rows = timed(lambda: list(
+            SensorData.objects.for_device(device, end - window, end).values_list(
+                "timestamp", "status", "x", "y", "last_seen")), args.repeat)
+        assert len(binary_rows) == len(sqlite_rows)
+        results[f"scan_{label}_us"] = {"binary": binary_us, "sqlite": sqlite_us, "readings": len(binary_rows)}
+
+    log.close()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Per-device history queries on a multi-million-row SensorData table, before
+and after the (device_id, timestamp) and timestamp indexes.
+
+    python benchmarks/bench_history_queries.py [--rows 2000000] [--devices 200]
+
+Builds a throwaway SQLite database with the project's migrations, fills it
+with synthetic 5-second snapshots, then times latest_per_device(),
+latest_for() and a one-hour for_device() range, first with the indexes
+dropped and then with them rebuilt.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+INDEXES = {
+    "sensordata_device_time": '"device_id", "timestamp"',
+    "sensordata_time": '"timestamp"',
+}
+
+def fill(cursor, rows, devices, start):
+    """Insert ``rows`` snapshots round-robin over ``devices``, 5 s apart per device"""
+    rng = random.Random(1)
+    batch = []
+    for i in range(rows):
+        device = i % devices
+        when = start + timedelta(seconds=5 * (i // devices))
+        # Stored the way Django's SQLite backend writes aware datetimes (naive UTC)
+        batch.append((str(device), when.replace(tzinfo=None).isoformat(sep=" "), rng.randint(0, 120),
+                      "FULL" if rng.random() < 0.1 else "OK", float(device), float(device)))
+        if len(batch) == 10000:
+            cursor.executemany(
+                'INSERT INTO "WebSocket_sensordata" (device_id, timestamp, last_seen, status, x, y) '
+                "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        cursor.executemany(
+            'INSERT INTO "WebSocket_sensordata" (device_id, timestamp, last_seen, status, x, y) '
+            "VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from WebSocket.models import DeviceState, SensorData
+    call_command("migrate", verbosity=0)
+
+    start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    span = timedelta(seconds=5 * (args.rows // args.devices))
+    with connection.cursor() as cursor:
+        for name in INDEXES:
+            cursor.execute(f'DROP INDEX "{name}"')
+        started = time.perf_counter()
+        with transaction.atomic():
+            fill(cursor, args.rows, args.devices, start)
+            DeviceState.objects.bulk_create(
+                [DeviceState(device_id=str(d)) for d in range(args.devices)], batch_size=500)
+        fill_seconds = time.perf_counter() - started
+
+    device = str(args.devices // 2)
+    window_end = start + span
+    window_start = window_end - timedelta(hours=1)
+    queries = {
+        "latest_per_device": lambda: len(list(SensorData.objects.latest_per_device().values("id"))),
+        "latest_for": lambda: SensorData.objects.latest_for(device),
+        "for_device_1h": lambda: len(list(
+            SensorData.objects.for_device(device, window_start, window_end).values("id", "status"))),
+    }
+
+    results = {"rows": args.rows, "devices": args.devices, "fill_s": fill_seconds}
+    # Without indexes every query scans the table (latest_per_device once per
+    # device), one pass is enough
+    results["before_ms"] = {name: timed(query, 1) for name, query in queries.items()}
+
+    with connection.cursor() as cursor:
+        started = time.perf_counter()
+        for name, columns in INDEXES.items():
+            cursor.execute(f'CREATE INDEX "{name}" ON "WebSocket_sensordata" ({columns})')
+        results["index_build_s"] = time.perf_counter() - started
+    assert queries["latest_per_device"]() == args.devices
+    assert queries["for_device_1h"]() == min(720, args.rows // args.devices)
+    results["after_ms"] = {name: timed(query, args.repeat) for name, query in queries.items()}
+    results["speedup"] = {name: results["before_ms"][name] / results["after_ms"][name] for name in queries}
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
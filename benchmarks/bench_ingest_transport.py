@@ -0,0 +1,77 @@
+"""
+Per-update cost of the HTTP ingest view against the persistent WebSocket
+ingest channel, side by side against a running server.
+
+    cd SmartBin && daphne -p 8000 SmartBin.asgi:application
+    python benchmarks/bench_ingest_transport.py [--updates 2000] [--bins 200] [--changed 5]
+
+Both transports send the same stream of sequenced uploads (a keyframe then
+deltas of --changed bins), one at a time, waiting for each acknowledgement.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latency import percentiles
+from uploader import DeltaEncoder, HttpTransport, WebSocketTransport
+
+def updates(gateway_id, count, bins, changed, seed=1):
+    """Yield encoded upload bodies for a gateway whose bins keep changing"""
+    rng = random.Random(seed)
+    encoder = DeltaEncoder(gateway_id, keyframe_interval=float("inf"))
+    state = {str(b): {"status": "OK", "last_seen": 0, "coord": [b, b]} for b in range(bins)}
+    for _ in range(count):
+        state = dict(state)
+        for bin_id in rng.sample(range(bins), changed):
+            state[str(bin_id)] = {
+                "status": rng.choice(["OK", "FULL"]),
+                "last_seen": rng.randint(0, 120),
+                "coord": [bin_id, bin_id],
+            }
+        yield json.dumps(encoder.encode(state), separators=(",", ":")).encode()
+
+def run(transport, bodies):
+    latencies = []
+    started = time.perf_counter()
+    for body in bodies:
+        sent = time.perf_counter()
+        status, reply = transport.send(body)
+        latencies.append(time.perf_counter() - sent)
+        if status not in (200, 201):
+            sys.exit(f"Upload failed: {status} {reply}")
+    elapsed = time.perf_counter() - started
+    transport.close()
+    return {
+        "updates_per_s": len(latencies) / elapsed,
+        **percentiles(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--http-url", default="http://127.0.0.1:8000/websocket/dashboard")
+    parser.add_argument("--ws-url", default="ws://127.0.0.1:8000/ws/gateway/")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--bins", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=5, help="bins changed per update")
+    parser.add_argument("--no-gzip", action="store_true")
+    args = parser.parse_args()
+
+    compress = not args.no_gzip
+    # Separate gateway ids so both runs start with a keyframe
+    run_id = int(time.time())
+    results = {
+        "http": run(HttpTransport(args.http_url, compress=compress),
+                    updates(f"bench-http-{run_id}", args.updates, args.bins, args.changed)),
+        "websocket": run(WebSocketTransport(args.ws_url, compress=compress),
+                         updates(f"bench-ws-{run_id}", args.updates, args.bins, args.changed)),
+    }
+    results["speedup"] = results["websocket"]["updates_per_s"] / results["http"]["updates_per_s"]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Request-path cost of storing uploads: one synchronous bulk insert per upload
+against the latest-state upsert plus write-behind history buffer.
+
+    python benchmarks/bench_ingest_write_behind.py [--uploads 500] [--bins 200]
+
+Runs against a throwaway SQLite file with the project's settings, so commits
+pay the same fsync cost as the real database.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+from latency import percentiles
+
+def uploads(count, bins):
+    for i in range(count):
+        yield {
+            str(b): {"status": "FULL" if (b + i) % 7 == 0 else "OK", "last_seen": i % 120, "coord": [b, b]}
+            for b in range(bins)
+        }
+
+def run(store, payloads):
+    latencies = []
+    started = time.perf_counter()
+    for payload in payloads:
+        sent = time.perf_counter()
+        store(payload)
+        latencies.append(time.perf_counter() - sent)
+    request_time = time.perf_counter() - started
+    latencies.sort()
+    return latencies, request_time, started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=500)
+    parser.add_argument("--bins", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+    from WebSocket.ingest import build_records, handle_upload
+    from WebSocket.models import SensorData
+    from WebSocket.writer import ingest_writer
+
+    def synchronous(payload):
+        SensorData.objects.bulk_create(build_records(payload))
+
+    results = {"uploads": args.uploads, "bins": args.bins}
+    for name, store in (("synchronous", synchronous), ("write_behind", lambda p: handle_upload(p))):
+        SensorData.objects.all().delete()
+        latencies, request_time, started = run(store, uploads(args.uploads, args.bins))
+        if name == "write_behind":
+            ingest_writer.close()
+        stored = time.perf_counter() - started
+        assert SensorData.objects.count() == args.uploads * args.bins
+        results[name] = {
+            **percentiles(latencies),
+            "uploads_per_s": args.uploads / request_time,
+            "rows_per_s_stored": args.uploads * args.bins / stored,
+        }
+    results["write_behind"]["flushes"] = ingest_writer.flushes
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
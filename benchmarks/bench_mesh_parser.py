@@ -0,0 +1,110 @@
+"""
+Throughput of the routing-table parser against the split()/loop parser that
+handle_mesh_serial used before, over mesh receiver output.
+
+    python benchmarks/bench_mesh_parser.py [--nodes 50] [--dumps 2000] [--capture mesh.log]
+
+Without --capture, output is synthesised in the exact format printed by
+mesh_receiver.ino (routing-table dumps with interleaved "Received from" lines).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mesh_parser import RoutingTableParser
+
+def recorded_output(nodes, dumps, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(dumps):
+        for _ in range(5):
+            lines.append(b"Received from %d: %s" % (rng.randint(1, nodes), rng.choice([b"OK", b"FULL"])))
+        lines.append(b"Routing Table:")
+        for node_id in range(1, nodes + 1):
+            lines.append(b"Node %d - Last Seen %ds ago - Status %s"
+                         % (node_id, rng.randint(0, 200), rng.choice([b"OK", b"FULL"])))
+        lines.append(b"====================")
+    return lines
+
+def legacy_parse(lines):
+    """The per-line parser from handle_mesh_serial, minus prints and locking"""
+    table = {}
+    in_block = False
+    for raw in lines:
+        line = raw.decode('utf-8', errors='ignore').strip()
+        if line.startswith("Routing Table:"):
+            in_block = True
+            continue
+        if not in_block or not line.startswith("Node"):
+            in_block = False
+            continue
+        parts = line.split()
+        if len(parts) >= 9 and "Last" in parts and "Status" in parts:
+            node_id = int(parts[1])
+            last_seen = 0
+            for i in range(len(parts)):
+                if i < len(parts) - 1 and parts[i+1] == "ago" and parts[i].endswith("s"):
+                    try:
+                        last_seen = int(float(parts[i].replace("s", "").strip()))
+                        break
+                    except ValueError:
+                        pass
+            status = "UNKNOWN"
+            for i in range(len(parts)):
+                if parts[i] == "Status:" or parts[i] == "Status":
+                    if i + 1 < len(parts):
+                        status = parts[i + 1]
+                        break
+            table[node_id] = (last_seen, status)
+    return table
+
+def incremental_parse(lines):
+    table = {}
+    parser = RoutingTableParser()
+    for line in lines:
+        _, snapshot = parser.feed_line(line)
+        if snapshot:
+            table.update(snapshot)
+    return table
+
+def best_of(func, lines, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(lines)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--dumps", type=int, default=2000)
+    parser.add_argument("--capture", help="file of raw mesh receiver output to parse instead")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            lines = [line.rstrip(b"\r\n") for line in f]
+    else:
+        lines = recorded_output(args.nodes, args.dumps)
+
+    legacy_time, legacy_table = best_of(legacy_parse, lines, args.repeat)
+    new_time, new_table = best_of(incremental_parse, lines, args.repeat)
+    if legacy_table != new_table:
+        sys.exit("Parsers disagree on the final routing table")
+
+    print(json.dumps({
+        "lines": len(lines),
+        "legacy_lines_per_s": len(lines) / legacy_time,
+        "incremental_lines_per_s": len(lines) / new_time,
+        "speedup": legacy_time / new_time,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
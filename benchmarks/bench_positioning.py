@@ -0,0 +1,79 @@
+"""
+Position solve rate: the old per-bin three-beacon closed form against the
+batched least-squares solver (NumPy and pure-Python paths).
+
+    python benchmarks/bench_positioning.py [--bins 10000] [--beacons 6]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import positioning
+from positioning import MultilaterationSolver
+
+def closed_form(locations, distances):
+    """The trilateration() formula central.py used, for B1/B2/B3 only"""
+    (x1, y1), (x2, y2), (x3, y3) = locations["B1"], locations["B2"], locations["B3"]
+    r1, r2, r3 = distances["B1"], distances["B2"], distances["B3"]
+    A = 2 * (x2 - x1)
+    B = 2 * (y2 - y1)
+    C = r1**2 - r2**2 - x1**2 + x2**2 - y1**2 + y2**2
+    D = 2 * (x3 - x2)
+    E = 2 * (y3 - y2)
+    F = r2**2 - r3**2 - x2**2 + x3**2 - y2**2 + y3**2
+    return ((C * E - F * B) / (E * A - B * D), (C * D - A * F) / (B * D - A * E))
+
+def make_site(bins, beacons, noise, seed=1):
+    rng = random.Random(seed)
+    locations = {"B%d" % (i + 1): (rng.uniform(-20, 20), rng.uniform(-20, 20)) for i in range(beacons)}
+    truth = {}
+    readings = {}
+    for bin_id in range(bins):
+        x, y = rng.uniform(-15, 15), rng.uniform(-15, 15)
+        truth[bin_id] = (x, y)
+        readings[bin_id] = {
+            b: max(0.1, math.hypot(x - bx, y - by) * (1 + rng.gauss(0, noise)))
+            for b, (bx, by) in locations.items()
+        }
+    return locations, truth, readings
+
+def rms_error(truth, positions):
+    errors = [math.hypot(p[0] - truth[b][0], p[1] - truth[b][1]) for b, p in positions.items() if p]
+    return math.sqrt(sum(e * e for e in errors) / len(errors)) if errors else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bins", type=int, default=10000)
+    parser.add_argument("--beacons", type=int, default=6)
+    parser.add_argument("--noise", type=float, default=0.1, help="relative range noise")
+    args = parser.parse_args()
+
+    locations, truth, readings = make_site(args.bins, args.beacons, args.noise)
+    results = {"bins": args.bins, "beacons": args.beacons}
+
+    started = time.perf_counter()
+    legacy = {b: closed_form(locations, d) for b, d in readings.items()}
+    elapsed = time.perf_counter() - started
+    results["closed_form_3_beacons"] = {"fixes_per_s": args.bins / elapsed, "rms_error_m": rms_error(truth, legacy)}
+
+    variants = [("least_squares_python", False)]
+    if positioning.np is not None:
+        variants.append(("least_squares_numpy", True))
+    for name, use_numpy in variants:
+        solver = MultilaterationSolver(locations, use_numpy=use_numpy)
+        started = time.perf_counter()
+        fixes = solver.solve(readings)
+        elapsed = time.perf_counter() - started
+        positions = {b: (f.x, f.y) if f else None for b, f in fixes.items()}
+        results[name] = {"fixes_per_s": args.bins / elapsed, "rms_error_m": rms_error(truth, positions)}
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
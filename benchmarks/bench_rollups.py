@@ -0,0 +1,105 @@
+"""
+Rollup throughput and retention chunk times on a synthetic SensorData
+history.
+
+    python benchmarks/bench_rollups.py [--rows 1000000] [--devices 200]
+
+Fills a throwaway SQLite database with 5-second snapshots, rolls
+everything up, then applies retention to the older half of them and
+reports how long a concurrent writer had to wait while old rows were deleted.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "SmartBin"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartBin.settings")
+
+import django
+from django.conf import settings
+
+from latency import percentiles
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--chunk", type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from WebSocket import rollups
+    from WebSocket.models import SensorData, SensorRollup
+    call_command("migrate", verbosity=0)
+
+    per_device = args.rows // args.devices
+    step = 5
+    start = (timezone.now() - timedelta(seconds=step * per_device)).replace(tzinfo=None)
+    rng = random.Random(1)
+    with connection.cursor() as cursor, transaction.atomic():
+        batch = []
+        for i in range(per_device * args.devices):
+            when = start + timedelta(seconds=step * (i // args.devices))
+            status = "FULL" if rng.random() < 0.05 else "OK"
+            batch.append((str(i % args.devices), when.isoformat(sep=" "), status, 1.0, 2.0))
+            if len(batch) == 10000 or i == per_device * args.devices - 1:
+                cursor.executemany(
+                    'INSERT INTO "WebSocket_sensordata" (device_id, timestamp, status, x, y) '
+                    "VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+
+    started = time.perf_counter()
+    rolled_up = rollups.rollup_history()
+    rollup_seconds = time.perf_counter() - started
+
+    # A concurrent writer inserting one row at a time shows how long retention
+    # makes the ingest writer wait for the database
+    waits = []
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            sent = time.perf_counter()
+            SensorData.objects.create(device_id="writer", status="OK")
+            waits.append(time.perf_counter() - sent)
+            time.sleep(0.01)
+        connection.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    started = time.perf_counter()
+    # Pretend the clock is such that half of the raw rows are past retention
+    now = timezone.now() - timedelta(seconds=step * per_device / 2) + timedelta(days=settings.RETENTION_RAW_DAYS)
+    deleted = rollups.apply_retention(now=now, chunk_size=args.chunk)
+    retention_seconds = time.perf_counter() - started
+    stop.set()
+    thread.join()
+
+    print(json.dumps({
+        "rows": per_device * args.devices,
+        "devices": args.devices,
+        "rolled_up": rolled_up,
+        "rollup_rows_per_s": rolled_up / rollup_seconds,
+        "rollups": SensorRollup.objects.count(),
+        "deleted": deleted,
+        "retention_s": retention_seconds,
+        "writer_inserts": percentiles(waits),
+        "rows_left": SensorData.objects.count(),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Routing-table contention: the old dict behind routing_table_lock against
+routing_store.RoutingStore, under routing-table dumps arriving far faster
+than the mesh receiver prints them.
+
+    python benchmarks/bench_routing_store.py [--bins 2000] [--serial-threads 2] [--rate 50]
+                                             [--duration 5] [--cycle 0.01] [--upload-every 5]
+
+Each serial thread applies --rate whole dumps per second (0: back to back;
+the mesh receiver prints one every 15 s), the processing loop runs its
+offline/next_nearest pass every --cycle seconds and serializes the table for
+upload every --upload-every cycles. Reports how long a serial thread spends
+per dump (blocked on the lock, or queueing the update), dumps applied per
+second, processing cycle times, and how many upload tables were torn: every
+dump gives all bins the same last_seen, so a consistent table has one value.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import central
+from latency import percentiles
+from routing_store import RoutingStore
+from spatial_index import BinIndex
+
+def initial_bins(bins, seed=1):
+    rng = random.Random(seed)
+    return {
+        bin_id: {"status": "OK", "last_seen": 0, "coord": (rng.uniform(0, 500), rng.uniform(0, 500))}
+        for bin_id in range(1, bins + 1)
+    }
+
+def dumps(bins, seed):
+    """Endless routing-table dumps, about 10% of the bins FULL, last_seen = dump number"""
+    rng = random.Random(seed)
+    generation = 0
+    while True:
+        generation += 1
+        yield {bin_id: (generation % 100, "FULL" if rng.random() < 0.1 else "OK") for bin_id in range(1, bins + 1)}
+
+class Legacy:
+    """central.py before the routing store: one dict, one lock, entries mutated in place"""
+
+    def __init__(self, bins):
+        self.routing_table = {bin_id: dict(data) for bin_id, data in bins.items()}
+        self.routing_table_lock = threading.Lock()
+        self.bin_index = BinIndex()
+        for bin_id, data in self.routing_table.items():
+            self.bin_index.update(bin_id, data["coord"], data["status"])
+
+    def apply_routing_snapshot(self, snapshot):
+        with self.routing_table_lock:
+            for node_id, (last_seen, status) in snapshot.items():
+                node = self.routing_table.get(node_id)
+                if node is None:
+                    self.routing_table[node_id] = {"last_seen": last_seen, "status": status, "coord": None}
+                else:
+                    node["last_seen"] = last_seen
+                    if status != "OFFLINE":
+                        node["status"] = status
+                    self.bin_index.update(node_id, node.get("coord"), node["status"])
+        summary = ", ".join(f"{node_id}={status} ({last_seen}s)" for node_id, (last_seen, status) in snapshot.items())
+        print(f"Mesh: Routing Table Updated: {summary or 'no nodes'}")
+
+    def cycle(self, upload):
+        routing_table = self.routing_table
+        with self.routing_table_lock:
+            routing_table.copy()
+        with self.routing_table_lock:
+            for bin_id, bin_data in routing_table.items():
+                if bin_data.get("status") == "OFFLINE":
+                    continue
+                if bin_data.get("last_seen", 0) > central.OFFLINE_THRESHOLD:
+                    bin_data["status"] = "OFFLINE"
+                    self.bin_index.remove(bin_id)
+        with self.routing_table_lock:
+            for bin_id, bin_data in routing_table.items():
+                was_full = bin_data.get("was_full", False)
+                is_full_now = bin_data.get("status") == "FULL"
+                if was_full and not is_full_now:
+                    bin_data.pop("next_nearest", None)
+                    bin_data.pop("next_nearest_direction", None)
+                if is_full_now:
+                    nearest = self.bin_index.nearest(bin_data["coord"], k=1, exclude=bin_id)
+                    if nearest:
+                        bin_data["next_nearest"] = nearest[0].bin_id
+                        bin_data["next_nearest_direction"] = nearest[0].direction
+                bin_data["was_full"] = is_full_now
+        if not upload:
+            return None
+        with self.routing_table_lock:
+            local_routing_table = routing_table.copy()
+        serializable = {}
+        for bin_id, bin_data in local_routing_table.items():
+            # Shares the inner dicts with the table the serial threads are writing
+            data = bin_data.copy()
+            if isinstance(data.get("coord"), tuple):
+                data["coord"] = list(data["coord"])
+            serializable[str(bin_id)] = data
+        return serializable
+
+class Store:
+    """central.py now: updates go through routing_store, uploads read a snapshot"""
+
+    def __init__(self, bins):
+        central.routing_store = RoutingStore(bins, max_pending=central.ROUTING_MAX_PENDING)
+        central.bin_index = BinIndex()
+        central.serialized_bins.clear()
+        for bin_id, data in bins.items():
+            central.bin_index.update(bin_id, data["coord"], data["status"])
+
+    def apply_routing_snapshot(self, snapshot):
+        central.apply_routing_snapshot(snapshot)
+
+    def cycle(self, upload):
+        refresh = central.routing_store.submit(central.refresh_routing_table)
+        if not upload:
+            return None
+        snapshot = central.routing_store.wait(refresh, timeout=5)
+        return central.serialize_routing_table(snapshot.bins)
+
+    def close(self):
+        central.routing_store.close()
+
+def run(table, args):
+    stop = threading.Event()
+    per_dump = []
+    applied = [0] * args.serial_threads
+
+    def serial_thread(index):
+        clock = time.perf_counter
+        samples = []
+        interval = 1 / args.rate if args.rate else 0
+        next_time = time.monotonic()
+        for snapshot in dumps(args.bins, index):
+            if stop.is_set():
+                break
+            if interval:
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            started = clock()
+            table.apply_routing_snapshot(snapshot)
+            samples.append(clock() - started)
+            applied[index] += 1
+        per_dump.extend(samples)
+
+    threads = [threading.Thread(target=serial_thread, args=(i,)) for i in range(args.serial_threads)]
+    cycle_times = []
+    uploads = torn = 0
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    cycles = 0
+    while time.monotonic() - started < args.duration:
+        cycles += 1
+        cycle_started = time.perf_counter()
+        serializable = table.cycle(cycles % args.upload_every == 0)
+        cycle_times.append(time.perf_counter() - cycle_started)
+        if serializable is not None:
+            uploads += 1
+            if len({data["last_seen"] for data in serializable.values()}) > 1:
+                torn += 1
+        time.sleep(args.cycle)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    backlog = 0
+    if isinstance(table, Store):
+        # Dumps only count once the writer has applied them
+        backlog = central.routing_store.pending()
+        table.close()
+    return {
+        "dumps_applied_per_s": max(0, sum(applied) - backlog) / elapsed,
+        "writer_backlog": backlog,
+        "serial_time_per_dump": percentiles(per_dump, "us"),
+        "processing_cycle": percentiles(cycle_times, "us"),
+        "uploads": uploads,
+        "torn_uploads": torn,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bins", type=int, default=2000)
+    parser.add_argument("--serial-threads", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=50, help="dumps/s per serial thread, 0 for back to back")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--cycle", type=float, default=0.01)
+    parser.add_argument("--upload-every", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {"bins": args.bins, "serial_threads": args.serial_threads, "rate": args.rate}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, table in (("legacy", Legacy(initial_bins(args.bins))), ("store", Store(initial_bins(args.bins)))):
+            results[name] = run(table, args)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+How much solver work the RSSI store saves on a busy site, and how bounded it
+stays when bin ids churn, compared with solving on every beacon reading.
+
+    python benchmarks/bench_rssi_store.py [--bins 2000] [--minutes 30]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from central import rssi_to_distance, BEACON_LOCATIONS
+from rssi_store import RssiStore
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bins", type=int, default=2000, help="bins on site at any time")
+    parser.add_argument("--minutes", type=int, default=30, help="simulated duration")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between beacon broadcasts per bin")
+    parser.add_argument("--noise-db", type=float, default=3, help="RSSI noise standard deviation")
+    parser.add_argument("--churn", type=float, default=0.02, help="fraction of bins replaced per minute")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    store = RssiStore(rssi_to_distance)
+    legacy_table = {}
+    true_rssi = {}
+    next_bin_id = 0
+
+    def new_bin():
+        nonlocal next_bin_id
+        next_bin_id += 1
+        true_rssi[next_bin_id] = {b: rng.uniform(-110, -60) for b in BEACON_LOCATIONS}
+        return next_bin_id
+
+    active = [new_bin() for _ in range(args.bins)]
+    readings = legacy_solves = store_solves = 0
+    started = time.perf_counter()
+
+    for second in range(args.minutes * 60):
+        now = float(second)
+        if second % 60 == 0 and second:
+            for _ in range(int(args.bins * args.churn)):
+                active[rng.randrange(len(active))] = new_bin()
+        # Each bin is heard by every beacon once per interval
+        for index in range(second % int(args.interval), len(active), int(args.interval)):
+            bin_id = active[index]
+            for beacon_id, rssi in true_rssi[bin_id].items():
+                noisy = rssi + rng.gauss(0, args.noise_db)
+                readings += 1
+                legacy_table.setdefault(bin_id, {})[beacon_id] = rssi_to_distance(noisy)
+                legacy_solves += 1
+                store.add(bin_id, beacon_id, noisy, now)
+        # The processing thread runs twice a second, once is close enough here
+        store.expire(now)
+        store_solves += len(store.pop_dirty())
+
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "readings": readings,
+        "solves_every_reading": legacy_solves,
+        "solves_with_store": store_solves,
+        "solve_reduction": legacy_solves / max(store_solves, 1),
+        "bins_tracked_legacy": len(legacy_table),
+        "bins_tracked_store": len(store),
+        "store_adds_per_s": readings / elapsed,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
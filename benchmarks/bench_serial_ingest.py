@@ -0,0 +1,89 @@
+"""
+Compare the old poll/readline/sleep(0.05) serial loop with the framed reader
+in serial_reader.py, using a pty in place of the beacon receiver.
+
+    python benchmarks/bench_serial_ingest.py [--duration 5] [--latency-rate 10]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+
+from latency import percentiles
+from serial_reader import read_serial_frames
+from serial_sim import PtySerialPort
+
+def legacy_loop(ser, handle_frame, stop_event):
+    """The loop central.py used before the framed reader"""
+    while not stop_event.is_set():
+        if ser.in_waiting > 0:
+            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            handle_frame(line)
+        time.sleep(0.05)
+
+def beacon_lines(count):
+    for seq in range(count):
+        yield json.dumps({"id": "B%d" % (seq % 3 + 1), "b": seq % 50, "r": -80, "seq": seq})
+
+def run(loop, count, rate, duration):
+    """Feed ``count`` lines at ``rate`` lines/s and time how they come out"""
+    sent_at = {}
+    latencies = []
+    received = 0
+    stop_event = threading.Event()
+
+    def handle_frame(frame):
+        nonlocal received
+        now = time.monotonic()
+        seq = json.loads(frame)["seq"]
+        latencies.append(now - sent_at[seq])
+        received += 1
+        if received == count:
+            stop_event.set()
+
+    def on_write(index, when):
+        sent_at[index] = when
+
+    with PtySerialPort() as pty_port:
+        ser = serial.Serial(pty_port.port, 9600, timeout=1)
+        reader = threading.Thread(target=loop, args=(ser, handle_frame, stop_event), daemon=True)
+        reader.start()
+        started = time.monotonic()
+        pty_port.start_writer(beacon_lines(count), rate, on_write)
+        stop_event.wait(duration)
+        elapsed = time.monotonic() - started
+        stop_event.set()
+        reader.join(2)
+        ser.close()
+
+    return {
+        "received": received,
+        "lines_per_s": received / elapsed,
+        **percentiles(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5, help="seconds per throughput run")
+    parser.add_argument("--lines", type=int, default=200000, help="lines offered in the throughput run")
+    parser.add_argument("--latency-rate", type=float, default=10, help="lines/s in the latency run")
+    args = parser.parse_args()
+
+    latency_lines = int(args.latency_rate * args.duration)
+    results = {}
+    for name, loop in (("legacy", legacy_loop), ("framed", read_serial_frames)):
+        results[name] = {
+            "throughput": run(loop, args.lines, None, args.duration),
+            "latency": run(loop, latency_lines, args.latency_rate, args.duration + 2),
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
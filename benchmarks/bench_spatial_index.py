@@ -0,0 +1,98 @@
+"""
+Nearest-available-bin lookups: the linear routing-table scan against the grid
+index, for one processing cycle (every FULL bin looks up its nearest bin).
+
+    python benchmarks/bench_spatial_index.py [--bins 10000 100000] [--full 0.1]
+
+The linear scan is timed on a sample of the FULL bins and scaled up, a whole
+cycle at 100k bins would take minutes.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import BinIndex, calculate_distance
+
+def linear_nearest(routing_table, current_bin_id):
+    """The scan find_nearest_available_bin did before the index"""
+    current_coord = routing_table[current_bin_id]["coord"]
+    nearest_bin_id = None
+    min_distance = float('inf')
+    for bin_id, bin_data in routing_table.items():
+        if (bin_id == current_bin_id or
+            bin_data.get("status") == "FULL" or
+            bin_data.get("status") == "OFFLINE"):
+            continue
+        bin_coord = bin_data.get("coord")
+        if bin_coord:
+            distance = calculate_distance(current_coord, bin_coord)
+            if distance < min_distance:
+                min_distance = distance
+                nearest_bin_id = bin_id
+    return nearest_bin_id, min_distance
+
+def run(bins, full_fraction, cell_size, legacy_sample, seed=1):
+    rng = random.Random(seed)
+    # Keep density roughly constant: about one bin per 25 square metres
+    side = math.sqrt(bins * 25)
+    statuses = ["FULL"] * int(bins * full_fraction) + ["OFFLINE"] * int(bins * 0.05)
+    statuses += ["OK"] * (bins - len(statuses))
+    rng.shuffle(statuses)
+    routing_table = {
+        bin_id: {"status": statuses[bin_id], "coord": (rng.uniform(0, side), rng.uniform(0, side))}
+        for bin_id in range(bins)
+    }
+    full_bins = [b for b, d in routing_table.items() if d["status"] == "FULL"]
+
+    started = time.perf_counter()
+    index = BinIndex(cell_size)
+    for bin_id, bin_data in routing_table.items():
+        index.update(bin_id, bin_data["coord"], bin_data["status"])
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    answers = {b: index.nearest(routing_table[b]["coord"], exclude=b)[0] for b in full_bins}
+    index_cycle = time.perf_counter() - started
+
+    sample = full_bins[:legacy_sample]
+    started = time.perf_counter()
+    for bin_id in sample:
+        nearest_bin_id, distance = linear_nearest(routing_table, bin_id)
+        if abs(distance - answers[bin_id].distance) > 1e-9:
+            sys.exit(f"Index disagrees with the linear scan for bin {bin_id}")
+    linear_cycle = (time.perf_counter() - started) / len(sample) * len(full_bins)
+
+    # Incremental maintenance: a bin fills up and another empties
+    started = time.perf_counter()
+    for bin_id in rng.sample(range(bins), min(bins, 1000)):
+        index.update(bin_id, routing_table[bin_id]["coord"], rng.choice(["FULL", "OK"]))
+    update_cost = (time.perf_counter() - started) / min(bins, 1000)
+
+    return {
+        "bins": bins,
+        "full_bins": len(full_bins),
+        "index_build_s": build_time,
+        "index_cycle_s": index_cycle,
+        "linear_cycle_s_estimated": linear_cycle,
+        "speedup": linear_cycle / index_cycle,
+        "index_update_us": update_cost * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bins", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--full", type=float, default=0.1, help="fraction of bins that are FULL")
+    parser.add_argument("--cell-size", type=float, default=10.0)
+    parser.add_argument("--legacy-sample", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps([run(n, args.full, args.cell_size, args.legacy_sample) for n in args.bins], indent=2))
+
+if __name__ == "__main__":
+    main()
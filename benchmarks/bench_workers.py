@@ -0,0 +1,216 @@
+"""
+Multi-worker serving over the Redis channel layer: proves that an upload
+handled by one server process reaches dashboards connected to another, then
+compares upload throughput with 1, 2 and 4 workers.
+
+    python benchmarks/bench_workers.py [--redis-server redis-server] [--redis-url URL]
+                                       [--workers 1 2 4] [--seconds 10] [--clients 8] [--dashboards 20]
+
+Starts a throwaway redis-server unless --redis-url is given. Every run gets
+a fresh SQLite file. One in-memory-layer process is measured as well, as
+the baseline. --clients processes POST 50-bin snapshots over
+keep-alive connections while --dashboards sockets count the frames they
+are sent.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import websocket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SMARTBIN = os.path.join(ROOT, "SmartBin")
+sys.path.insert(0, ROOT)
+
+from latency import percentiles
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/websocket/state", timeout=1)
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+def start_redis(path, workdir):
+    port = free_port()
+    process = subprocess.Popen([path, "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir],
+                               stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, f"redis://127.0.0.1:{port}/0"
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+def server_env(redis_url, db):
+    env = dict(os.environ, SMARTBIN_DB=db, PYTHONUNBUFFERED="1")
+    env.pop("REDIS_URL", None)
+    if redis_url:
+        env["REDIS_URL"] = redis_url
+    return env
+
+def migrate(env):
+    subprocess.run([sys.executable, "manage.py", "migrate", "-v", "0"], cwd=SMARTBIN, env=env, check=True)
+
+def start_server(env, port, workers):
+    return subprocess.Popen([sys.executable, "manage.py", "serve", "--workers", str(workers),
+                             "--bind", "127.0.0.1", "--port", str(port)],
+                            cwd=SMARTBIN, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop(process):
+    process.terminate()
+    process.wait()
+
+def post(connection, body):
+    connection.request("POST", "/websocket/dashboard", body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+def cross_worker(env):
+    """POST to server A, expect the frame on a dashboard socket held by server B"""
+    port_a, port_b = free_port(), free_port()
+    server_a, server_b = start_server(env, port_a, 1), start_server(env, port_b, 1)
+    try:
+        wait_until_up(port_a)
+        wait_until_up(port_b)
+        client = websocket.create_connection(f"ws://127.0.0.1:{port_b}/ws/dashboard/", timeout=10)
+        marker = f"probe-{os.getpid()}"
+        connection = http.client.HTTPConnection("127.0.0.1", port_a)
+        started = time.perf_counter()
+        status = post(connection, json.dumps({marker: {"status": "FULL", "coord": [1.0, 2.0], "last_seen": 0}}))
+        delivered = False
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if marker in client.recv():
+                delivered = True
+                break
+        latency = time.perf_counter() - started
+        client.close()
+        # The snapshot is shared too: B serves the bin A ingested
+        with urllib.request.urlopen(f"http://127.0.0.1:{port_b}/websocket/state") as response:
+            in_snapshot = marker in json.loads(response.read())
+    finally:
+        stop(server_a)
+        stop(server_b)
+    assert status == 201 and delivered and in_snapshot, "upload on worker A did not reach worker B"
+    return {"post_status": status, "delivered_to_other_worker": delivered,
+            "latency_ms": latency * 1000, "in_other_workers_snapshot": in_snapshot}
+
+def uploader(port, seconds, client_id, results):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    deadline = time.time() + seconds
+    n = 0
+    while time.time() < deadline:
+        bins = {f"{client_id}-{b}": {"status": "FULL" if (n + b) % 9 == 0 else "OK",
+                                     "coord": [b * 1.5, client_id * 2.0], "last_seen": n % 60}
+                for b in range(50)}
+        started = time.perf_counter()
+        assert post(connection, json.dumps(bins)) == 201
+        latencies.append(time.perf_counter() - started)
+        n += 1
+    results.put(latencies)
+
+def dashboard(port, counts, index, stop_event):
+    client = websocket.create_connection(f"ws://127.0.0.1:{port}/ws/dashboard/", timeout=1)
+    while not stop_event.is_set():
+        try:
+            client.recv()
+            counts[index] += 1
+        except websocket.WebSocketTimeoutException:
+            pass
+    client.close()
+
+def throughput(env, workers, args):
+    port = free_port()
+    server = start_server(env, port, workers)
+    try:
+        wait_until_up(port)
+        counts = [0] * args.dashboards
+        stop_event = threading.Event()
+        readers = [threading.Thread(target=dashboard, args=(port, counts, i, stop_event))
+                   for i in range(args.dashboards)]
+        for reader in readers:
+            reader.start()
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=uploader, args=(port, args.seconds, i, results))
+                   for i in range(args.clients)]
+        for client in clients:
+            client.start()
+        latencies = []
+        for _ in clients:
+            latencies.extend(results.get())
+        for client in clients:
+            client.join()
+        time.sleep(1)
+        stop_event.set()
+        for reader in readers:
+            reader.join()
+    finally:
+        stop(server)
+    return {
+        "uploads_per_s": len(latencies) / args.seconds,
+        **percentiles(latencies),
+        "frames_per_dashboard": sum(counts) / len(counts),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--redis-server", default="redis-server")
+    parser.add_argument("--redis-url")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--dashboards", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    redis = None
+    if args.redis_url:
+        redis_url = args.redis_url
+    else:
+        redis, redis_url = start_redis(shutil.which(args.redis_server) or args.redis_server, workdir)
+
+    results = {"cpus": os.cpu_count(), "clients": args.clients, "dashboards": args.dashboards}
+    try:
+        env = server_env(redis_url, os.path.join(workdir, "cross.sqlite3"))
+        migrate(env)
+        results["cross_worker"] = cross_worker(env)
+        # Baseline: the single process with the in-memory layer
+        env = server_env(None, os.path.join(workdir, "in-memory.sqlite3"))
+        migrate(env)
+        results["in_memory_1"] = throughput(env, 1, args)
+        for workers in args.workers:
+            env = server_env(redis_url, os.path.join(workdir, f"workers-{workers}.sqlite3"))
+            migrate(env)
+            results[f"workers_{workers}"] = throughput(env, workers, args)
+    finally:
+        if redis is not None:
+            stop(redis)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
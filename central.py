@@ -2,103 +2,177 @@ import serial
 import json
 import math
 import time
-import requests
+import socket
 import threading
-from collections import defaultdict
+from duplicate_filter import DuplicateFilter, fresher_node, stronger_reading
+from mesh_parser import RoutingTableParser
+from metrics import FAST_BUCKETS, Counter, Gauge, Histogram, MetricsServer, TimedLock
+from positioning import MultilaterationSolver
+from routing_store import RoutingStore
+from rssi_store import RssiStore
+from serial_capture import CaptureWriter, CapturingSerial
+from serial_reader import read_serial_frames
+from spatial_index import BinIndex
+from uploader import DeltaEncoder, Uploader
 
-# Define known beacon locations
+# Define known beacon locations, any number of beacons (three or more) can be listed
 BEACON_LOCATIONS = {
     "B1": (7, -3.5),    # (x, y) coordinates of Beacon1
     "B2": (2, 5),    # (x, y) coordinates of Beacon2
     "B3": (-6, -3)    # (x, y) coordinates of Beacon3
 }
 
-# COM port settings
-MESH_COM_PORT = 'COM4'  # Port for mesh network communication
-BEACON_COM_PORT = 'COM5'  # Port for beacon communication
+# COM port settings, list several receivers of a kind for overlapping coverage
+MESH_COM_PORTS = ['COM4']  # Ports of the mesh network receivers
+BEACON_COM_PORTS = ['COM5']  # Ports of the beacon receivers
 BAUD_RATE = 9600
+CAPTURE_PATH = None  # Set to a file name to record raw receiver output for replay.py
+
+# With several receivers of a kind, copies of one report arriving within this
+# many seconds of each other are merged before they reach the routing table
+# or the position solver; a report goes on as soon as every receiver sent one
+MESH_DEDUP_WINDOW = 2  # Node entries of the receivers' dumps, the freshest is kept
+BEACON_DEDUP_WINDOW = 2  # Beacon readings relayed by several receivers, the strongest is kept
 
 # Server settings
 DJANGO_SERVER_URL = "http://172.20.10.5:8000/websocket/dashboard"
+DJANGO_WS_URL = "ws://172.20.10.5:8000/ws/gateway/"
+UPLOAD_TRANSPORT = "http"  # "http": POST each upload, "websocket": stream over one open socket
+GATEWAY_ID = socket.gethostname()  # Identifies this gateway's uploads to the server
+UPLOAD_MODE = "delta"   # "delta": changed bins plus periodic keyframes, "full": whole table every time
+KEYFRAME_INTERVAL = 60  # Seconds between full keyframes in delta mode
+UPLOAD_QUEUE_PATH = "upload_queue.sqlite3"  # Uploads wait here while the server is unreachable
+UPLOAD_QUEUE_SIZE = 10000  # Oldest queued uploads are dropped beyond this
+UPLOAD_INTERVAL = 5  # Seconds between routing-table uploads
+
+# Prometheus metrics at http://<gateway>:METRICS_PORT/metrics, None to disable
+METRICS_PORT = 9108
 
 # RSSI to distance conversion parameters
 RSSI_REF = -120  # RSSI at 4 meter distance
 N = 2.5          # Path loss exponent
 
-# Shared data structures
-beacon_data = defaultdict(dict)
-routing_table = {
+# Beacon reading filter settings (beacons hear each bin about once a minute)
+RSSI_WINDOW = 8               # Samples kept per bin/beacon pair
+RSSI_TTL = 180                # Seconds before a reading expires
+RSSI_SMOOTHING_SECONDS = 120  # EWMA time constant
+RESOLVE_THRESHOLD = 0.1       # Relative distance change that triggers a new position
+
+# Bins not heard from for this many seconds are marked OFFLINE
+OFFLINE_THRESHOLD = 120 # 2 minutes
+
+# Gateway metrics, the hot paths keep their label children
+LOCK_WAIT_SECONDS = Histogram("smartbin_gateway_lock_wait_seconds", "Time spent waiting to acquire a lock",
+                              ["lock"], buckets=FAST_BUCKETS)
+LOCK_HOLD_SECONDS = Histogram("smartbin_gateway_lock_hold_seconds", "Time a lock was held",
+                              ["lock"], buckets=FAST_BUCKETS)
+PARSE_ERRORS = Counter("smartbin_gateway_parse_errors_total",
+                       "Receiver lines that could not be parsed, and routing-table dumps cut short", ["receiver"])
+POSITION_SOLVES = Counter("smartbin_gateway_position_solves_total", "Bins passed to the multilateration solver")
+POSITION_FIXES = Counter("smartbin_gateway_position_fixes_total", "Bins the solver produced a position for")
+DUPLICATE_REPORTS = Counter("smartbin_gateway_duplicate_reports_total",
+                            "Copies of a report from another receiver that were merged away", ["kind"])
+RECEIVER_REPORTS = Counter("smartbin_gateway_receiver_reports_total",
+                           "Reports kept after duplicate suppression, by the receiver whose copy won", ["receiver"])
+POSITION_SOLVE_SECONDS = Histogram("smartbin_gateway_position_solve_seconds", "Time to solve one batch of bins")
+# Updates queued for the routing-table writer before serial threads wait; a
+# 2000-bin dump takes about 2 ms to apply, so this is well under a second
+ROUTING_MAX_PENDING = 100
+ROUTING_BATCH_SECONDS = Histogram("smartbin_gateway_routing_batch_seconds",
+                                  "Time to apply one batch of routing-table updates and publish the snapshot",
+                                  buckets=FAST_BUCKETS)
+
+# Shared routing table: serial and processing threads submit updates, one
+# writer thread applies them, everyone reads immutable snapshots
+routing_store = RoutingStore({
     1: {"status": "OFFLINE", "last_seen": 0, "coord": None},
     2: {"status": "OFFLINE", "last_seen": 0, "coord": None},
     3: {"status": "OFFLINE", "last_seen": 0, "coord": None}
-}
+}, max_pending=ROUTING_MAX_PENDING, batch_seconds=ROUTING_BATCH_SECONDS)
+
+Gauge("smartbin_gateway_routing_queue_depth", "Routing-table updates waiting for the writer",
+      function=routing_store.pending)
+Gauge("smartbin_gateway_routing_version", "Version of the newest routing-table snapshot",
+      function=lambda: routing_store.snapshot().version)
+Counter("smartbin_gateway_routing_updates_total", "Routing-table updates applied",
+        function=lambda: routing_store.updates_applied)
+Counter("smartbin_gateway_routing_update_errors_total", "Routing-table updates that raised",
+        function=lambda: routing_store.update_errors)
+
+# Grid index of bins that can take rubbish, only used by routing_store updates
+bin_index = BinIndex()
 
-# Locks for thread safety
-beacon_data_lock = threading.Lock()
-routing_table_lock = threading.Lock()
+# Beacon geometry is precomputed once here
+position_solver = MultilaterationSolver(BEACON_LOCATIONS)
 
 def rssi_to_distance(rssi):
     """Convert RSSI to estimated distance in meters"""
     return 4 * (10 ** ((RSSI_REF - rssi) / (10 * N)))
 
-def trilateration(distances):
-    """
-    Calculate position using trilateration from distances to three beacons
-    Returns (x, y) coordinates
-    """
-    # Get beacon positions and distances
-    (x1, y1) = BEACON_LOCATIONS["B1"]
-    (x2, y2) = BEACON_LOCATIONS["B2"]
-    (x3, y3) = BEACON_LOCATIONS["B3"]
-    
-    r1 = distances["B1"]
-    r2 = distances["B2"]
-    r3 = distances["B3"]
-    
-    # Calculate position using trilateration formulas
-    A = 2 * (x2 - x1)
-    B = 2 * (y2 - y1)
-    C = r1**2 - r2**2 - x1**2 + x2**2 - y1**2 + y2**2
-    
-    D = 2 * (x3 - x2)
-    E = 2 * (y3 - y2)
-    F = r2**2 - r3**2 - x2**2 + x3**2 - y2**2 + y3**2
-    
-    # Solve the system of equations
-    x = (C * E - F * B) / (E * A - B * D)
-    y = (C * D - A * F) / (B * D - A * E)
-    
-    return (x, y)
-
-def calculate_distance(coord1, coord2):
-    """Calculate Euclidean distance between two coordinates"""
-    if not coord1 or not coord2:
-        return float('inf')
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def calculate_direction(from_coord, to_coord):
-    """Calculate direction from one coordinate to another"""
-    if not from_coord or not to_coord:
-        return "Unknown"
-    
-    dx = to_coord[0] - from_coord[0]
-    dy = to_coord[1] - from_coord[1]
-    
-    # Calculate angle in radians
-    angle = math.atan2(dy, dx)
+# Smoothed, expiring beacon readings per bin
+rssi_store = RssiStore(
+    rssi_to_distance,
+    window=RSSI_WINDOW,
+    ttl=RSSI_TTL,
+    smoothing_seconds=RSSI_SMOOTHING_SECONDS,
+    resolve_threshold=RESOLVE_THRESHOLD
+)
+rssi_store.lock = TimedLock(LOCK_WAIT_SECONDS.labels("rssi_store"), LOCK_HOLD_SECONDS.labels("rssi_store"))
+
+# When each bin's position was last solved (monotonic), written by routing_store
+# updates; a bin is dropped once its beacon readings expire
+position_times = {}
+
+def oldest_position_age():
+    # Called from the metrics thread while the writer changes the dict, copy it in one step
+    times = tuple(position_times.values())
+    return time.monotonic() - min(times) if times else 0
+
+Gauge("smartbin_gateway_position_age_seconds", "Seconds since the stalest bin position was solved",
+      function=oldest_position_age)
+Gauge("smartbin_gateway_positioned_bins", "Bins with a solved position", function=lambda: len(position_times))
+
+def update_positions():
+    """Solve positions for every bin with new beacon readings in one batch"""
+    expired = rssi_store.expire()
+    for bin_id in expired:
+        print(f"Beacon: No beacon has heard bin {bin_id} for {RSSI_TTL}s, dropped its readings")
+    if expired:
+        # Through the writer, so it lands after any fix already queued for the bin
+        def forget_positions(table):
+            for bin_id in expired:
+                position_times.pop(bin_id, None)
+        routing_store.submit(forget_positions)
     
-    # Convert to degrees
-    angle_deg = math.degrees(angle)
+    # Only bins whose smoothed distances moved since the last solve
+    readings = rssi_store.pop_dirty()
+    if not readings:
+        return
     
-    # Normalize to 0-360 degrees
-    if angle_deg < 0:
-        angle_deg += 360
+    started = time.perf_counter()
+    fixes = position_solver.solve(readings)
+    POSITION_SOLVE_SECONDS.observe(time.perf_counter() - started)
+    POSITION_SOLVES.inc(len(readings))
     
-    # Convert angle to cardinal direction
-    directions = ["E", "NE", "N", "NW", "W", "SW", "S", "SE"]
-    index = round(angle_deg / 45) % 8
+    # Store the calculated coordinates through the routing table's writer
+    solved = time.monotonic()
+    def apply_fixes(table):
+        for bin_id, fix in fixes.items():
+            if fix is None:
+                continue
+            position_times[bin_id] = solved
+            fields = {"coord": (fix.x, fix.y), "coord_error": fix.residual}
+            if bin_id not in table:
+                fields["status"] = "active"
+            bin_data = table.update(bin_id, fields)
+            bin_index.update(bin_id, bin_data["coord"], bin_data.get("status"))
+    routing_store.submit(apply_fixes)
     
-    return directions[index]
+    POSITION_FIXES.inc(sum(1 for fix in fixes.values() if fix is not None))
+    for bin_id, fix in fixes.items():
+        if fix is not None:
+            print(f"Beacon: Position calculated for bin {bin_id}: ({fix.x:.2f}, {fix.y:.2f}) "
+                  f"from {fix.beacons} beacons, residual {fix.residual:.2f}m")
 
 def find_nearest_available_bin(routing_table, current_bin_id):
     """Find nearest available bin that isn't FULL"""
@@ -108,263 +182,268 @@ def find_nearest_available_bin(routing_table, current_bin_id):
     if not current_coord:
         return None, None
     
-    nearest_bin_id = None
-    min_distance = float('inf')
+    # The index only holds bins that are positioned and not FULL or OFFLINE
+    nearest = bin_index.nearest(current_coord, k=1, exclude=current_bin_id)
+    if nearest:
+        return nearest[0].bin_id, nearest[0].direction
     
-    for bin_id, bin_data in routing_table.items():
-        # Skip the current bin and any FULL or offline bins
-        if (bin_id == current_bin_id or 
-            bin_data.get("status") == "FULL" or 
-            bin_data.get("status") == "OFFLINE"):
-            continue
-        
-        bin_coord = bin_data.get("coord")
-        if bin_coord:
-            distance = calculate_distance(current_coord, bin_coord)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_bin_id = bin_id
+    return None, None
+
+# Sequence numbers and last sent state for delta uploads
+delta_encoder = DeltaEncoder(GATEWAY_ID, keyframe_interval=KEYFRAME_INTERVAL)
+
+# Store-and-forward uploader, created in main() so importing this module
+# doesn't open the queue file
+uploader = None
+
+def uploader_metric(name):
+    return lambda: (uploader.metrics()[name] or 0) if uploader is not None else 0
+
+Gauge("smartbin_gateway_upload_queue_depth", "Uploads waiting in the store-and-forward queue",
+      function=uploader_metric("queue_depth"))
+Counter("smartbin_gateway_upload_queue_dropped_total", "Queued uploads dropped when the queue was full",
+        function=uploader_metric("queue_dropped"))
+Counter("smartbin_gateway_uploads_total", "Uploads the server replied to", function=uploader_metric("uploads"))
+Counter("smartbin_gateway_upload_failures_total", "Uploads that failed or were rejected",
+        function=uploader_metric("upload_failures"))
+
+def send_data_to_server(payload):
+    """Queue routing table data for the Django server and send whatever is waiting"""
+    uploader.submit(payload)
+
+def upload_routing_table(serializable_routing_table):
+    """Upload the routing table as a delta message, or as a plain snapshot in "full" mode"""
+    if UPLOAD_MODE != "delta":
+        # Named, so the server can merge it with other gateways' view of the same bins
+        send_data_to_server({"gateway": GATEWAY_ID, "bins": serializable_routing_table})
+        return
     
-    if nearest_bin_id:
-        direction = calculate_direction(
-            current_coord, 
-            routing_table[nearest_bin_id]["coord"]
-        )
-        return nearest_bin_id, direction
+    message = delta_encoder.encode(serializable_routing_table)
+    if message is None:
+        # Nothing changed, but there may be a backlog waiting for the server
+        uploader.flush()
+        return
+    send_data_to_server(message)
+
+# Keeps the state of a routing-table dump across serial reads, per mesh receiver
+routing_table_parsers = {}
+
+# Duplicate filters, set by configure_receivers() for kinds with more than one receiver
+mesh_duplicates = None
+beacon_duplicates = None
+
+def receiver_name(kind, port):
+    """Tag for a receiver's readings, log lines, metrics and capture port"""
+    return f"{kind}:{port}"
+
+def configure_receivers(mesh_receivers, beacon_receivers):
+    """Turn duplicate suppression on for each kind that has more than one receiver"""
+    global mesh_duplicates, beacon_duplicates
+    mesh_duplicates = (DuplicateFilter(MESH_DEDUP_WINDOW, fresher_node, len(mesh_receivers))
+                       if len(mesh_receivers) > 1 else None)
+    beacon_duplicates = (DuplicateFilter(BEACON_DEDUP_WINDOW, stronger_reading, len(beacon_receivers))
+                         if len(beacon_receivers) > 1 else None)
+
+def release_duplicates():
+    """Pass on the merged reports whose duplicate window has closed"""
+    if beacon_duplicates is not None:
+        duplicates = DUPLICATE_REPORTS.labels("beacon")
+        for (bin_id, beacon_id), report in beacon_duplicates.pop_ready():
+            RECEIVER_REPORTS.labels(report.receiver).inc()
+            duplicates.inc(report.copies - 1)
+            # The smoothing sees the reading at the time the kept copy arrived
+            rssi_store.add(bin_id, beacon_id, report.value, now=report.arrived)
     
-    return None, None
+    if mesh_duplicates is not None:
+        ready = mesh_duplicates.pop_ready()
+        if not ready:
+            return
+        duplicates = DUPLICATE_REPORTS.labels("mesh")
+        now = time.monotonic()
+        snapshot = {}
+        for node_id, report in ready:
+            RECEIVER_REPORTS.labels(report.receiver).inc()
+            duplicates.inc(report.copies - 1)
+            last_seen, status = report.value
+            # last_seen counted from when the dump arrived, not from now
+            snapshot[node_id] = (last_seen + int(now - report.arrived), status)
+        apply_routing_snapshot(snapshot, "merged receivers")
+
+def apply_routing_snapshot(snapshot, source="mesh"):
+    """Queue one complete routing-table dump as a single update"""
+    def apply(table):
+        for node_id, (last_seen, status) in snapshot.items():
+            node = table.get(node_id)
+            if node is None:
+                table.update(node_id, {
+                    "last_seen": last_seen,
+                    "status": status,
+                    "coord": None
+                })
+            else:
+                fields = {"last_seen": last_seen}
+                if status != "OFFLINE":
+                    fields["status"] = status
+                node = table.update(node_id, fields)
+                bin_index.update(node_id, node.get("coord"), node["status"])
+    routing_store.submit(apply)
+    
+    summary = ", ".join(f"{node_id}={status} ({last_seen}s)" for node_id, (last_seen, status) in snapshot.items())
+    print(f"Mesh: Routing Table Updated from {source}: {summary or 'no nodes'}")
 
-def send_data_to_server(routing_table):
-    """Send the current routing table data to the Django server"""
+def handle_mesh_line(line, receiver="mesh"):
+    """Process one line (bytes, without terminator) from the mesh receiver ``receiver``"""
+    parser = routing_table_parsers.get(receiver)
+    if parser is None:
+        # Only this receiver's serial thread feeds it
+        parser = routing_table_parsers[receiver] = RoutingTableParser()
+    errors = parser.errors
+    consumed, snapshot = parser.feed_line(line)
+    if parser.errors != errors:
+        PARSE_ERRORS.labels(receiver).inc()
+    if snapshot is not None:
+        if mesh_duplicates is None:
+            apply_routing_snapshot(snapshot, receiver)
+        else:
+            # Merged with the other receivers' dumps by the processing thread
+            for node_id, entry in snapshot.items():
+                mesh_duplicates.add(node_id, entry, receiver)
+            print(f"Mesh: {receiver} reported {len(snapshot)} nodes")
+    
+    if not consumed:
+        # Just print other lines from mesh serial
+        print(f"Mesh: {receiver}: {line.decode('utf-8', errors='ignore')}")
+
+def handle_beacon_line(line, receiver="beacon"):
+    """Process one line (bytes, without terminator) from the beacon receiver ``receiver``"""
     try:
-        response = requests.post(
-            DJANGO_SERVER_URL,
-            json=routing_table,
-            headers={"Content-Type": "application/json"},
-            timeout=5  # Add timeout to prevent hanging
-        )
-        return True
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection error: {e}")
-        return False
+        if line.startswith(b"{"):
+            # Parse JSON data, json.loads takes the raw bytes directly
+            data = json.loads(line)
+            
+            # Check if this is a beacon data message
+            if "id" in data and "b" in data and "r" in data:
+                # Extract information
+                beacon_id = data.get("id")  # B1, B2, B3
+                bin_id = data.get("b")      # bin ID
+                rssi = data.get("r")        # RSSI value
+                
+                print(f"Beacon: Received via {receiver}: Beacon {beacon_id}, Bin: {bin_id}, RSSI: {rssi}")
+                
+                # Store the data with thread safety, the store smooths the RSSI
+                # and the processing thread solves all dirty bins together
+                if beacon_id and bin_id is not None and rssi is not None:
+                    if beacon_duplicates is None:
+                        rssi_store.add(bin_id, beacon_id, rssi)
+                    else:
+                        beacon_duplicates.add((bin_id, beacon_id), rssi, receiver)
+        else:
+            # Print non-JSON lines from beacon serial
+            print(f"Beacon: {receiver}: {line.decode('utf-8', errors='ignore')}")
+    except json.JSONDecodeError:
+        PARSE_ERRORS.labels(receiver).inc()
     except Exception as e:
-        print(f"Error sending data to server: {e}")
-        return False
+        PARSE_ERRORS.labels(receiver).inc()
+        print(f"Beacon: Error processing data: {e}")
 
-def handle_mesh_serial(mesh_ser):
-    """Thread function to handle mesh serial communication"""
-    print(f"Mesh serial thread started on {MESH_COM_PORT}")
+def handle_mesh_serial(mesh_ser, stop_event=None, receiver="mesh"):
+    """Thread function to handle one mesh receiver's serial communication"""
+    print(f"Mesh serial thread started on {mesh_ser.port}")
+    # Blocks on the port until bytes arrive, no polling delay
+    read_serial_frames(mesh_ser, lambda line: handle_mesh_line(line, receiver), stop_event, name=receiver)
+
+def handle_beacon_serial(beacon_ser, stop_event=None, receiver="beacon"):
+    """Thread function to handle one beacon receiver's serial communication"""
+    print(f"Beacon serial thread started on {beacon_ser.port}")
+    read_serial_frames(beacon_ser, lambda line: handle_beacon_line(line, receiver), stop_event, name=receiver)
+
+def refresh_routing_table(table):
+    """Routing-table update: mark silent bins OFFLINE and point FULL bins at the nearest available one"""
+    # Check for offline bins and update their status
+    for bin_id, bin_data in table.items():
+        # Skip bins that are already offline
+        if bin_data.get("status") == "OFFLINE":
+            continue
+        
+        last_seen = bin_data.get("last_seen", 0)
+        if last_seen > OFFLINE_THRESHOLD:
+            table.update(bin_id, {"status": "OFFLINE"})
+            bin_index.remove(bin_id)
+            print(f"Processing: Bin {bin_id} marked as OFFLINE due to inactivity")
     
-    while True:
-        try:
-            if mesh_ser.in_waiting > 0:
-                # Read line from serial port
-                line = mesh_ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                if line.startswith("Routing Table:"):
-                    # Parse routing table data
-                    while mesh_ser.in_waiting > 0:
-                        line = mesh_ser.readline().decode('utf-8', errors='ignore').strip()
-                        if line.startswith("Node"):
-                            parts = line.split()
-                            print(f"Mesh: {parts}")
-                            if len(parts) >= 9 and "Last" in parts and "Status" in parts:
-                                try:
-                                    # Extract node ID
-                                    node_id = int(parts[1])
-                                    
-                                    # Find the last seen value
-                                    last_seen = 0
-                                    for i in range(len(parts)):
-                                        if i < len(parts) - 1 and parts[i+1] == "ago" and parts[i].endswith("s"):
-                                            try:
-                                                # Extract just the number before "s"
-                                                last_seen_str = parts[i].replace("s", "").strip()
-                                                last_seen = int(float(last_seen_str))
-                                                print(f"Mesh: Last seen for Node {node_id}: {last_seen} seconds ago")
-                                                break
-                                            except ValueError:
-                                                print(f"Mesh: Error converting last seen value: {parts[i]}")
-                                                pass
-                                    
-                                    # Find status
-                                    status = "UNKNOWN"
-                                    for i in range(len(parts)):
-                                        if parts[i] == "Status:" or parts[i] == "Status":
-                                            if i + 1 < len(parts):
-                                                status = parts[i + 1]
-                                                break
-                                    
-                                    # Update routing table with thread safety
-                                    with routing_table_lock:
-                                        if node_id not in routing_table:
-                                            routing_table[node_id] = {
-                                                "last_seen": last_seen,
-                                                "status": status,
-                                                "coord": None
-                                            }
-                                        else:
-                                            current_status = routing_table[node_id].get("status")
-                                            routing_table[node_id].update({
-                                                "last_seen": last_seen,
-                                                "status": status if status != "OFFLINE" else current_status
-                                            })
-                                    
-                                    print(f"Mesh: Routing Table Updated for Node {node_id}: {status}")
-                                except (ValueError, IndexError) as e:
-                                    print(f"Mesh: Error parsing line: {line} - {e}")
-                else:
-                    # Just print other lines from mesh serial
-                    if line:
-                        print(f"Mesh: {line}")
-        except Exception as e:
-            print(f"Mesh serial error: {e}")
+    # Update next_nearest for FULL bins
+    for bin_id, bin_data in table.items():
+        bin_id_int = int(bin_id) if isinstance(bin_id, str) else bin_id
         
-        # Small delay to prevent high CPU usage
-        time.sleep(0.05)
+        # Check if status changed from FULL to not FULL
+        was_full = bin_data.get("was_full")
+        is_full_now = bin_data.get("status") == "FULL"
+        if was_full is is_full_now and not is_full_now:
+            # Nothing to do for a bin that stays available, and no copy made
+            continue
+        fields = {"was_full": is_full_now}
+        remove = ()
+        
+        # If bin was full but is now OK
+        if was_full and not is_full_now:
+            remove = ("next_nearest", "next_nearest_direction")
+            print(f"Processing: Bin {bin_id} is no longer FULL")
+        
+        # If bin is FULL, find nearest available bin
+        if is_full_now:
+            nearest_bin_id, direction = find_nearest_available_bin(table, bin_id_int)
+            if nearest_bin_id:
+                fields["next_nearest"] = nearest_bin_id
+                fields["next_nearest_direction"] = direction
+        
+        # Only copies the bin if something actually changed
+        table.update(bin_id, fields, remove)
 
-def handle_beacon_serial(beacon_ser):
-    """Thread function to handle beacon serial communication"""
-    print(f"Beacon serial thread started on {BEACON_COM_PORT}")
-    
-    while True:
-        try:
-            if beacon_ser.in_waiting > 0:
-                # Read line from serial port
-                line = beacon_ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                try:
-                    if line.startswith("{"):
-                        # Parse JSON data
-                        data = json.loads(line)
-                        
-                        # Check if this is a beacon data message
-                        if "id" in data and "b" in data and "r" in data:
-                            # Extract information
-                            beacon_id = data.get("id")  # B1, B2, B3
-                            bin_id = data.get("b")      # bin ID
-                            rssi = data.get("r")        # RSSI value
-                            
-                            print(f"Beacon: Received: Beacon {beacon_id}, Bin: {bin_id}, RSSI: {rssi}")
-                            
-                            # Store the data with thread safety
-                            if beacon_id and bin_id is not None and rssi is not None:
-                                # Convert RSSI to distance
-                                distance = rssi_to_distance(rssi)
-                                
-                                # Check if this is a new reading or an update
-                                with beacon_data_lock:
-                                    is_new_reading = beacon_id not in beacon_data[bin_id]
-                                    beacon_data[bin_id][beacon_id] = distance
-                                
-                                # Check if we have data from all three beacons for this bin
-                                with beacon_data_lock:
-                                    have_all_beacons = all(beacon in beacon_data[bin_id] for beacon in ["B1", "B2", "B3"])
-                                
-                                if have_all_beacons:
-                                    # Calculate position
-                                    try:
-                                        with beacon_data_lock:
-                                            x, y = trilateration(beacon_data[bin_id])
-                                        
-                                        # Store the calculated coordinates in the routing table with thread safety
-                                        with routing_table_lock:
-                                            if bin_id not in routing_table:
-                                                routing_table[bin_id] = {"status": "active"}
-                                            routing_table[bin_id]["coord"] = (x, y)
-                                        
-                                        # Output result
-                                        print(f"Beacon: Position calculated for bin {bin_id}: ({x:.2f}, {y:.2f})")
-                                    except Exception as e:
-                                        print(f"Beacon: Error in trilateration: {e}")
-                    else:
-                        # Print non-JSON lines from beacon serial
-                        if line:
-                            print(f"Beacon: {line}")
-                except json.JSONDecodeError:
-                    pass
-                except Exception as e:
-                    print(f"Beacon: Error processing data: {e}")
-        except Exception as e:
-            print(f"Beacon serial error: {e}")
+# Upload form of each bin, reused while the snapshot still holds the same bin
+serialized_bins = {}
+
+def serialize_routing_table(bins):
+    """{str(bin_id): JSON-ready bin dict}; bins unchanged since the last call keep their dict"""
+    serializable_routing_table = {}
+    for bin_id, bin_data in bins.items():
+        cached = serialized_bins.get(bin_id)
+        if cached is not None and cached[0] is bin_data:
+            serializable_routing_table[str(bin_id)] = cached[1]
+            continue
+        serializable_bin_data = dict(bin_data)
         
-        # Small delay to prevent high CPU usage
-        time.sleep(0.05)
+        # Convert coordinate tuple to list if it exists
+        if isinstance(serializable_bin_data.get("coord"), tuple):
+            serializable_bin_data["coord"] = list(serializable_bin_data["coord"])
+        
+        serialized_bins[bin_id] = (bin_data, serializable_bin_data)
+        # Ensure bin_id is a string
+        serializable_routing_table[str(bin_id)] = serializable_bin_data
+    return serializable_routing_table
 
 def main_processing_thread():
     """Main processing thread that handles routing table updates and server communication"""
     print("Main processing thread started")
     
-    # Timeout threshold
-    OFFLINE_THRESHOLD = 120 # 2 minutes
     last_sent_time = 0
     
     while True:
         try:
-            # Make a copy of the routing table to avoid holding the lock too long
-            with routing_table_lock:
-                local_routing_table = routing_table.copy()
+            # Merged reports from overlapping receivers
+            release_duplicates()
             
-            # Check for offline bins and update their status
-            with routing_table_lock:
-                for bin_id, bin_data in routing_table.items():
-                    # Skip bins that are already offline
-                    if bin_data.get("status") == "OFFLINE":
-                        continue
-                    
-                    last_seen = bin_data.get("last_seen", 0)
-                    if last_seen > OFFLINE_THRESHOLD:
-                        bin_data["status"] = "OFFLINE"
-                        print(f"Processing: Bin {bin_id} marked as OFFLINE due to inactivity")
+            # Turn new beacon readings into positions
+            update_positions()
             
-            # Update next_nearest for FULL bins
-            with routing_table_lock:
-                for bin_id, bin_data in routing_table.items():
-                    bin_id_int = int(bin_id) if isinstance(bin_id, str) else bin_id
-                    
-                    # Check if status changed from FULL to not FULL
-                    was_full = bin_data.get("was_full", False)
-                    is_full_now = bin_data.get("status") == "FULL"
-                    
-                    # If bin was full but is now OK
-                    if was_full and not is_full_now:
-                        if "next_nearest" in bin_data:
-                            del bin_data["next_nearest"]
-                        if "next_nearest_direction" in bin_data:
-                            del bin_data["next_nearest_direction"]
-                        print(f"Processing: Bin {bin_id} is no longer FULL")
-                    
-                    # If bin is FULL, find nearest available bin
-                    if is_full_now:
-                        nearest_bin_id, direction = find_nearest_available_bin(routing_table, bin_id_int)
-                        if nearest_bin_id:
-                            bin_data["next_nearest"] = nearest_bin_id
-                            bin_data["next_nearest_direction"] = direction
-                    
-                    # Track current status for next iteration
-                    bin_data["was_full"] = is_full_now
+            # Offline and next_nearest bookkeeping runs on the routing table's writer
+            refresh = routing_store.submit(refresh_routing_table)
             
-            # Send data to server every 5 seconds
+            # Send data to server every UPLOAD_INTERVAL seconds
             current_time = time.time()
-            if current_time - last_sent_time >= 5:
-                # Make a copy of the routing table for serialization
-                with routing_table_lock:
-                    local_routing_table = routing_table.copy()
-                
-                # Convert tuple coordinates to lists for JSON serialization
-                serializable_routing_table = {}
-                for bin_id, bin_data in local_routing_table.items():
-                    serializable_bin_data = bin_data.copy()
-                    
-                    # Convert coordinate tuple to list if it exists
-                    if serializable_bin_data.get("coord"):
-                        if isinstance(serializable_bin_data["coord"], tuple):
-                            serializable_bin_data["coord"] = list(serializable_bin_data["coord"])
-                    
-                    # Ensure bin_id is a string
-                    serializable_routing_table[str(bin_id)] = serializable_bin_data
-                
-                send_data_to_server(serializable_routing_table)
+            if current_time - last_sent_time >= UPLOAD_INTERVAL:
+                # A snapshot never changes, no lock or copy needed
+                snapshot = routing_store.wait(refresh, timeout=1)
+                upload_routing_table(serialize_routing_table(snapshot.bins))
                 last_sent_time = current_time
         except Exception as e:
             print(f"Processing thread error: {e}")
@@ -373,24 +452,46 @@ def main_processing_thread():
         time.sleep(0.5)
 
 def main():
+    global uploader
+    uploader = Uploader(
+        DJANGO_WS_URL if UPLOAD_TRANSPORT == "websocket" else DJANGO_SERVER_URL,
+        UPLOAD_QUEUE_PATH,
+        max_queue=UPLOAD_QUEUE_SIZE,
+        on_resync=delta_encoder.resync
+    )
+    
+    metrics_server = None
+    if METRICS_PORT:
+        try:
+            metrics_server = MetricsServer(METRICS_PORT).start()
+            print(f"Metrics served on port {METRICS_PORT}")
+        except OSError as e:
+            print(f"Metrics: could not listen on port {METRICS_PORT}: {e}")
+    
+    capture = None
+    # Open serial connections by receiver name
+    serial_ports = {}
+    receivers = [(receiver_name("mesh", port), port, handle_mesh_serial) for port in MESH_COM_PORTS]
+    receivers += [(receiver_name("beacon", port), port, handle_beacon_serial) for port in BEACON_COM_PORTS]
+    configure_receivers(MESH_COM_PORTS, BEACON_COM_PORTS)
     try:
-        # Open serial connections
-        mesh_ser = serial.Serial(MESH_COM_PORT, BAUD_RATE, timeout=1)
-        beacon_ser = serial.Serial(BEACON_COM_PORT, BAUD_RATE, timeout=1)
+        for name, port, _ in receivers:
+            serial_ports[name] = serial.Serial(port, BAUD_RATE, timeout=1)
         
         # Give the serial connections time to initialize
         time.sleep(2)
         
-        print(f"Mesh serial opened on {MESH_COM_PORT}")
-        print(f"Beacon serial opened on {BEACON_COM_PORT}")
+        if CAPTURE_PATH:
+            # Everything read from every port also goes to the capture file
+            capture = CaptureWriter(CAPTURE_PATH, list(serial_ports))
+            serial_ports = {name: CapturingSerial(ser, capture, name) for name, ser in serial_ports.items()}
+            print(f"Capturing serial input to {CAPTURE_PATH}")
         
-        # Create and start threads
-        mesh_thread = threading.Thread(target=handle_mesh_serial, args=(mesh_ser,), daemon=True)
-        beacon_thread = threading.Thread(target=handle_beacon_serial, args=(beacon_ser,), daemon=True)
+        # Create and start threads, one per receiver
+        for name, port, handle_serial in receivers:
+            print(f"Serial {name} opened on {port}")
+            threading.Thread(target=handle_serial, args=(serial_ports[name], None, name), daemon=True).start()
         processing_thread = threading.Thread(target=main_processing_thread, daemon=True)
-        
-        mesh_thread.start()
-        beacon_thread.start()
         processing_thread.start()
         
         # Keep the main thread alive
@@ -403,17 +504,18 @@ def main():
         print(f"Serial connection error: {e}")
     finally:
         # Close serial ports
-        try:
-            mesh_ser.close()
-            print("Mesh serial connection closed")
-        except:
-            pass
+        for name, ser in serial_ports.items():
+            try:
+                ser.close()
+                print(f"Serial {name} connection closed")
+            except Exception:
+                pass
         
-        try:
-            beacon_ser.close()
-            print("Beacon serial connection closed")
-        except:
-            pass
+        uploader.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if capture is not None:
+            capture.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,108 @@
+"""
+Duplicate suppression for gateways with several receivers of one kind.
+
+Receivers with overlapping coverage report the same things: every mesh
+receiver prints its own routing-table dump with the nodes it can hear, and
+every beacon receiver in range relays the same beacon message. A report is
+held for ``window`` seconds after the first copy of it arrives, or until
+each of ``receivers`` has sent a copy. Later copies of the same key either
+replace it (``better`` says so) or are dropped, and pop_ready() hands each
+key on once. A receiver can't duplicate itself: a second report of a key
+from the same receiver is its next dump or reading, so the one held is
+handed on and the new one starts its own window.
+"""
+import threading
+import time
+from collections import namedtuple
+
+# value as the receiver reported it, which receiver, and when it arrived
+# (clock time). copies counts every receiver that reported the key.
+Report = namedtuple("Report", ["value", "receiver", "arrived", "copies"])
+
+class DuplicateFilter:
+    """
+    Merge reports of the same key from several receivers within a window.
+
+    ``better(kept, candidate)`` takes two Reports and returns True if the
+    candidate should replace the kept one. With ``receivers`` set, a key is
+    ready as soon as that many receivers have reported it.
+    """
+
+    def __init__(self, window, better, receivers=None, clock=time.monotonic):
+        self.window = window
+        self.better = better
+        self.receivers = receivers
+        self.clock = clock
+        # key -> [first arrival, Report, receivers that sent a copy];
+        # insertion order is first arrival order, so keys whose window has
+        # closed are always at the front
+        self.pending = {}
+        # (key, Report) ready before their window closed
+        self.released = []
+        self.lock = threading.Lock()
+        self.reports = 0
+        self.duplicates = 0
+
+    def add(self, key, value, receiver, now=None):
+        """Record one report, returns False if it is a copy that lost to the one held"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            self.reports += 1
+            pending = self.pending
+            entry = pending.get(key)
+            if entry is not None and receiver in entry[2]:
+                # The receiver's next report of the key, the one held is complete
+                del pending[key]
+                self.released.append((key, entry[1]))
+                entry = None
+            if entry is None:
+                entry = pending[key] = [now, Report(value, receiver, now, 1), {receiver}]
+                kept = True
+            else:
+                self.duplicates += 1
+                entry[2].add(receiver)
+                held = entry[1]
+                candidate = Report(value, receiver, now, held.copies + 1)
+                kept = self.better(held, candidate)
+                entry[1] = candidate if kept else held._replace(copies=candidate.copies)
+            if self.receivers is not None and len(entry[2]) >= self.receivers:
+                # Every receiver has had its say, no need to wait for the window
+                del pending[key]
+                self.released.append((key, entry[1]))
+            return kept
+
+    def pop_ready(self, now=None):
+        """
+        [(key, Report)] for every key that is complete or whose window has
+        closed, oldest first
+        """
+        if now is None:
+            now = self.clock()
+        cutoff = now - self.window
+        with self.lock:
+            ready = self.released
+            self.released = []
+            released = len(ready)
+            pending = self.pending
+            for key, (first, report, _) in pending.items():
+                if first > cutoff:
+                    break
+                ready.append((key, report))
+            for key, _ in ready[released:]:
+                del pending[key]
+        return ready
+
+    def __len__(self):
+        return len(self.pending) + len(self.released)
+
+def fresher_node(kept, candidate):
+    """
+    Routing-table entries, value (last_seen, status): the receiver that heard
+    the node most recently wins, counting from when each dump arrived
+    """
+    return candidate.value[0] < kept.value[0] + (candidate.arrived - kept.arrived)
+
+def stronger_reading(kept, candidate):
+    """Beacon readings, value RSSI in dBm: the strongest copy wins"""
+    return candidate.value > kept.value
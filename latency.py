@@ -0,0 +1,24 @@
+"""
+Latency summaries for the replay harness, the load generator and the
+benchmarks, so every report computes its percentiles the same way.
+"""
+import math
+
+# Unit suffix -> factor from seconds
+UNITS = {"s": 1, "ms": 1000, "us": 1e6}
+
+def percentiles(samples, unit="ms"):
+    """
+    Count, p50, p99 and max of ``samples`` (seconds), nearest-rank, keyed
+    "p50_ms" etc. in ``unit``; the values are None when there are no samples
+    """
+    scale = UNITS[unit]
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0, f"p50_{unit}": None, f"p99_{unit}": None, f"max_{unit}": None}
+    return {
+        "count": len(samples),
+        f"p50_{unit}": samples[math.ceil(len(samples) * 0.5) - 1] * scale,
+        f"p99_{unit}": samples[math.ceil(len(samples) * 0.99) - 1] * scale,
+        f"max_{unit}": samples[-1] * scale,
+    }
@@ -0,0 +1,306 @@
+"""
+Fleet-scale load generator. Simulated gateways upload thousands of bins to
+the server the way central.py does, dashboard clients listen on the
+WebSocket, and the run is summarised as one JSON document so runs can be
+compared.
+
+    python loadgen.py [--url http://127.0.0.1:8000] [--gateways 20] [--bins 2000]
+                      [--interval 5] [--duration 60] [--dashboards 10]
+                      [--pattern random|fill|flap] [--transition-rate 0.02] [--heard-rate 0.1]
+                      [--transport http|ws] [--mode delta|snapshot] [--no-gzip]
+                      [--db SmartBin/db.sqlite3] [--output run.json]
+
+Each gateway owns --bins / --gateways bins and uploads every --interval
+seconds, starting at a random offset. --transition-rate of its bins change
+status per upload following --pattern:
+
+    random  a new status picked from OK, EMPTY, FULL and OFFLINE
+    fill    EMPTY -> OK -> FULL -> EMPTY, bins fill up and get collected
+    flap    the same bins flip between FULL and OK every time
+
+and --heard-rate of them report a new last_seen. In "delta" mode uploads are
+sequenced keyframes and deltas (uploader.DeltaEncoder, as central.py sends
+them), in "snapshot" mode plain {"gateway": id, "bins": {bin_id: {...}}}
+snapshots.
+
+Latency is measured from just before the POST (or WebSocket frame) to the
+moment a dashboard client receives the broadcast carrying it: every upload
+stamps a "probe" field into the gateway's first bin. With --db (the
+server's SQLite file) the history rows written during the run are counted
+too.
+"""
+import argparse
+import json
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import websocket
+
+from latency import percentiles
+from uploader import DeltaEncoder, make_transport
+
+STATUSES = ["OK", "EMPTY", "FULL", "OFFLINE"]
+# Emptied bins fill up again, full ones get collected
+FILL_CYCLE = {"EMPTY": "OK", "OK": "FULL", "FULL": "EMPTY"}
+DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+PROBE = re.compile(r'"probe": ?"([^"]+)"')
+
+class Probes:
+    """When each probe was sent, shared by the gateways and the dashboards"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.sent = {}
+        self.lock = threading.Lock()
+
+    def stamp(self, gateway_id, n):
+        probe = f"{self.run_id}:{gateway_id}:{n}"
+        with self.lock:
+            self.sent[probe] = time.perf_counter()
+        return probe
+
+    def sent_at(self, probe):
+        with self.lock:
+            return self.sent.get(probe)
+
+class SimulatedGateway(threading.Thread):
+    def __init__(self, gateway_id, bin_ids, args, probes, deadline, rng):
+        super().__init__(name=f"gateway-{gateway_id}", daemon=True)
+        self.gateway_id = gateway_id
+        self.args = args
+        self.probes = probes
+        self.deadline = deadline
+        self.rng = rng
+        self.state = {
+            bin_id: {
+                "status": "OK",
+                "coord": [rng.uniform(0, 1000), rng.uniform(0, 1000)],
+                "last_seen": 0,
+                "next_nearest": None,
+                "next_nearest_direction": None,
+            }
+            for bin_id in bin_ids
+        }
+        self.bin_ids = list(bin_ids)
+        # Bins that flap, fixed for the run
+        self.flapping = rng.sample(self.bin_ids, max(1, int(len(self.bin_ids) * args.transition_rate)))
+        self.encoder = DeltaEncoder(gateway_id, keyframe_interval=args.keyframe_interval)
+        path = "/ws/gateway/" if args.transport == "ws" else "/websocket/dashboard"
+        base = args.url.replace("http://", "ws://").replace("https://", "wss://") if args.transport == "ws" else args.url
+        self.transport = make_transport(base.rstrip("/") + path, timeout=args.timeout, compress=not args.no_gzip)
+        self.uploads = 0
+        self.ok = 0
+        self.errors = 0
+        self.resyncs = 0
+        self.bins_sent = 0
+        self.post_latencies = []
+
+    def _transition(self, status):
+        pattern = self.args.pattern
+        if pattern == "fill":
+            return FILL_CYCLE[status]
+        if pattern == "flap":
+            return "OK" if status == "FULL" else "FULL"
+        return self.rng.choice([s for s in STATUSES if s != status])
+
+    def step(self, n):
+        """Move the simulated bins on by one upload interval"""
+        rng = self.rng
+        state = self.state
+        if self.args.pattern == "flap":
+            moving = self.flapping
+        else:
+            moving = rng.sample(self.bin_ids, int(len(self.bin_ids) * self.args.transition_rate))
+            if self.args.pattern == "fill":
+                # Bins fill up and get emptied, they don't jump around
+                moving = [b for b in moving if state[b]["status"] in FILL_CYCLE]
+        for bin_id in moving:
+            state[bin_id] = dict(state[bin_id], status=self._transition(state[bin_id]["status"]))
+        for bin_id in rng.sample(self.bin_ids, int(len(self.bin_ids) * self.args.heard_rate)):
+            state[bin_id] = dict(state[bin_id], last_seen=rng.randint(0, 120),
+                                 next_nearest=rng.choice(self.bin_ids), next_nearest_direction=rng.choice(DIRECTIONS))
+        first = self.bin_ids[0]
+        state[first] = dict(state[first], probe=self.probes.stamp(self.gateway_id, n))
+
+    def run(self):
+        interval = self.args.interval
+        next_upload = time.perf_counter() + self.rng.uniform(0, interval)
+        n = 0
+        while True:
+            delay = next_upload - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if time.perf_counter() >= self.deadline:
+                break
+            n += 1
+            self.step(n)
+            if self.args.mode == "delta":
+                message = self.encoder.encode(dict(self.state))
+            else:
+                message = {"gateway": self.gateway_id, "bins": dict(self.state)}
+            if message is not None:
+                self._send(message)
+            next_upload += interval
+        self.transport.close()
+
+    def _send(self, message):
+        body = json.dumps(message).encode()
+        started = time.perf_counter()
+        try:
+            status, reply = self.transport.send(body)
+        except Exception:
+            self.errors += 1
+            self.encoder.resync()
+            return
+        self.post_latencies.append(time.perf_counter() - started)
+        self.uploads += 1
+        if status == 409 or reply.get("resync"):
+            self.resyncs += 1
+            self.encoder.resync()
+        elif status < 300:
+            self.ok += 1
+            self.bins_sent += len(message.get("bins", message))
+        else:
+            self.errors += 1
+
+class DashboardClient(threading.Thread):
+    def __init__(self, url, probes, stop_event, timeout):
+        super().__init__(daemon=True)
+        self.url = url
+        self.probes = probes
+        self.stop_event = stop_event
+        self.timeout = timeout
+        self.frames = 0
+        self.bytes = 0
+        self.seen = set()
+        self.latencies = []
+        self.error = None
+        self.connection = websocket.create_connection(self.url, timeout=self.timeout)
+        self.connection.settimeout(0.5)
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    frame = self.connection.recv()
+                except websocket.WebSocketTimeoutException:
+                    continue
+                received = time.perf_counter()
+                self.frames += 1
+                self.bytes += len(frame)
+                # Cheaper than parsing the whole fleet on the client
+                for probe in PROBE.findall(frame):
+                    if probe in self.seen:
+                        continue
+                    sent = self.probes.sent_at(probe)
+                    if sent is not None:
+                        self.seen.add(probe)
+                        self.latencies.append(received - sent)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.connection.close()
+
+def history_rows(db):
+    connection = sqlite3.connect(db, timeout=30)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM "WebSocket_sensordata"').fetchone()[0]
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL")
+    parser.add_argument("--gateways", type=int, default=20)
+    parser.add_argument("--bins", type=int, default=2000, help="Bins across all gateways")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between a gateway's uploads")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load for")
+    parser.add_argument("--dashboards", type=int, default=10, help="Dashboard WebSocket clients")
+    parser.add_argument("--pattern", choices=["random", "fill", "flap"], default="random")
+    parser.add_argument("--transition-rate", type=float, default=0.02,
+                        help="Fraction of a gateway's bins changing status per upload")
+    parser.add_argument("--heard-rate", type=float, default=0.1,
+                        help="Fraction of a gateway's bins reporting a new last_seen per upload")
+    parser.add_argument("--transport", choices=["http", "ws"], default="http")
+    parser.add_argument("--mode", choices=["delta", "snapshot"], default="delta")
+    parser.add_argument("--keyframe-interval", type=float, default=60.0)
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--drain", type=float, default=3.0, help="Seconds to wait for the last broadcasts")
+    parser.add_argument("--db", help="Server's SQLite file, to count the history rows written")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON summary here as well as to stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    probes = Probes(f"{args.seed}-{int(time.time())}")
+    stop_event = threading.Event()
+    ws_base = args.url.rstrip("/").replace("http://", "ws://").replace("https://", "wss://")
+    dashboards = [DashboardClient(ws_base + "/ws/dashboard/", probes, stop_event, args.timeout)
+                  for _ in range(args.dashboards)]
+    for dashboard in dashboards:
+        dashboard.start()
+
+    rows_before = history_rows(args.db) if args.db else None
+    started = time.perf_counter()
+    deadline = started + args.duration
+    per_gateway = -(-args.bins // args.gateways)
+    gateways = []
+    for g in range(args.gateways):
+        bin_ids = [str(b) for b in range(g * per_gateway + 1, min(args.bins, (g + 1) * per_gateway) + 1)]
+        if bin_ids:
+            gateways.append(SimulatedGateway(f"load-{g}", bin_ids, args, probes,
+                                             deadline, random.Random(rng.random())))
+    for gateway in gateways:
+        gateway.start()
+    for gateway in gateways:
+        gateway.join()
+    elapsed = time.perf_counter() - started
+    time.sleep(args.drain)
+    stop_event.set()
+    for dashboard in dashboards:
+        dashboard.join()
+    rows_after = history_rows(args.db) if args.db else None
+
+    uploads_ok = sum(g.ok for g in gateways)
+    probes_sent = len(probes.sent)
+    delivery = [latency for d in dashboards for latency in d.latencies]
+    summary = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "elapsed_s": elapsed,
+        "ingest": {
+            "uploads": sum(g.uploads for g in gateways),
+            "ok": uploads_ok,
+            "errors": sum(g.errors for g in gateways),
+            "resyncs": sum(g.resyncs for g in gateways),
+            "uploads_per_s": uploads_ok / elapsed,
+            "bins_per_s": sum(g.bins_sent for g in gateways) / elapsed,
+            "request": percentiles([latency for g in gateways for latency in g.post_latencies]),
+        },
+        "delivery": dict(
+            percentiles(delivery),
+            dashboards=len(dashboards),
+            frames_per_dashboard=sum(d.frames for d in dashboards) / len(dashboards) if dashboards else 0,
+            bytes_per_dashboard=sum(d.bytes for d in dashboards) / len(dashboards) if dashboards else 0,
+            # Slow clients skip to a gateway's newest frame, so not every probe arrives everywhere
+            delivered_ratio=len(delivery) / (probes_sent * len(dashboards)) if probes_sent and dashboards else None,
+            errors=[d.error for d in dashboards if d.error],
+        ),
+    }
+    if args.db:
+        summary["db"] = {"rows_written": rows_after - rows_before,
+                         "rows_per_s": (rows_after - rows_before) / (elapsed + args.drain)}
+
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0 if not summary["ingest"]["errors"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
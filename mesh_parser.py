@@ -0,0 +1,64 @@
+import re
+
+# One entry of mesh_receiver.ino's printNetworkStatus():
+#   Node 3 - Last Seen 12s ago - Status FULL
+ROUTING_ENTRY_PATTERN = re.compile(
+    rb"Node\s+(\d+)\s+-\s+Last\s+Seen\s+(\d+(?:\.\d+)?)s\s+ago\s+-\s+Status:?\s+(\w+)"
+)
+ROUTING_TABLE_HEADER = b"Routing Table:"
+ROUTING_TABLE_FOOTER = b"="
+
+class RoutingTableParser:
+    """
+    Resumable parser for the mesh receiver's routing-table dump.
+
+    Lines are fed one at a time as they come off the serial port, so a dump
+    split across any number of reads is still assembled. Each complete block
+    is returned as one snapshot ``{node_id: (last_seen, status)}``.
+    ``errors`` counts blocks that didn't end with the footer: a line that
+    isn't an entry, or a new header, cut them short.
+    """
+
+    def __init__(self):
+        # Entries of the block being assembled, None outside a block
+        self.entries = None
+        self.errors = 0
+
+    @property
+    def in_block(self):
+        return self.entries is not None
+
+    def feed_line(self, line):
+        """
+        Feed one line (bytes, without terminator).
+
+        Returns ``(consumed, snapshot)``: ``consumed`` is False for lines that
+        are not part of a routing-table dump, ``snapshot`` is set when the line
+        completed a block.
+        """
+        if line.startswith(ROUTING_TABLE_HEADER):
+            # A header inside a block means the footer was lost, keep what
+            # we had rather than dropping a whole table
+            snapshot = self.entries
+            if snapshot is not None:
+                self.errors += 1
+            self.entries = {}
+            return True, snapshot
+
+        entries = self.entries
+        if entries is None:
+            return False, None
+
+        match = ROUTING_ENTRY_PATTERN.match(line)
+        if match:
+            node_id, last_seen, status = match.groups()
+            entries[int(node_id)] = (int(float(last_seen)), status.decode("ascii"))
+            return True, None
+
+        # The "=====" footer, or any line the firmware never prints inside a
+        # dump, closes the block
+        self.entries = None
+        footer = line.startswith(ROUTING_TABLE_FOOTER)
+        if not footer:
+            self.errors += 1
+        return footer, entries
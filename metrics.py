@@ -0,0 +1,260 @@
+"""
+Prometheus metrics for the gateway, served in the text exposition format by
+MetricsServer (http://<gateway>:METRICS_PORT/metrics). The server has its
+own copy of the metric classes (SmartBin/WebSocket/prometheus.py), keep the
+format the same in both.
+
+Recording stays cheap enough for the serial threads: label children are
+created once and kept by the caller, a counter increment is one integer add
+and a histogram observation one bisect plus two adds, with no lock and
+nothing allocated beyond the number recorded. Each series is normally
+written by one thread; a rare lost increment between threads is an
+acceptable price for monitoring. Gauges and counters built with
+``function`` are only read when scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, for per-line handling and lock timings
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+# Seconds, for network round trips and batch work
+SLOW_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+class Registry:
+    """Every metric of one process, rendered together, ``const_labels`` on every series"""
+
+    def __init__(self, const_labels=None):
+        self.metrics = []
+        self.lock = threading.Lock()
+        self.const_labels = dict(const_labels or {})
+
+    def register(self, metric):
+        with self.lock:
+            if any(existing.name == metric.name for existing in self.metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics.append(metric)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class Metric:
+    """A metric family; without label names it records through its single child"""
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.child = self.labels()
+        registry.register(self)
+
+    def labels(self, *values):
+        """The child for these label values, created on first use. Keep it, don't look it up per event."""
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def label_text(self, values, const_labels=None, extra=""):
+        pairs = [f'{name}="{escape(value)}"' for name, value in (const_labels or {}).items()]
+        pairs += [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self, const_labels=None):
+        for values, child in list(self.children.items()):
+            yield f"{self.name}{self.label_text(values, const_labels)} {format_value(child.get())}"
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+class FunctionChild:
+    __slots__ = ("function",)
+
+    def __init__(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function()
+
+class Counter(Metric):
+    """Only goes up. With ``function``, its value is read from function() at scrape time."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        self.function = function
+        super().__init__(name, help, labelnames, registry)
+
+    def new_child(self):
+        return FunctionChild(self.function) if self.function else CounterChild()
+
+    def inc(self, amount=1):
+        self.child.value += amount
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        return self.value
+
+class Gauge(Counter):
+    """Goes up and down. With ``function``, its value is read from function() at scrape time."""
+    kind = "gauge"
+
+    def new_child(self):
+        return FunctionChild(self.function) if self.function else GaugeChild()
+
+    def set(self, value):
+        self.child.value = value
+
+    def dec(self, amount=1):
+        self.child.value -= amount
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf, cumulated when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=SLOW_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.child.observe(value)
+
+    def samples(self, const_labels=None):
+        for values, child in list(self.children.items()):
+            total = 0
+            counts = list(child.counts)
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = 'le="%s"' % format_value(bound)
+                yield f"{self.name}_bucket{self.label_text(values, const_labels, le)} {total}"
+            yield f"{self.name}_sum{self.label_text(values, const_labels)} {format_value(child.sum)}"
+            yield f"{self.name}_count{self.label_text(values, const_labels)} {total}"
+
+class TimedLock:
+    """
+    A threading.Lock used as a context manager that records how long callers
+    waited for it and how long they held it, in two histogram children
+    """
+
+    def __init__(self, wait, hold):
+        self.lock = threading.Lock()
+        self.wait = wait
+        self.hold = hold
+        self.acquired = 0.0
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self.lock.acquire()
+        # Only the holder writes this, until it releases
+        self.acquired = time.perf_counter()
+        self.wait.observe(self.acquired - started)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hold.observe(time.perf_counter() - self.acquired)
+        self.lock.release()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the gateway's own output
+        pass
+
+class MetricsServer:
+    """Serves the registry at /metrics from a daemon thread"""
+
+    def __init__(self, port, host="0.0.0.0", registry=REGISTRY):
+        handler = type("Handler", (MetricsHandler,), {"registry": registry})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
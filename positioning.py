@@ -0,0 +1,178 @@
+"""
+Weighted least-squares multilateration for any number of beacons.
+
+Every range r_i to a beacon at (x_i, y_i) gives one equation that is linear in
+(x, y, c) with c = x^2 + y^2:
+
+    -2 x_i x - 2 y_i y + c = r_i^2 - (x_i^2 + y_i^2)
+
+The rows and their outer products only depend on the beacon layout, so they are
+built once when the solver is created. Solving a bin is then a 3x3 weighted
+normal-equation solve. With NumPy installed all bins are solved in one batch,
+otherwise the same maths runs per bin in pure Python.
+"""
+import math
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional on the gateway
+    np = None
+
+# x, y: position. residual: RMS of (fitted range - measured range) over the
+# beacons used, in metres. beacons: how many beacons went into the fix.
+Fix = namedtuple("Fix", ["x", "y", "residual", "beacons"])
+
+MIN_BEACONS = 3
+# Range error grows with range, so each equation is weighted by 1 / r^2.
+# Ranges below this are clamped first so one very close beacon can't take all
+# the weight.
+MIN_RANGE = 0.1
+# |det| / product of row norms of the unweighted normal matrix. Close to zero
+# means the beacons in the fix are (nearly) collinear and the position is
+# undetermined.
+MIN_GEOMETRY_QUALITY = 1e-9
+
+def _geometry_quality(normal):
+    """|det| / product of row norms for a flattened 3x3 matrix, 0 when singular"""
+    a, b, c, d, e, f, g, h, k = normal
+    det = a * (e * k - f * h) - b * (d * k - f * g) + c * (d * h - e * g)
+    norms = (math.sqrt(a * a + b * b + c * c)
+             * math.sqrt(d * d + e * e + f * f)
+             * math.sqrt(g * g + h * h + k * k))
+    return abs(det) / norms if norms else 0.0
+
+class MultilaterationSolver:
+    """Solve bin positions from beacon ranges, precomputing the beacon geometry"""
+
+    def __init__(self, beacon_locations, use_numpy=True):
+        self.beacon_ids = list(beacon_locations)
+        self.beacon_index = {beacon_id: i for i, beacon_id in enumerate(self.beacon_ids)}
+        self.locations = [tuple(beacon_locations[b]) for b in self.beacon_ids]
+
+        # Work relative to the beacons' centroid, it keeps the normal matrix
+        # well conditioned when the site is far from (0, 0)
+        self.origin = (sum(x for x, _ in self.locations) / len(self.locations),
+                       sum(y for _, y in self.locations) / len(self.locations))
+        ox, oy = self.origin
+        local = [(x - ox, y - oy) for x, y in self.locations]
+        self._local = local
+
+        self._rows = [(-2.0 * x, -2.0 * y, 1.0) for x, y in local]
+        self._offsets = [x * x + y * y for x, y in local]
+        self._outer = [tuple(a * b for a in row for b in row) for row in self._rows]
+        # Whether a set of beacon indices can fix a position at all
+        self._geometry_cache = {}
+
+        self.use_numpy = use_numpy and np is not None
+        if self.use_numpy:
+            self._rows_array = np.array(self._rows)
+            self._offsets_array = np.array(self._offsets)
+            self._outer_array = np.array(self._outer)
+            self._local_array = np.array(local, dtype=float)
+
+    def solve(self, readings):
+        """
+        Solve every bin in ``readings`` ({bin_id: {beacon_id: distance}}).
+        Returns {bin_id: Fix}, with None for bins that have fewer than three
+        known beacons or whose beacons are collinear.
+        """
+        if not readings:
+            return {}
+        if self.use_numpy:
+            return self._solve_numpy(readings)
+        return {bin_id: self._solve_one(distances) for bin_id, distances in readings.items()}
+
+    def _solve_one(self, distances):
+        """Pure-Python solve for one bin"""
+        used = [(self.beacon_index[b], max(r, MIN_RANGE))
+                for b, r in distances.items() if b in self.beacon_index]
+        if len(used) < MIN_BEACONS:
+            return None
+
+        beacons = frozenset(i for i, _ in used)
+        geometry_ok = self._geometry_cache.get(beacons)
+        if geometry_ok is None:
+            unweighted = [sum(self._outer[i][k] for i in beacons) for k in range(9)]
+            geometry_ok = _geometry_quality(unweighted) >= MIN_GEOMETRY_QUALITY
+            self._geometry_cache[beacons] = geometry_ok
+        if not geometry_ok:
+            return None
+
+        normal = [0.0] * 9
+        rhs = [0.0, 0.0, 0.0]
+        for i, r in used:
+            r2 = r * r
+            weight = 1.0 / r2
+            value = weight * (r2 - self._offsets[i])
+            outer = self._outer[i]
+            for k in range(9):
+                normal[k] += weight * outer[k]
+            row = self._rows[i]
+            rhs[0] += value * row[0]
+            rhs[1] += value * row[1]
+            rhs[2] += value * row[2]
+
+        a, b, c, d, e, f, g, h, k = normal
+        det = a * (e * k - f * h) - b * (d * k - f * g) + c * (d * h - e * g)
+
+        # Cramer's rule, only x and y are needed
+        r0, r1, r2 = rhs
+        x = (r0 * (e * k - f * h) - b * (r1 * k - f * r2) + c * (r1 * h - e * r2)) / det
+        y = (a * (r1 * k - f * r2) - r0 * (d * k - f * g) + c * (d * r2 - r1 * g)) / det
+
+        squared_error = 0.0
+        for i, r in used:
+            bx, by = self._local[i]
+            squared_error += (math.hypot(x - bx, y - by) - r) ** 2
+        return Fix(x + self.origin[0], y + self.origin[1],
+                   math.sqrt(squared_error / len(used)), len(used))
+
+    def _solve_numpy(self, readings):
+        """Vectorized solve for all bins at once"""
+        bin_ids = list(readings)
+        ranges = np.full((len(bin_ids), len(self.beacon_ids)), np.nan)
+        index = self.beacon_index
+        for row, bin_id in enumerate(bin_ids):
+            for beacon_id, distance in readings[bin_id].items():
+                column = index.get(beacon_id)
+                if column is not None:
+                    ranges[row, column] = distance
+
+        present = ~np.isnan(ranges)
+        counts = present.sum(axis=1)
+        clamped = np.where(present, np.maximum(np.nan_to_num(ranges), MIN_RANGE), 1.0)
+        squared = clamped * clamped
+        weights = np.where(present, 1.0 / squared, 0.0)
+
+        normal = (weights @ self._outer_array).reshape(-1, 3, 3)
+        rhs = (weights * (squared - self._offsets_array)) @ self._rows_array
+
+        # Judge the beacon geometry without the weights: a very close beacon
+        # makes the weighted matrix lopsided without making it singular
+        unweighted = (present.astype(float) @ self._outer_array).reshape(-1, 3, 3)
+        norms = np.linalg.norm(unweighted, axis=2).prod(axis=1)
+        quality = np.abs(np.linalg.det(unweighted)) / np.where(norms > 0, norms, 1.0)
+        solvable = (counts >= MIN_BEACONS) & (quality >= MIN_GEOMETRY_QUALITY)
+
+        # Swap unsolvable systems for the identity so one bad bin can't make
+        # the batched solve raise for the rest
+        normal[~solvable] = np.eye(3)
+        rhs[~solvable] = 0.0
+        solution = np.linalg.solve(normal, rhs[..., None])[..., 0]
+        x = solution[:, 0]
+        y = solution[:, 1]
+        ox, oy = self.origin
+
+        fitted = np.hypot(x[:, None] - self._local_array[:, 0],
+                          y[:, None] - self._local_array[:, 1])
+        errors = np.where(present, fitted - clamped, 0.0)
+        residual = np.sqrt((errors * errors).sum(axis=1) / np.maximum(counts, 1))
+
+        fixes = {}
+        for row, bin_id in enumerate(bin_ids):
+            if solvable[row]:
+                fixes[bin_id] = Fix(float(x[row] + ox), float(y[row] + oy), float(residual[row]), int(counts[row]))
+            else:
+                fixes[bin_id] = None
+        return fixes
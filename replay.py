@@ -0,0 +1,260 @@
+"""
+Replay a serial capture (central.py with CAPTURE_PATH set) into the gateway
+through pseudo-terminals, and report how fast it keeps up.
+
+    python replay.py capture.bin [--speed 1] [--url http://127.0.0.1:8000/websocket/dashboard]
+                     [--upload-interval 5] [--no-dedup] [--verbose] [--output run.json]
+
+--speed 1 plays the capture in real time, --speed 10 ten times faster and
+--speed 0 as fast as the gateway reads. The serial threads and the
+processing thread of central.py run unchanged against pyserial ports opened
+on the ptys. Without --url nothing is sent: upload payloads are built and
+counted, then dropped. Capture ports are named after their receivers
+("mesh:COM4", or plain "mesh" in older captures); with more than one
+receiver of a kind the gateway's duplicate suppression is on, as it would be
+on the gateway that recorded them, unless --no-dedup. Its windows are
+scaled with the speed; at --speed 0 whatever arrives between two processing
+passes is merged.
+
+Reports lines/s handled per port, position fixes/s, and for every line the
+delay from the moment it was written to the pty until it was handled and
+until the first upload built after that. Gateway output is discarded unless
+--verbose, printing every line costs more than parsing it.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import serial
+
+import central
+from latency import percentiles
+from serial_capture import capture_lines, load_capture, replay
+from serial_sim import PtySerialPort
+from uploader import Uploader
+
+HANDLERS = {"mesh": central.handle_mesh_line, "beacon": central.handle_beacon_line}
+
+def port_kind(port):
+    """Receiver kind of a capture port name, mesh for mesh:COM4"""
+    return port.split(":", 1)[0]
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+class UploadTap:
+    """
+    Stands in for central.uploader: notes when every upload pass happens and
+    hands the payload on to a real Uploader, if there is one
+    """
+
+    def __init__(self, on_upload, uploader=None):
+        self.on_upload = on_upload
+        self.uploader = uploader
+        self.payloads = 0
+
+    def submit(self, message):
+        self.payloads += 1
+        self.on_upload()
+        if self.uploader is not None:
+            self.uploader.submit(message)
+
+    def flush(self):
+        # Delta mode with nothing changed, still an upload pass
+        self.on_upload()
+        if self.uploader is not None:
+            self.uploader.flush()
+
+    def close(self):
+        if self.uploader is not None:
+            self.uploader.close()
+
+class Replay:
+    def __init__(self, path, speed=1.0, url=None, dedup=True):
+        self.ports, self.records = load_capture(path)
+        unknown = {port for port in self.ports if port_kind(port) not in HANDLERS}
+        if unknown:
+            raise ValueError(f"No gateway handler for ports {sorted(unknown)}")
+        self.speed = speed
+        self.url = url
+        self.dedup = dedup
+        self.lines = {port: capture_lines(self.records, port) for port in self.ports}
+        self.written_at = [None] * len(self.records)
+        self.handled = {port: [] for port in self.ports}
+        self.uploads = []
+        self.fixes = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def on_write(self, index, when):
+        self.written_at[index] = when
+
+    def counted(self, port):
+        handle = HANDLERS[port_kind(port)]
+        handled = self.handled[port]
+        expected = len(self.lines[port])
+
+        def handle_line(line):
+            try:
+                handle(line, port)
+            finally:
+                handled.append(time.monotonic())
+                if len(handled) >= expected and self.all_handled():
+                    self.done.set()
+        return handle_line
+
+    def all_handled(self):
+        return all(len(self.handled[port]) >= len(self.lines[port]) for port in self.ports)
+
+    def on_upload(self):
+        now = time.monotonic()
+        with self.lock:
+            self.uploads.append((now, {port: len(handled) for port, handled in self.handled.items()}))
+
+    def count_fixes(self, solve):
+        def counted_solve(readings):
+            fixes = solve(readings)
+            self.fixes += sum(1 for fix in fixes.values() if fix is not None)
+            return fixes
+        return counted_solve
+
+    def run(self):
+        central.position_solver.solve = self.count_fixes(central.position_solver.solve)
+        uploader = Uploader(self.url, central.UPLOAD_QUEUE_PATH, on_resync=central.delta_encoder.resync) if self.url else None
+        central.uploader = UploadTap(self.on_upload, uploader)
+        if self.dedup:
+            # Windows are capture time, like the records' timestamps
+            scale = 1 / self.speed if self.speed else 0
+            central.MESH_DEDUP_WINDOW *= scale
+            central.BEACON_DEDUP_WINDOW *= scale
+            central.configure_receivers([port for port in self.ports if port_kind(port) == "mesh"],
+                                        [port for port in self.ports if port_kind(port) == "beacon"])
+        if not any(self.lines.values()):
+            self.done.set()
+
+        stop_event = threading.Event()
+        ptys = {port: PtySerialPort() for port in self.ports}
+        ports = {port: serial.Serial(ptys[port].port, central.BAUD_RATE, timeout=1) for port in self.ports}
+        readers = [threading.Thread(target=central.read_serial_frames,
+                                    args=(ports[port], self.counted(port), stop_event, port), daemon=True)
+                   for port in self.ports]
+        for reader in readers:
+            reader.start()
+        # Runs forever, like on the gateway
+        threading.Thread(target=central.main_processing_thread, daemon=True).start()
+
+        started = time.monotonic()
+        replay(self.records, ptys, self.speed, self.on_write)
+        written = time.monotonic()
+        # Lines can only go missing if the reader dropped an overlong one,
+        # give up once nothing has been handled for a while
+        count = -1
+        while not self.done.wait(2):
+            total = sum(len(handled) for handled in self.handled.values())
+            if total == count:
+                print(f"Replay: {total} of {sum(len(lines) for lines in self.lines.values())} lines handled, giving up",
+                      file=sys.stderr)
+                break
+            count = total
+        handled = time.monotonic()
+        # Merged reports are released once their window closes
+        filters = [duplicates for duplicates in (central.mesh_duplicates, central.beacon_duplicates)
+                   if duplicates is not None]
+        released = None
+        if filters:
+            deadline = handled + max(central.MESH_DEDUP_WINDOW, central.BEACON_DEDUP_WINDOW) + 1
+            while time.monotonic() < deadline and any(len(duplicates) for duplicates in filters):
+                time.sleep(0.05)
+            released = time.monotonic()
+        # The last lines still have to make it into an upload
+        deadline = (released or handled) + central.UPLOAD_INTERVAL + 1
+        while time.monotonic() < deadline and not self.uploaded_all(released):
+            time.sleep(0.05)
+
+        stop_event.set()
+        for reader in readers:
+            reader.join(2)
+        for port in self.ports:
+            ports[port].close()
+            ptys[port].close()
+        central.uploader.close()
+        return self.summary(started, written, handled, time.monotonic())
+
+    def uploaded_all(self, after=None):
+        with self.lock:
+            if not self.uploads or (after is not None and self.uploads[-1][0] < after):
+                return False
+            return all(self.uploads[-1][1][port] >= len(self.lines[port]) for port in self.ports)
+
+    def summary(self, started, written, handled, finished):
+        bins = central.routing_store.snapshot().bins
+        elapsed = handled - started
+        to_handled = []
+        to_upload = []
+        ports = {}
+        for port in self.ports:
+            upload = 0
+            for number, ((record, _), done) in enumerate(zip(self.lines[port], self.handled[port])):
+                sent = self.written_at[record]
+                to_handled.append(done - sent)
+                # First upload pass that had seen this line
+                while upload < len(self.uploads) and self.uploads[upload][1][port] <= number:
+                    upload += 1
+                if upload < len(self.uploads):
+                    to_upload.append(self.uploads[upload][0] - sent)
+            ports[port] = {"lines": len(self.handled[port]), "lines_per_s": len(self.handled[port]) / elapsed}
+        lines = sum(len(handled) for handled in self.handled.values())
+        return {
+            "records": len(self.records),
+            "capture_s": self.records[-1][0] if self.records else 0,
+            "speed": self.speed,
+            "write_s": written - started,
+            "elapsed_s": elapsed,
+            "run_s": finished - started,
+            "lines": lines,
+            "lines_per_s": lines / elapsed if elapsed else None,
+            "ports": ports,
+            "fixes": self.fixes,
+            # Positions are solved by the processing loop, which runs to the end
+            "fixes_per_s": self.fixes / (finished - started),
+            "uploads": len(self.uploads),
+            "upload_payloads": central.uploader.payloads,
+            "serial_to_handled": percentiles(to_handled),
+            "serial_to_upload": percentiles(to_upload),
+            "duplicates_merged": {
+                kind: duplicates.duplicates if duplicates is not None else 0
+                for kind, duplicates in (("mesh", central.mesh_duplicates), ("beacon", central.beacon_duplicates))
+            },
+            # How fresh the gateway's view of the bins ended up
+            "mean_last_seen_s": mean([bin_data["last_seen"] for bin_data in bins.values() if "last_seen" in bin_data]),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="file written by central.py with CAPTURE_PATH set")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 for as fast as possible")
+    parser.add_argument("--url", help="upload to this server instead of dropping the payloads")
+    parser.add_argument("--upload-interval", type=float, default=central.UPLOAD_INTERVAL)
+    parser.add_argument("--no-dedup", action="store_true", help="handle every receiver on its own")
+    parser.add_argument("--verbose", action="store_true", help="keep the gateway's own output")
+    parser.add_argument("--output", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    central.UPLOAD_INTERVAL = args.upload_interval
+    out = sys.stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(out if args.verbose else devnull):
+        results = Replay(args.capture, args.speed, args.url, not args.no_dedup).run()
+        results["upload_interval"] = args.upload_interval
+        text = json.dumps(results, indent=2)
+        print(text, file=out)
+        out.flush()
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
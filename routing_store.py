@@ -0,0 +1,184 @@
+"""
+Single-writer store for the gateway's routing table.
+
+Threads never touch the table directly. They submit updates (functions
+taking a TableWriter) to a queue, and one writer thread applies them in
+order and then publishes a Snapshot. Readers call snapshot(), a single
+attribute read with no lock, and keep a consistent view for as long as they
+like:
+
+- bins are copy-on-write: an update that changes a bin replaces it with a
+  new read-only mapping, so a bin in a published snapshot never changes;
+- ``bins`` is a read-only mapping over a dict built for that snapshot;
+- ``version`` goes up whenever the bins changed, ``applied`` is the number
+  of the last update included. submit() returns the update's number and
+  wait() blocks until a snapshot includes it.
+
+Updates run on the writer thread and may use state that only they touch
+(the spatial index in central.py). At most ``max_pending`` updates wait in
+the queue; past that submit() blocks until the writer catches up, so a flood
+of input slows its producers down instead of growing the queue forever.
+"""
+import queue
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+Snapshot = namedtuple("Snapshot", ["version", "applied", "bins", "published"])
+
+_STOP = object()
+
+class TableWriter:
+    """The writer's working table as updates see it"""
+
+    def __init__(self, bins):
+        self._bins = bins
+        self.changed = False
+
+    def get(self, bin_id, default=None):
+        return self._bins.get(bin_id, default)
+
+    def __contains__(self, bin_id):
+        return bin_id in self._bins
+
+    def __len__(self):
+        return len(self._bins)
+
+    def items(self):
+        # Updates may change bins while looping over the table
+        return list(self._bins.items())
+
+    def update(self, bin_id, fields=None, remove=()):
+        """
+        Set ``fields`` on a bin (created if missing) and drop the ``remove``
+        keys. A bin left as it was isn't copied.
+        """
+        bins = self._bins
+        old = bins.get(bin_id)
+        if old is None:
+            new = dict(fields) if fields else {}
+        else:
+            unchanged = True
+            if fields:
+                for key, value in fields.items():
+                    if key not in old or old[key] != value:
+                        unchanged = False
+                        break
+            for key in remove:
+                if key in old:
+                    unchanged = False
+            if unchanged:
+                return old
+            # A mappingproxy's copy() copies the dict underneath
+            new = old.copy()
+            if fields:
+                new.update(fields)
+        for key in remove:
+            new.pop(key, None)
+        bin_data = bins[bin_id] = MappingProxyType(new)
+        self.changed = True
+        return bin_data
+
+class RoutingStore:
+    """See the module docstring. The writer thread starts on the first submit()."""
+
+    def __init__(self, bins=None, max_pending=1000, max_batch=1000, batch_seconds=None):
+        self._bins = {bin_id: MappingProxyType(dict(data)) for bin_id, data in (bins or {}).items()}
+        self._snapshot = Snapshot(0, 0, MappingProxyType(dict(self._bins)), time.monotonic())
+        self._queue = queue.Queue(max_pending)
+        # Numbers are handed out in queue order
+        self._submit_lock = threading.Lock()
+        self._submitted = 0
+        self._published = threading.Condition()
+        self._thread = None
+        self.max_batch = max_batch
+        # Histogram child timing each batch, see metrics.py
+        self.batch_seconds = batch_seconds
+
+        self.updates_applied = 0
+        self.update_errors = 0
+        self.publishes = 0
+
+    def snapshot(self):
+        """The newest published Snapshot"""
+        return self._snapshot
+
+    def submit(self, update):
+        """Queue ``update(table_writer)`` and return its number"""
+        with self._submit_lock:
+            if self._thread is None:
+                self._start()
+            self._submitted += 1
+            number = self._submitted
+            self._queue.put((number, update))
+        return number
+
+    def wait(self, number, timeout=None):
+        """The first snapshot that includes update ``number``, or the newest one on timeout"""
+        snapshot = self._snapshot
+        if snapshot.applied >= number:
+            return snapshot
+        with self._published:
+            self._published.wait_for(lambda: self._snapshot.applied >= number, timeout)
+            return self._snapshot
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="routing-store", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        clock = time.perf_counter
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = clock()
+            writer = TableWriter(self._bins)
+            applied = self._snapshot.applied
+            stopping = False
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                number, update = item
+                try:
+                    update(writer)
+                except Exception as e:
+                    self.update_errors += 1
+                    print(f"Routing table: update failed: {e}")
+                applied = number
+            self.updates_applied += len(batch) - stopping
+            self._publish(writer.changed, applied)
+            if self.batch_seconds is not None:
+                self.batch_seconds.observe(clock() - started)
+            if stopping:
+                return
+
+    def _publish(self, changed, applied):
+        snapshot = self._snapshot
+        if changed:
+            bins = MappingProxyType(dict(self._bins))
+            snapshot = Snapshot(snapshot.version + 1, applied, bins, time.monotonic())
+        else:
+            snapshot = snapshot._replace(applied=applied)
+        with self._published:
+            self._snapshot = snapshot
+            self._published.notify_all()
+        self.publishes += 1
+
+    def close(self, timeout=5):
+        """Apply what is queued and stop the writer thread"""
+        with self._submit_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from collections import deque
+
+class BeaconTrack:
+    """Recent RSSI samples from one beacon for one bin"""
+
+    __slots__ = ("samples", "smoothed_rssi", "distance", "solved_distance")
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # (timestamp, rssi), oldest first
+        self.smoothed_rssi = None
+        self.distance = None
+        # Distance the solver last used, None until it has seen this track
+        self.solved_distance = None
+
+class RssiStore:
+    """
+    Time-windowed RSSI readings per (bin, beacon) in front of the position
+    solver.
+
+    Each pair keeps a bounded ring buffer of samples. RSSI is smoothed with an
+    EWMA whose weight follows the time since the previous sample, then turned
+    into a distance. Samples older than ``ttl`` expire and a bin with no live
+    beacons is evicted. A bin only becomes dirty (needs a new position) when a
+    beacon appears, expires, or its smoothed distance moves by more than
+    ``resolve_threshold`` (relative) since the last solve.
+    """
+
+    def __init__(self, rssi_to_distance, window=8, ttl=180, smoothing_seconds=120,
+                 resolve_threshold=0.1, clock=time.monotonic):
+        self.rssi_to_distance = rssi_to_distance
+        self.window = window
+        self.ttl = ttl
+        self.smoothing_seconds = smoothing_seconds
+        self.resolve_threshold = resolve_threshold
+        self.clock = clock
+        self.bins = {}  # bin_id -> {beacon_id: BeaconTrack}
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def add(self, bin_id, beacon_id, rssi, now=None):
+        """Record one reading, returns True if it made the bin need a new position"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            tracks = self.bins.get(bin_id)
+            if tracks is None:
+                tracks = self.bins[bin_id] = {}
+            track = tracks.get(beacon_id)
+            if track is None:
+                track = tracks[beacon_id] = BeaconTrack(self.window)
+
+            samples = track.samples
+            if track.smoothed_rssi is None or not samples:
+                track.smoothed_rssi = rssi
+            else:
+                elapsed = max(now - samples[-1][0], 0.0)
+                alpha = 1.0 - math.exp(-elapsed / self.smoothing_seconds) if self.smoothing_seconds else 1.0
+                track.smoothed_rssi += alpha * (rssi - track.smoothed_rssi)
+            samples.append((now, rssi))
+            track.distance = self.rssi_to_distance(track.smoothed_rssi)
+
+            solved = track.solved_distance
+            if solved is None or abs(track.distance - solved) > self.resolve_threshold * solved:
+                self.dirty.add(bin_id)
+                return True
+            return False
+
+    def pop_dirty(self):
+        """
+        Return {bin_id: {beacon_id: smoothed distance}} for every dirty bin and
+        remember those distances as solved.
+        """
+        with self.lock:
+            readings = {}
+            for bin_id in self.dirty:
+                tracks = self.bins.get(bin_id)
+                if not tracks:
+                    continue
+                distances = {}
+                for beacon_id, track in tracks.items():
+                    distances[beacon_id] = track.solved_distance = track.distance
+                readings[bin_id] = distances
+            self.dirty.clear()
+            return readings
+
+    def expire(self, now=None):
+        """Drop samples older than the TTL, returns the ids of evicted bins"""
+        if now is None:
+            now = self.clock()
+        cutoff = now - self.ttl
+        evicted = []
+        with self.lock:
+            for bin_id, tracks in list(self.bins.items()):
+                for beacon_id, track in list(tracks.items()):
+                    samples = track.samples
+                    # Newest sample last, so the track is dead if it's stale
+                    if samples[-1][0] < cutoff:
+                        del tracks[beacon_id]
+                        self.dirty.add(bin_id)
+                        continue
+                    while samples[0][0] < cutoff:
+                        samples.popleft()
+                if not tracks:
+                    del self.bins[bin_id]
+                    self.dirty.discard(bin_id)
+                    evicted.append(bin_id)
+        return evicted
+
+    def __len__(self):
+        return len(self.bins)
@@ -0,0 +1,123 @@
+"""
+Raw serial captures of the mesh and beacon receivers, for replaying them into
+the gateway later (see replay.py).
+
+A capture file starts with one JSON header line naming the ports, followed
+by one record per read from a port: a ``<dBI`` struct (seconds since the
+capture started, port index, length) and the bytes exactly as the port
+returned them, line breaks, partial lines and noise included.
+"""
+import json
+import struct
+import threading
+import time
+
+from serial_reader import LineReader
+
+FORMAT = "smartbin-serial-capture"
+VERSION = 1
+RECORD = struct.Struct("<dBI")
+
+class CaptureWriter:
+    """Appends timestamped reads from several ports to one capture file"""
+
+    def __init__(self, path, ports):
+        self.ports = list(ports)
+        self._index = {port: index for index, port in enumerate(self.ports)}
+        self._file = open(path, "wb")
+        header = {"format": FORMAT, "version": VERSION, "ports": self.ports, "started": time.time()}
+        self._file.write(json.dumps(header).encode() + b"\n")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def write(self, port, data, offset=None):
+        """Record ``data`` read from ``port`` ``offset`` seconds into the capture (default: now)"""
+        if not data:
+            return
+        if offset is None:
+            offset = time.monotonic() - self._started
+        with self._lock:
+            self._file.write(RECORD.pack(offset, self._index[port], len(data)))
+            self._file.write(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CapturingSerial:
+    """
+    Wraps an open serial port and records every chunk read() returns. Other
+    attributes go straight to the port, so the serial readers can't tell the
+    difference.
+    """
+
+    def __init__(self, ser, writer, port):
+        self._ser = ser
+        self._writer = writer
+        self._port = port
+
+    def read(self, size=1):
+        data = self._ser.read(size)
+        self._writer.write(self._port, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+def load_capture(path):
+    """Return ``(ports, records)``, records being ``(offset, port, data)`` in capture order"""
+    with open(path, "rb") as capture:
+        header = json.loads(capture.readline())
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} serial capture")
+        ports = header["ports"]
+        records = []
+        while True:
+            head = capture.read(RECORD.size)
+            if len(head) < RECORD.size:
+                # A capture cut short by a crash ends in a partial record
+                break
+            offset, index, length = RECORD.unpack(head)
+            data = capture.read(length)
+            if len(data) < length:
+                break
+            records.append((offset, ports[index], data))
+    return ports, records
+
+def capture_lines(records, port):
+    """
+    The lines the gateway will frame out of ``port``'s records, as
+    ``(record index, line)`` with the index of the record that completed
+    the line.
+    """
+    reader = LineReader(None)
+    lines = []
+    for index, (_, record_port, data) in enumerate(records):
+        if record_port == port:
+            lines.extend((index, line) for line in reader.feed(data))
+    return lines
+
+def replay(records, targets, speed=1.0, on_write=None, stop_event=None):
+    """
+    Write each record to ``targets[port]`` (anything with write(), usually a
+    serial_sim.PtySerialPort) at its captured time divided by ``speed``, or
+    back to back when ``speed`` is 0. ``on_write`` is called with the record
+    index and the monotonic time just before each write.
+    """
+    started = time.monotonic()
+    for index, (offset, port, data) in enumerate(records):
+        if stop_event is not None and stop_event.is_set():
+            return
+        if speed:
+            delay = started + offset / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if on_write:
+            on_write(index, time.monotonic())
+        targets[port].write(data)
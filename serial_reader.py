@@ -0,0 +1,102 @@
+import threading
+import time
+from metrics import FAST_BUCKETS, Counter, Histogram
+
+# Largest partial line kept while waiting for a terminator. Anything longer is
+# garbage (baud mismatch, binary noise) and is thrown away.
+MAX_LINE_LENGTH = 4096
+
+SERIAL_LINES = Counter("smartbin_gateway_serial_lines_total", "Lines framed from each serial port", ["port"])
+SERIAL_LINE_SECONDS = Histogram("smartbin_gateway_serial_line_seconds", "Time spent handling one serial line",
+                                ["port"], buckets=FAST_BUCKETS)
+SERIAL_ERRORS = Counter("smartbin_gateway_serial_errors_total",
+                        "Failed serial reads and lines whose handler raised", ["port", "kind"])
+
+class LineReader:
+    """
+    Reassemble newline-terminated frames from a serial port.
+
+    Bytes are appended to one growing buffer and complete lines are sliced out
+    of it as ``bytes`` with the trailing CR/LF already removed, so the parsers
+    never pay for a decode() or strip() on lines they are going to ignore.
+    """
+
+    def __init__(self, ser, max_line=MAX_LINE_LENGTH):
+        self.ser = ser
+        self.max_line = max_line
+        self.buffer = bytearray()
+
+    def read_frames(self):
+        """
+        Block until the port delivers data, then return the complete lines.
+        Returns an empty list when the port read timed out.
+        """
+        # read() blocks in the driver (select on POSIX, overlapped IO on
+        # Windows) until at least one byte arrives or the port timeout expires
+        chunk = self.ser.read(self.ser.in_waiting or 1)
+        if not chunk:
+            return []
+        return self.feed(chunk)
+
+    def feed(self, chunk):
+        """Append raw bytes and return every complete line they finish"""
+        buffer = self.buffer
+        # Only the new bytes can contain a terminator we haven't seen yet
+        search_from = len(buffer)
+        buffer += chunk
+
+        frames = []
+        start = 0
+        end = buffer.find(b"\n", search_from)
+        while end != -1:
+            stop = end
+            if stop > start and buffer[stop - 1] == 0x0D:  # b"\r"
+                stop -= 1
+            if stop > start:
+                frames.append(bytes(buffer[start:stop]))
+            start = end + 1
+            end = buffer.find(b"\n", start)
+
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_line:
+            print(f"Serial: Dropping {len(buffer)} bytes without a line terminator")
+            buffer.clear()
+        return frames
+
+def read_serial_frames(ser, handle_frame, stop_event=None, name=None):
+    """
+    Feed every line read from ``ser`` to ``handle_frame`` until ``stop_event``
+    is set. Exceptions from the handler are reported and the loop carries on.
+    Lines, handling time and errors are counted under the port label ``name``
+    (default: the port's device name).
+    """
+    reader = LineReader(ser)
+    if stop_event is None:
+        stop_event = threading.Event()
+    name = name or getattr(ser, "port", "serial")
+    lines = SERIAL_LINES.labels(name)
+    line_seconds = SERIAL_LINE_SECONDS.labels(name)
+    read_errors = SERIAL_ERRORS.labels(name, "read")
+    handler_errors = SERIAL_ERRORS.labels(name, "handler")
+    clock = time.perf_counter
+
+    while not stop_event.is_set():
+        try:
+            frames = reader.read_frames()
+        except Exception as e:
+            read_errors.inc()
+            print(f"Serial read error on {getattr(ser, 'port', ser)}: {e}")
+            # A yanked USB adapter raises on every read, don't spin on it
+            stop_event.wait(1)
+            continue
+
+        for frame in frames:
+            started = clock()
+            try:
+                handle_frame(frame)
+            except Exception as e:
+                handler_errors.inc()
+                print(f"Serial: Error handling line {frame!r}: {e}")
+            line_seconds.observe(clock() - started)
+        lines.inc(len(frames))
@@ -0,0 +1,87 @@
+"""
+Pseudo-terminal stand-ins for the mesh and beacon receivers.
+
+``PtySerialPort`` opens a pty pair: the gateway opens ``port`` with pyserial
+exactly like a real COM port, and the test or benchmark writes receiver output
+into the other end. POSIX only.
+"""
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+class PtySerialPort:
+    """A pty pair that looks like a serial port to pyserial"""
+
+    def __init__(self):
+        self.master_fd, slave_fd = pty.openpty()
+        # Raw mode before anything is written, otherwise the line discipline
+        # echoes and rewrites bytes that arrive before pyserial opens the port
+        tty.setraw(slave_fd)
+        self.port = os.ttyname(slave_fd)
+        self._slave_fd = slave_fd
+        # Non-blocking so a writer stuck on a full pty can notice close()
+        os.set_blocking(self.master_fd, False)
+        self._closing = threading.Event()
+        self._writers = []
+
+    def write(self, data):
+        """Write raw bytes as if the receiver had printed them"""
+        view = memoryview(data)
+        while view and not self._closing.is_set():
+            try:
+                written = os.write(self.master_fd, view)
+            except BlockingIOError:
+                # The reader is behind and the pty buffer is full
+                select.select([], [self.master_fd], [], 0.1)
+                continue
+            view = view[written:]
+
+    def write_lines(self, lines, rate=None, on_write=None):
+        """
+        Write each line terminated with CRLF like Serial.println(). ``rate``
+        limits output to that many lines per second; ``on_write`` is called
+        with the line index and the monotonic time just before each write.
+        """
+        interval = 1.0 / rate if rate else 0
+        next_time = time.monotonic()
+        for index, line in enumerate(lines):
+            if self._closing.is_set():
+                return
+            if interval:
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_time += interval
+            if isinstance(line, str):
+                line = line.encode()
+            if on_write:
+                on_write(index, time.monotonic())
+            self.write(line + b"\r\n")
+
+    def start_writer(self, lines, rate=None, on_write=None):
+        """Run write_lines() on a daemon thread and return the thread"""
+        thread = threading.Thread(
+            target=self.write_lines, args=(lines, rate, on_write), daemon=True
+        )
+        thread.start()
+        self._writers.append(thread)
+        return thread
+
+    def close(self):
+        self._closing.set()
+        for thread in self._writers:
+            thread.join()
+        for fd in (self.master_fd, self._slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
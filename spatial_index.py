@@ -0,0 +1,158 @@
+import math
+from collections import namedtuple
+
+# Statuses that make a bin unavailable for redirecting rubbish to it
+UNAVAILABLE_STATUSES = ("FULL", "OFFLINE")
+
+# Result of a nearest-bin query
+Neighbour = namedtuple("Neighbour", ["bin_id", "distance", "direction"])
+
+def calculate_distance(coord1, coord2):
+    """Calculate Euclidean distance between two coordinates"""
+    if not coord1 or not coord2:
+        return float('inf')
+    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
+
+def calculate_direction(from_coord, to_coord):
+    """Calculate direction from one coordinate to another"""
+    if not from_coord or not to_coord:
+        return "Unknown"
+
+    dx = to_coord[0] - from_coord[0]
+    dy = to_coord[1] - from_coord[1]
+
+    # Calculate angle in radians
+    angle = math.atan2(dy, dx)
+
+    # Convert to degrees
+    angle_deg = math.degrees(angle)
+
+    # Normalize to 0-360 degrees
+    if angle_deg < 0:
+        angle_deg += 360
+
+    # Convert angle to cardinal direction
+    directions = ["E", "NE", "N", "NW", "W", "SW", "S", "SE"]
+    index = round(angle_deg / 45) % 8
+
+    return directions[index]
+
+def is_available(status):
+    """Whether a bin with this status can take rubbish"""
+    return (status or "").upper() not in UNAVAILABLE_STATUSES
+
+class BinIndex:
+    """
+    Uniform-grid index over the available bins that have a position.
+
+    update() is called whenever a bin's coord or status changes and keeps the
+    grid in step, so a nearest-bin query only looks at the cells around the
+    query point instead of every bin. Not thread safe: central.py only touches
+    it from routing_store updates, which all run on the store's writer thread.
+    """
+
+    def __init__(self, cell_size=10.0):
+        self.cell_size = float(cell_size)
+        self.cells = {}      # (cx, cy) -> {bin_id: (x, y)}
+        self.positions = {}  # bin_id -> ((x, y), cell) for indexed bins
+        # Occupied cell bounds, limits how far an empty neighbourhood is searched
+        self.bounds = None
+
+    def _cell(self, coord):
+        return (math.floor(coord[0] / self.cell_size), math.floor(coord[1] / self.cell_size))
+
+    def update(self, bin_id, coord, status):
+        """Index the bin if it is available and positioned, otherwise drop it"""
+        if not coord or not is_available(status):
+            self.remove(bin_id)
+            return
+
+        coord = (coord[0], coord[1])
+        current = self.positions.get(bin_id)
+        if current is not None:
+            if current[0] == coord:
+                return
+            self.remove(bin_id)
+
+        cell = self._cell(coord)
+        self.cells.setdefault(cell, {})[bin_id] = coord
+        self.positions[bin_id] = (coord, cell)
+        if self.bounds is None:
+            self.bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            bounds = self.bounds
+            bounds[0] = min(bounds[0], cell[0])
+            bounds[1] = min(bounds[1], cell[1])
+            bounds[2] = max(bounds[2], cell[0])
+            bounds[3] = max(bounds[3], cell[1])
+
+    def remove(self, bin_id):
+        current = self.positions.pop(bin_id, None)
+        if current is None:
+            return
+        cell = current[1]
+        members = self.cells[cell]
+        del members[bin_id]
+        if not members:
+            # Bounds are left as they are, they only ever over-estimate
+            del self.cells[cell]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, bin_id):
+        return bin_id in self.positions
+
+    def nearest(self, coord, k=1, exclude=None):
+        """
+        Return up to ``k`` Neighbour tuples for the available bins closest to
+        ``coord``, nearest first, skipping ``exclude``.
+        """
+        if not coord or not self.positions:
+            return []
+
+        qx, qy = coord[0], coord[1]
+        cx, cy = self._cell(coord)
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        # Rings beyond this can't contain any bin
+        max_ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy, 0)
+
+        found = []  # (squared distance, bin_id, coord)
+        cells = self.cells
+        ring = 0
+        while ring <= max_ring:
+            for cell in _ring_cells(cx, cy, ring):
+                members = cells.get(cell)
+                if not members:
+                    continue
+                for bin_id, (x, y) in members.items():
+                    if bin_id == exclude:
+                        continue
+                    found.append(((x - qx) ** 2 + (y - qy) ** 2, bin_id, (x, y)))
+
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                del found[k:]
+                # Every cell outside this ring is at least ring * cell_size away
+                reach = ring * self.cell_size
+                if found[-1][0] <= reach * reach:
+                    break
+            ring += 1
+
+        found.sort(key=lambda item: item[0])
+        return [
+            Neighbour(bin_id, math.sqrt(distance), calculate_direction(coord, bin_coord))
+            for distance, bin_id, bin_coord in found[:k]
+        ]
+
+def _ring_cells(cx, cy, ring):
+    """Cells at Chebyshev distance ``ring`` from (cx, cy)"""
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (cx + dx, cy - ring)
+        yield (cx + dx, cy + ring)
+    for dy in range(-ring + 1, ring):
+        yield (cx - ring, cy + dy)
+        yield (cx + ring, cy + dy)
@@ -1,71 +1,20 @@
 import requests
 import time
 import random
-import math
+from spatial_index import BinIndex
 
 API_URL = "http://127.0.0.1:8000/websocket/dashboard"
 
-def calculate_distance(coord1, coord2):
-    """Calculate Euclidean distance between two coordinates"""
-    if not coord1 or not coord2:
-        return float('inf')
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def calculate_direction(from_coord, to_coord):
-    """Calculate direction from one coordinate to another"""
-    if not from_coord or not to_coord:
-        return "Unknown"
-    
-    dx = to_coord[0] - from_coord[0]
-    dy = to_coord[1] - from_coord[1]
-    
-    # Calculate angle in radians
-    angle = math.atan2(dy, dx)
-    
-    # Convert to degrees
-    angle_deg = math.degrees(angle)
-    
-    # Normalize to 0-360 degrees
-    if angle_deg < 0:
-        angle_deg += 360
-    
-    # Convert angle to cardinal direction
-    directions = ["E", "NE", "N", "NW", "W", "SW", "S", "SE"]
-    index = round(angle_deg / 45) % 8
-    
-    return directions[index]
-
-def find_nearest_available_bin(bins_data, current_bin_id):
+def find_nearest_available_bin(bin_index, bins_data, current_bin_id):
     """Find nearest available bin that isn't FULL"""
-    current_bin = bins_data.get(current_bin_id, {})
-    current_coord = current_bin.get("coord")
+    current_coord = bins_data.get(current_bin_id, {}).get("coord")
     
     if not current_coord:
         return None, None
     
-    nearest_bin_id = None
-    min_distance = float('inf')
-    
-    for bin_id, bin_data in bins_data.items():
-        # Skip the current bin and any FULL or offline bins
-        if (bin_id == current_bin_id or 
-            bin_data.get("status") == "FULL" or 
-            bin_data.get("status") == "offline"):
-            continue
-        
-        bin_coord = bin_data.get("coord")
-        if bin_coord:
-            distance = calculate_distance(current_coord, bin_coord)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_bin_id = bin_id
-    
-    if nearest_bin_id:
-        direction = calculate_direction(
-            current_coord, 
-            bins_data[nearest_bin_id]["coord"]
-        )
-        return nearest_bin_id, direction
+    nearest = bin_index.nearest(current_coord, k=1, exclude=current_bin_id)
+    if nearest:
+        return nearest[0].bin_id, nearest[0].direction
     
     return None, None
 
@@ -99,10 +48,15 @@ while True:
         }
     }
     
+    # Index the available bins, the same way central.py does
+    bin_index = BinIndex()
+    for bin_id, bin_data in payload.items():
+        bin_index.update(bin_id, bin_data["coord"], bin_data["status"])
+    
     # Calculate nearest available bin for FULL bins
     for bin_id, bin_data in payload.items():
         if bin_data["status"] == "FULL":
-            nearest_bin_id, direction = find_nearest_available_bin(payload, bin_id)
+            nearest_bin_id, direction = find_nearest_available_bin(bin_index, payload, bin_id)
             if nearest_bin_id:
                 bin_data["next_nearest"] = nearest_bin_id
                 bin_data["next_nearest_direction"] = direction
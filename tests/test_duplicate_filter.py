@@ -0,0 +1,48 @@
+import unittest
+
+from duplicate_filter import DuplicateFilter, fresher_node, stronger_reading
+
+class DuplicateFilterTests(unittest.TestCase):
+    def test_copies_merge_within_the_window(self):
+        duplicates = DuplicateFilter(2, stronger_reading)
+        self.assertTrue(duplicates.add(("7", "B1"), -80, "beacon:COM5", now=0))
+        self.assertTrue(duplicates.add(("7", "B1"), -70, "beacon:COM6", now=0.5))
+        self.assertFalse(duplicates.add(("7", "B1"), -90, "beacon:COM7", now=1))
+        self.assertEqual(duplicates.pop_ready(now=1.9), [])
+        [(key, report)] = duplicates.pop_ready(now=2)
+        self.assertEqual((key, report.value, report.receiver, report.copies), (("7", "B1"), -70, "beacon:COM6", 3))
+        self.assertEqual(duplicates.duplicates, 2)
+        self.assertEqual(len(duplicates), 0)
+
+    def test_ready_once_every_receiver_reported(self):
+        duplicates = DuplicateFilter(15, fresher_node, receivers=2)
+        duplicates.add(3, (10, "OK"), "mesh:COM4", now=0)
+        duplicates.add(4, (2, "OK"), "mesh:COM4", now=0)
+        self.assertEqual(duplicates.pop_ready(now=0.1), [])
+        duplicates.add(3, (1, "FULL"), "mesh:COM6", now=0.2)
+        [(node, report)] = duplicates.pop_ready(now=0.3)
+        self.assertEqual((node, report.value, report.copies), (3, (1, "FULL"), 2))
+        self.assertEqual(len(duplicates), 1)
+
+    def test_a_receiver_does_not_duplicate_itself(self):
+        duplicates = DuplicateFilter(15, fresher_node, receivers=2)
+        duplicates.add(3, (10, "OK"), "mesh:COM4", now=0)
+        # The same receiver's next dump is a new report, not a copy of its last one
+        duplicates.add(3, (0, "FULL"), "mesh:COM4", now=14)
+        [(_, report)] = duplicates.pop_ready(now=14)
+        self.assertEqual((report.value, report.copies), ((10, "OK"), 1))
+        self.assertEqual(duplicates.duplicates, 0)
+        [(_, report)] = duplicates.pop_ready(now=29)
+        self.assertEqual(report.value, (0, "FULL"))
+
+    def test_fresher_node_counts_from_arrival(self):
+        duplicates = DuplicateFilter(15, fresher_node)
+        duplicates.add(3, (5, "OK"), "mesh:COM4", now=0)
+        # 16 s before a dump arriving 10 s later is older than 5 s before the first
+        self.assertFalse(duplicates.add(3, (16, "OFFLINE"), "mesh:COM6", now=10))
+        self.assertTrue(duplicates.add(3, (12, "FULL"), "mesh:COM7", now=10))
+        [(_, report)] = duplicates.pop_ready(now=15)
+        self.assertEqual((report.receiver, report.copies), ("mesh:COM7", 3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from mesh_parser import RoutingTableParser
+from serial_reader import LineReader
+
+DUMP = (b"Routing Table:\r\n"
+        b"Node 3 - Last Seen 12s ago - Status FULL\r\n"
+        b"Node 7 - Last Seen 0.5s ago - Status: OK\r\n"
+        b"=====\r\n")
+
+def parse(parser, lines):
+    """(lines consumed, snapshots completed) after feeding ``lines``"""
+    results = [parser.feed_line(line) for line in lines]
+    return [consumed for consumed, _ in results], [snapshot for _, snapshot in results if snapshot is not None]
+
+class RoutingTableParserTests(unittest.TestCase):
+    def test_dump_split_across_reads(self):
+        for size in (1, 5, 17, len(DUMP)):
+            parser = RoutingTableParser()
+            reader = LineReader(None)
+            consumed = []
+            for offset in range(0, len(DUMP), size):
+                read_consumed, snapshots = parse(parser, reader.feed(DUMP[offset:offset + size]))
+                consumed += read_consumed
+                if offset + size < len(DUMP):
+                    # Nothing is complete before the footer's terminator arrives
+                    self.assertEqual(snapshots, [])
+            self.assertEqual(consumed, [True] * 4)
+            self.assertEqual(snapshots, [{3: (12, "FULL"), 7: (0, "OK")}], size)
+            self.assertEqual(parser.errors, 0)
+
+    def test_lines_outside_a_dump_are_left_alone(self):
+        parser = RoutingTableParser()
+        consumed, snapshots = parse(parser, [b"Node 3 - Last Seen 1s ago - Status OK", b"BEACON,B1,-70"])
+        self.assertEqual((consumed, snapshots), ([False, False], []))
+
+    def test_cut_short_blocks_keep_their_entries(self):
+        parser = RoutingTableParser()
+        lines = DUMP.split(b"\r\n")
+        # The footer was lost, the next header closes the block
+        consumed, snapshots = parse(parser, lines[:3] + lines[:2] + [b"BEACON,B1,-70"])
+        self.assertEqual(consumed, [True, True, True, True, True, False])
+        self.assertEqual(snapshots, [{3: (12, "FULL"), 7: (0, "OK")}, {3: (12, "FULL")}])
+        self.assertEqual(parser.errors, 2)
+        self.assertFalse(parser.in_block)
+
+if __name__ == "__main__":
+    unittest.main()
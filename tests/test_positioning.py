@@ -0,0 +1,59 @@
+import math
+import random
+import unittest
+
+from positioning import MultilaterationSolver, np
+
+# Far from (0, 0), as site coordinates usually are
+BEACONS = {"B1": (1000.0, 2000.0), "B2": (1030.0, 2000.0), "B3": (1000.0, 2040.0), "B4": (1030.0, 2040.0)}
+
+def ranges(position, beacons=BEACONS, noise=0.0, rng=None):
+    return {beacon_id: math.dist(position, location) + (rng.uniform(-noise, noise) if noise else 0.0)
+            for beacon_id, location in beacons.items()}
+
+class MultilaterationSolverTests(unittest.TestCase):
+    def solvers(self, beacons=BEACONS):
+        solvers = [MultilaterationSolver(beacons, use_numpy=False)]
+        if np is not None:
+            solvers.append(MultilaterationSolver(beacons))
+        return solvers
+
+    def test_exact_ranges_give_the_position(self):
+        for solver in self.solvers():
+            fix = solver.solve({"bin": ranges((1012.0, 2025.0))})["bin"]
+            self.assertAlmostEqual(fix.x, 1012.0, places=6)
+            self.assertAlmostEqual(fix.y, 2025.0, places=6)
+            self.assertAlmostEqual(fix.residual, 0.0, places=6)
+            self.assertEqual(fix.beacons, 4)
+
+    @unittest.skipIf(np is None, "NumPy isn't installed")
+    def test_numpy_and_pure_python_agree(self):
+        rng = random.Random(3)
+        readings = {}
+        for number in range(50):
+            position = (rng.uniform(990, 1040), rng.uniform(1990, 2050))
+            distances = ranges(position, noise=1.0, rng=rng)
+            # Some bins only heard three beacons
+            if number % 3 == 0:
+                del distances[rng.choice(sorted(distances))]
+            readings[str(number)] = distances
+        pure, vectorized = (solver.solve(readings) for solver in self.solvers())
+        self.assertEqual(pure.keys(), vectorized.keys())
+        for bin_id, fix in pure.items():
+            for field, expected, actual in zip(fix._fields, fix, vectorized[bin_id]):
+                self.assertAlmostEqual(expected, actual, places=6, msg=(bin_id, field))
+
+    def test_collinear_or_too_few_beacons_give_none(self):
+        line = {"L1": (1000.0, 2060.0), "L2": (1010.0, 2060.0), "L3": (1020.0, 2060.0), "L4": (1035.0, 2060.0)}
+        for solver in self.solvers(dict(BEACONS, **line)):
+            fixes = solver.solve({
+                "line": ranges((1012.0, 2065.0), line),
+                "two": {"B1": 10.0, "B2": 25.0, "unknown": 3.0},
+                "good": ranges((1012.0, 2025.0)),
+            })
+            self.assertIsNone(fixes["line"])
+            self.assertIsNone(fixes["two"])
+            self.assertIsNotNone(fixes["good"])
+
+if __name__ == "__main__":
+    unittest.main()
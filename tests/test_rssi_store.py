@@ -0,0 +1,45 @@
+import unittest
+
+from rssi_store import RssiStore
+
+def distance(rssi):
+    # 1 m at -40 dBm, ten times as far per 20 dB
+    return 10 ** ((-40 - rssi) / 20)
+
+class RssiStoreTests(unittest.TestCase):
+    def test_samples_expire_after_the_ttl(self):
+        store = RssiStore(distance, ttl=60)
+        store.add("bin-1", "B1", -60, now=0)
+        store.add("bin-1", "B2", -60, now=0)
+        store.add("bin-1", "B1", -60, now=50)
+        store.pop_dirty()
+
+        # B2's only sample is stale: the beacon goes and the bin needs a new position
+        self.assertEqual(store.expire(now=61), [])
+        self.assertEqual(store.pop_dirty(), {"bin-1": {"B1": 10.0}})
+        self.assertEqual(list(store.bins["bin-1"]["B1"].samples), [(50, -60)])
+        # Once its last beacon expires the bin is evicted, and not reported dirty
+        store.add("bin-2", "B1", -60, now=100)
+        self.assertEqual(store.expire(now=111), ["bin-1"])
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.pop_dirty(), {"bin-2": {"B1": 10.0}})
+
+    def test_only_a_moved_distance_makes_the_bin_dirty(self):
+        store = RssiStore(distance, smoothing_seconds=0, resolve_threshold=0.1)
+        self.assertTrue(store.add("bin-1", "B1", -60, now=0))
+        store.pop_dirty()
+        # 10.6 m is within 10 % of the 10 m last solved
+        self.assertFalse(store.add("bin-1", "B1", -60.5, now=1))
+        self.assertEqual(store.pop_dirty(), {})
+        self.assertTrue(store.add("bin-1", "B1", -62, now=2))
+
+    def test_smoothing_follows_the_time_between_samples(self):
+        store = RssiStore(distance, smoothing_seconds=10)
+        store.add("bin-1", "B1", -60, now=0)
+        store.add("bin-1", "B1", -80, now=0)
+        self.assertEqual(store.bins["bin-1"]["B1"].smoothed_rssi, -60)
+        store.add("bin-1", "B1", -80, now=1000)
+        self.assertAlmostEqual(store.bins["bin-1"]["B1"].smoothed_rssi, -80)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import math
+import random
+import unittest
+
+from spatial_index import BinIndex, calculate_distance, is_available
+
+def brute_force(bins, coord, k, exclude=None):
+    """(bin_id, distance) of the ``k`` nearest available bins, checking every one"""
+    distances = sorted((calculate_distance(coord, bin_coord), bin_id) for bin_id, (bin_coord, status) in bins.items()
+                       if bin_coord and is_available(status) and bin_id != exclude)
+    return [(bin_id, distance) for distance, bin_id in distances[:k]]
+
+class BinIndexTests(unittest.TestCase):
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(5)
+        index = BinIndex(cell_size=7.0)
+        bins = {}
+        for step in range(600):
+            bin_id = str(rng.randrange(150))
+            # Clustered bins, some far away, some not located yet, some FULL
+            if rng.random() < 0.1:
+                coord = None
+            elif rng.random() < 0.1:
+                coord = [rng.uniform(-500, 500), rng.uniform(-500, 500)]
+            else:
+                coord = [rng.gauss(20, 15), rng.gauss(-30, 15)]
+            status = rng.choice(["OK", "OK", "OK", "FULL", "OFFLINE", None])
+            bins[bin_id] = (coord, status)
+            index.update(bin_id, coord, status)
+
+            if step % 10 == 0:
+                query = [rng.uniform(-100, 120), rng.uniform(-130, 70)]
+                k = rng.randint(1, 5)
+                exclude = rng.choice([None, bin_id])
+                found = [(n.bin_id, n.distance) for n in index.nearest(query, k=k, exclude=exclude)]
+                expected = brute_force(bins, query, k, exclude)
+                self.assertEqual([bin_id for bin_id, _ in found], [bin_id for bin_id, _ in expected], step)
+                for (_, distance), (_, expected_distance) in zip(found, expected):
+                    self.assertTrue(math.isclose(distance, expected_distance))
+        self.assertEqual(len(index), sum(1 for coord, status in bins.values() if coord and is_available(status)))
+
+    def test_unavailable_and_moved_bins(self):
+        index = BinIndex(cell_size=10.0)
+        index.update("1", [0, 0], "OK")
+        index.update("2", [3, 4], "OK")
+        self.assertEqual(index.nearest([0, 0], k=2)[1].distance, 5.0)
+        index.update("1", [0, 0], "full")
+        self.assertNotIn("1", index)
+        index.update("2", [-30, 0], "OK")
+        [neighbour] = index.nearest([0, 0], k=3)
+        self.assertEqual(neighbour, ("2", 30.0, "W"))
+        self.assertEqual(index.nearest([0, 0], exclude="2"), [])
+        self.assertEqual(index.nearest(None), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import unittest
+
+from uploader import DELTA, FULL, DeltaEncoder, Uploader, UploadQueue
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class DeltaEncoderTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.encoder = DeltaEncoder("gw-1", keyframe_interval=60, clock=self.clock)
+
+    def test_deltas_carry_only_changed_bins(self):
+        first = self.encoder.encode({"1": {"status": "OK"}, "2": {"status": "OK"}})
+        self.assertEqual((first["type"], first["seq"], first["gateway"]), (FULL, 1, "gw-1"))
+        self.assertNotIn("base_seq", first)
+
+        self.clock.now = 5
+        second = self.encoder.encode({"1": {"status": "OK"}, "2": {"status": "FULL"}})
+        self.assertEqual((second["type"], second["seq"], second["base_seq"]), (DELTA, 2, 1))
+        self.assertEqual(second["bins"], {"2": {"status": "FULL"}})
+        self.assertEqual(second["epoch"], first["epoch"])
+        # Nothing changed, nothing to send and no seq used up
+        self.assertIsNone(self.encoder.encode({"1": {"status": "OK"}, "2": {"status": "FULL"}}))
+        self.assertEqual(self.encoder.encode({"1": {"status": "OK"}, "2": {"status": "OK"}})["seq"], 3)
+
+    def test_keyframes_on_interval_and_resync(self):
+        state = {"1": {"status": "OK"}}
+        self.encoder.encode(state)
+        self.clock.now = 60
+        self.assertEqual(self.encoder.encode(state)["type"], FULL)
+        self.encoder.resync()
+        message = self.encoder.encode(state)
+        self.assertEqual((message["type"], message["seq"], message["bins"]), (FULL, 3, state))
+        self.assertIsNone(self.encoder.encode(state))
+
+class UploadQueueTests(unittest.TestCase):
+    def test_oldest_messages_dropped_when_full(self):
+        queue = UploadQueue(":memory:", max_messages=3)
+        self.addCleanup(queue.close)
+        for seq in range(1, 6):
+            queue.put({"seq": seq, "type": FULL if seq == 1 else DELTA})
+        self.assertEqual((queue.depth, queue.dropped), (3, 2))
+        self.assertEqual([json.loads(body)["seq"] for _, body in queue.peek(10)], [3, 4, 5])
+        queue.put({"bins": {}})
+        queue.drop_deltas()
+        # Only the unsequenced snapshot is left
+        self.assertEqual([json.loads(body) for _, body in queue.peek(10)], [{"bins": {}}])
+        self.assertEqual((queue.depth, queue.dropped), (1, 5))
+
+class FakeTransport:
+    """Answers each send with the next (status, reply), or raises it"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.sent = []
+
+    def send(self, body):
+        self.sent.append(json.loads(body))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def close(self):
+        pass
+
+class UploaderTests(unittest.TestCase):
+    def make_uploader(self, replies, **kwargs):
+        self.clock = Clock()
+        uploader = Uploader("http://server.invalid/websocket/dashboard", ":memory:", clock=self.clock, **kwargs)
+        uploader.transport = self.transport = FakeTransport(replies)
+        self.addCleanup(uploader.close)
+        return uploader
+
+    def test_backoff_doubles_until_a_send_succeeds(self):
+        uploader = self.make_uploader([ConnectionError("down")] * 3 + [(201, {"applied": 3})],
+                                      backoff_initial=1, backoff_max=3)
+        uploader.submit({"bins": {"1": {}}})
+        self.assertEqual((uploader.backoff, uploader.next_attempt), (1, 1))
+        # Held back, queued without a send
+        uploader.submit({"bins": {"2": {}}})
+        self.assertEqual(len(self.transport.sent), 1)
+        for now, backoff in ((1, 2), (3, 3)):
+            self.clock.now = now
+            self.assertFalse(uploader.flush())
+            self.assertEqual(uploader.backoff, backoff)
+        self.clock.now = 6
+        uploader.submit({"bins": {"3": {}}})
+        self.assertEqual(self.transport.sent[-1], {"batch": [{"bins": {str(number): {}}} for number in (1, 2, 3)]})
+        self.assertEqual((uploader.backoff, uploader.queue.depth, uploader.failures), (0, 0, 3))
+
+    def test_rejected_batch_is_resent_one_message_at_a_time(self):
+        uploader = self.make_uploader([(400, {"error": "bad"}), (201, {}), (400, {"error": "bad"}), (201, {}),
+                                       (201, {})])
+        for number in range(3):
+            uploader.queue.put({"bins": {str(number): {}}})
+        uploader.queue.put({"bins": {"3": {}}})
+        uploader.batch_size = 3
+        self.assertTrue(uploader.flush())
+        self.assertEqual([len(sent.get("batch", [sent])) for sent in self.transport.sent], [3, 1, 1, 1, 1])
+        # Only the malformed message is dropped, the rest go out in batches again
+        self.assertEqual((uploader.queue.depth, uploader.queue.dropped, uploader.messages_sent), (0, 1, 3))
+
+    def test_resync_keeps_what_was_applied_and_drops_deltas(self):
+        resyncs = []
+        uploader = self.make_uploader([(409, {"applied": 1, "acks": [1], "resync": True, "seq": 1})],
+                                      on_resync=lambda: resyncs.append(True))
+        for seq in (1, 2, 3):
+            uploader.queue.put({"seq": seq, "type": FULL if seq == 1 else DELTA, "bins": {}})
+        uploader.queue.put({"bins": {}})
+        self.assertFalse(uploader.flush())
+        self.assertEqual(resyncs, [True])
+        self.assertEqual([json.loads(body) for _, body in uploader.queue.peek(10)], [{"bins": {}}])
+        self.assertEqual(uploader.messages_sent, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,350 @@
+import gzip
+import json
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Histogram
+
+try:
+    import websocket  # websocket-client, only needed for the WebSocket transport
+except ImportError:
+    websocket = None
+
+# Message types understood by WebSocket.views.receive_data
+FULL = "full"
+DELTA = "delta"
+
+UPLOAD_SECONDS = Histogram("smartbin_gateway_upload_seconds", "Round trip of each upload that got a reply")
+
+class DeltaEncoder:
+    """
+    Turn successive routing-table snapshots into sequenced upload messages.
+
+    Each message carries ``seq`` and the ``epoch`` of this gateway run. A
+    delta lists only the bins that differ from the previous message
+    (``base_seq``); the upload queue delivers messages in order, so the server
+    sees an unbroken chain unless something was lost, in which case it asks
+    for a resync. A full keyframe is sent first, every ``keyframe_interval``
+    seconds and after a resync.
+    """
+
+    def __init__(self, gateway_id, keyframe_interval=60, clock=time.monotonic):
+        self.gateway_id = gateway_id
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        # Sequence numbers restart with the process, the epoch tells the
+        # server that a low seq is a new run and not a replay
+        self.epoch = int(time.time() * 1000)
+        self.seq = 0
+        self.sent_state = {}
+        self.last_keyframe = None
+        self.force_full = True
+
+    def encode(self, state):
+        """
+        Build the next message for ``state`` ({bin_id (str): bin dict}), or
+        return None when nothing changed since the previous message.
+        Bin dicts must not be mutated after they are passed in.
+        """
+        now = self.clock()
+        full = (self.force_full or self.last_keyframe is None or
+                now - self.last_keyframe >= self.keyframe_interval)
+
+        if full:
+            bins = state
+        else:
+            sent_state = self.sent_state
+            bins = {bin_id: data for bin_id, data in state.items() if sent_state.get(bin_id) != data}
+            if not bins:
+                return None
+
+        self.seq += 1
+        message = {
+            "gateway": self.gateway_id,
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "type": FULL if full else DELTA,
+            "bins": bins,
+        }
+        if full:
+            self.last_keyframe = now
+            self.force_full = False
+        else:
+            message["base_seq"] = self.seq - 1
+        self.sent_state = dict(state)
+        return message
+
+    def resync(self):
+        """The server lost track of our state, send a keyframe next"""
+        self.force_full = True
+
+class UploadQueue:
+    """
+    Bounded FIFO of upload messages in a SQLite file, so snapshots taken
+    while the server is unreachable survive until it is back (and across
+    gateway restarts). When full, the oldest messages are dropped.
+    """
+
+    def __init__(self, path, max_messages=10000):
+        self.max_messages = max_messages
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS upload_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, body BLOB NOT NULL)"
+        )
+        self.depth = self.db.execute("SELECT COUNT(*) FROM upload_queue").fetchone()[0]
+        self.dropped = 0
+
+    def put(self, message):
+        body = json.dumps(message, separators=(",", ":")).encode()
+        message_type = message.get("type") if "seq" in message else None
+        with self.lock:
+            self.db.execute("INSERT INTO upload_queue (type, body) VALUES (?, ?)", (message_type, body))
+            self.depth += 1
+            excess = self.depth - self.max_messages
+            if excess > 0:
+                self.db.execute(
+                    "DELETE FROM upload_queue WHERE id IN "
+                    "(SELECT id FROM upload_queue ORDER BY id LIMIT ?)", (excess,)
+                )
+                self.depth -= excess
+                self.dropped += excess
+
+    def peek(self, limit):
+        """Oldest ``limit`` messages as [(id, json bytes)]"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, body FROM upload_queue ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove_through(self, last_id):
+        """Delete every message up to and including ``last_id``"""
+        with self.lock:
+            removed = self.db.execute("DELETE FROM upload_queue WHERE id <= ?", (last_id,)).rowcount
+            self.depth -= removed
+
+    def drop_deltas(self):
+        """Delete queued deltas, they can't apply once the server needs a keyframe"""
+        with self.lock:
+            removed = self.db.execute("DELETE FROM upload_queue WHERE type = ?", (DELTA,)).rowcount
+            self.depth -= removed
+            self.dropped += removed
+
+    def close(self):
+        self.db.close()
+
+class HttpTransport:
+    """POST uploads to receive_data over one keep-alive session"""
+
+    def __init__(self, url, timeout=5, compress=True):
+        self.url = url
+        self.timeout = timeout
+        self.compress = compress
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers["Content-Type"] = "application/json"
+        if compress:
+            self.session.headers["Content-Encoding"] = "gzip"
+
+    def send(self, body):
+        """Send one JSON body, returns (status code, reply dict)"""
+        if self.compress:
+            body = gzip.compress(body, compresslevel=5)
+        response = self.session.post(self.url, data=body, timeout=self.timeout)
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = {"error": response.text}
+        return response.status_code, reply
+
+    def close(self):
+        self.session.close()
+
+class WebSocketTransport:
+    """
+    Stream uploads over a persistent connection to the server's
+    GatewayConsumer (ws/gateway/). Every frame is answered in order with the
+    HTTP-equivalent reply and its status code.
+    """
+
+    def __init__(self, url, timeout=5, compress=True):
+        if websocket is None:
+            raise RuntimeError("The WebSocket upload transport needs the websocket-client package")
+        self.url = url
+        self.timeout = timeout
+        self.compress = compress
+        self.connection = None
+
+    def send(self, body):
+        """Send one JSON body, returns (status code, reply dict)"""
+        if self.connection is None:
+            self.connection = websocket.create_connection(self.url, timeout=self.timeout)
+        try:
+            if self.compress:
+                self.connection.send_binary(gzip.compress(body, compresslevel=5))
+            else:
+                self.connection.send(body.decode())
+            reply = json.loads(self.connection.recv())
+        except Exception:
+            # Reconnect on the next send rather than reading a stale reply
+            self.close()
+            raise
+        return reply.pop("status", 201), reply
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+def make_transport(url, timeout=5, compress=True):
+    """Pick the transport from the URL scheme (http(s):// or ws(s)://)"""
+    if url.startswith(("ws://", "wss://")):
+        return WebSocketTransport(url, timeout, compress)
+    return HttpTransport(url, timeout, compress)
+
+class Uploader:
+    """
+    Store-and-forward uploader for central.py.
+
+    Messages go into the on-disk queue first and are then sent over a
+    persistent transport (keep-alive HTTP session or WebSocket) with gzip
+    bodies. Several queued messages go out as one ``{"batch": [...]}`` upload.
+    After a failure, sends are held back with exponential backoff while new
+    messages keep queueing. A batch the server refuses as malformed (400) is
+    resent one message at a time, and only a single message refused that way
+    is dropped.
+    """
+
+    def __init__(self, url, queue_path, max_queue=10000, batch_size=50, timeout=5,
+                 compress=True, backoff_initial=1, backoff_max=60, on_resync=None,
+                 clock=time.monotonic):
+        self.url = url
+        self.transport = make_transport(url, timeout, compress)
+        self.queue = UploadQueue(queue_path, max_queue)
+        self.batch_size = batch_size
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_resync = on_resync
+        self.clock = clock
+
+        self.backoff = 0
+        self.next_attempt = 0
+        # Messages still to send one at a time after the server refused their batch
+        self.split_remaining = 0
+        self.uploads = 0
+        self.failures = 0
+        self.messages_sent = 0
+        self.last_latency = None
+        self.average_latency = None
+
+    def submit(self, message):
+        """Queue a message and try to send everything that is waiting"""
+        self.queue.put(message)
+        self.flush()
+
+    def flush(self):
+        """Send queued messages until the queue is empty or a send fails"""
+        while self.queue.depth and self.clock() >= self.next_attempt:
+            rows = self.queue.peek(1 if self.split_remaining else self.batch_size)
+            if not rows:
+                break
+            if len(rows) == 1:
+                body = rows[0][1]
+            else:
+                body = b'{"batch":[' + b",".join(row[1] for row in rows) + b"]}"
+
+            reply = self._send(body)
+            if reply is None:
+                self._back_off()
+                return False
+            self.backoff = 0
+            if self.split_remaining:
+                self.split_remaining -= 1
+            if reply.get("rejected"):
+                if len(rows) > 1:
+                    # The server applies nothing from a batch it refuses, send
+                    # these one at a time to find the malformed ones
+                    self.split_remaining = len(rows)
+                    continue
+                # Retrying a malformed message would block the queue forever
+                print(f"Upload: dropping a message the server refused: {rows[0][1][:200]!r}")
+                self.queue.remove_through(rows[0][0])
+                self.queue.dropped += 1
+                continue
+            self.messages_sent += reply.get("applied", 0 if reply.get("resync") else len(rows))
+
+            if reply.get("resync"):
+                # Everything before the rejected message was applied
+                applied = reply.get("applied", 0)
+                if applied:
+                    self.queue.remove_through(rows[applied - 1][0])
+                self.queue.drop_deltas()
+                print(f"Upload: server asked for a resync at seq {reply.get('seq')}, sending a keyframe next")
+                if self.on_resync:
+                    self.on_resync()
+                return False
+            self.queue.remove_through(rows[-1][0])
+        return True
+
+    def _send(self, body):
+        """Upload one body, returns the server's JSON reply or None on failure"""
+        started = time.perf_counter()
+        try:
+            status, reply = self.transport.send(body)
+        except (requests.exceptions.ConnectionError, ConnectionError) as e:
+            print(f"Connection error: {e}")
+            self.failures += 1
+            return None
+        except Exception as e:
+            print(f"Error sending data to server: {e}")
+            self.failures += 1
+            return None
+
+        latency = time.perf_counter() - started
+        UPLOAD_SECONDS.observe(latency)
+        self.last_latency = latency
+        self.average_latency = latency if self.average_latency is None else (
+            0.9 * self.average_latency + 0.1 * latency)
+
+        # 409 is the server asking for a keyframe, its body says so
+        if status not in (200, 201, 409):
+            print(f"Server rejected upload: {status} {reply}")
+            self.failures += 1
+            # Only 400 says the data itself is bad, anything else (auth, size,
+            # a proxy in the way) may pass later and is retried with backoff
+            if status == 400:
+                return {"rejected": True}
+            return None
+        self.uploads += 1
+        return reply
+
+    def _back_off(self):
+        self.backoff = min(self.backoff * 2 or self.backoff_initial, self.backoff_max)
+        self.next_attempt = self.clock() + self.backoff
+        print(f"Upload: send failed, {self.queue.depth} messages queued, retrying in {self.backoff}s")
+
+    def metrics(self):
+        """Queue depth and upload counters for monitoring"""
+        return {
+            "queue_depth": self.queue.depth,
+            "queue_dropped": self.queue.dropped,
+            "uploads": self.uploads,
+            "upload_failures": self.failures,
+            "messages_sent": self.messages_sent,
+            "last_upload_latency": self.last_latency,
+            "average_upload_latency": self.average_latency,
+        }
+
+    def close(self):
+        self.transport.close()
+        self.queue.close()